@@ -1,37 +1,81 @@
+# 加载环境变量（必须在导入读取配置的模块之前，整个进程只加载一次）
+from dotenv import load_dotenv
+load_dotenv()
+
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from supabase_client import supabase
-import os
+from supabase_client import supabase, supabase_config, SUPABASE_BACKEND
 from datetime import datetime
-from dotenv import load_dotenv
 
 # 导入API路由
 from routes import api_bp
-
-# 加载环境变量
-load_dotenv()
+from json_codec import FastJSONProvider
+from compression import compression
+from upload_dedup import HashingRequest, upload_index
+from metrics import metrics, StatsCounter
+from upstream_calls import tracker as upstream_calls
+from profiler import profiler, TOKEN_HEADER, ID_HEADER, ADMIN_PREFIX
 
 app = Flask(__name__)
+# 上传文件在表单解析时边写临时文件边计算 SHA-256，用于按内容去重
+app.request_class = HashingRequest
+# 响应编码使用 json_codec（安装 orjson 时更快，并可直接编码 datetime）
+app.json = FastJSONProvider(app)
+# 按令牌或抽样对单个请求做 cProfile；最先注册，覆盖其余钩子；未配置时不注册
+profiler.init_app(app)
+# 每个路由的请求延迟、状态码和处理中的请求数，见 /metrics；
+# 先于压缩注册，after_request 倒序执行，延迟包含压缩耗时
+metrics.init_app(app)
+# 每个请求的 Supabase/地理编码调用次数和耗时（X-Upstream-Calls、Server-Timing），超出预算时警告
+upstream_calls.init_app(app)
+# 按 Accept-Encoding 压缩 JSON 响应（gzip，安装 brotli 时支持 br）
+compression.init_app(app)
+# 压缩前后和上传去重的累计字节数由各模块自己统计，/metrics 采集时读取
+metrics.register(StatsCounter(
+    'http_compression_input_bytes_total', 'Response bytes before compression, by encoding.', ('encoding',),
+    lambda: {(e,): s['bytes_in'] for e, s in compression.stats()['encodings'].items()}))
+metrics.register(StatsCounter(
+    'http_compression_output_bytes_total', 'Response bytes after compression, by encoding.', ('encoding',),
+    lambda: {(e,): s['bytes_out'] for e, s in compression.stats()['encodings'].items()}))
+metrics.register(StatsCounter(
+    'upload_dedup_bytes_saved_total', 'Upload bytes skipped because the content was already stored.', (),
+    lambda: {(): upload_index.stats()['bytes_saved']}))
+metrics.register(StatsCounter(
+    'upload_dedup_bytes_uploaded_total', 'Original image bytes actually uploaded to storage.', (),
+    lambda: {(): upload_index.stats()['bytes_uploaded']}))
 # 配置CORS以支持所有来源的请求
 CORS(app, origins='*', methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'], 
-     allow_headers=['Content-Type', 'Authorization', 'apikey', 'X-CSRF-Token'])
-
-# 初始化Supabase客户端
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_SERVICE_ROLE") or os.getenv("SUPABASE_KEY") or os.getenv("SUPABASE_ANON_KEY")
+     allow_headers=['Content-Type', 'Authorization', 'apikey', 'X-CSRF-Token', TOKEN_HEADER],
+     expose_headers=['X-Upstream-Calls', 'Server-Timing', ID_HEADER])
 
-if not supabase_url or not supabase_key:
-    print("错误: 缺少Supabase配置信息")
-    print(f"SUPABASE_URL: {supabase_url}")
-    print(f"SUPABASE_KEY: {supabase_key}")
+if SUPABASE_BACKEND == 'memory':
+    # 进程内内存表，不访问网络；数据随进程退出丢失
+    from memory_supabase_client import InMemorySupabaseClient
+    supabase = InMemorySupabaseClient.from_env()
+    print("⚠️ SUPABASE_BACKEND=memory：使用进程内内存表，数据不会持久化")
+elif SUPABASE_BACKEND != 'http':
+    print(f"错误: 不支持的 SUPABASE_BACKEND: {SUPABASE_BACKEND}（可选 http、memory）")
     exit(1)
-
-supabase = supabase
+else:
+    # 只检查配置是否齐全，客户端在第一次访问 Supabase 时才创建
+    try:
+        supabase_config()
+    except ValueError as e:
+        print(f"错误: {e}")
+        exit(1)
 
 # 初始化API蓝图中的Supabase客户端
 from routes import init_supabase
 init_supabase(supabase)
 
+# 请求体上限：上传在读取过程中超限即中止，不会先把整个请求读入
+from routes import MAX_UPLOAD_BYTES
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'error': f'请求体过大，最大 {MAX_UPLOAD_BYTES // (1024 * 1024)} MB'}), 413
+
 # 注册API蓝图
 app.register_blueprint(api_bp, url_prefix='/api')
 
@@ -42,14 +86,73 @@ def hello():
 
 @app.route('/health')
 def health_check():
-    return jsonify({"status": "healthy", "timestamp": datetime.now().isoformat()})
+    return jsonify({"status": "healthy", "timestamp": datetime.now()})
+
+# 运行时统计（连接池命中率等）
+@app.route('/stats')
+def runtime_stats():
+    from geocoding import cache_stats
+    from geocode_worker import backfill
+    from user_cache import known_users
+    from etags import validators
+    from image_variants import pipeline as image_pipeline
+    from resumable_uploads import upload_sessions
+    return jsonify({
+        "http_pool": supabase.pool.stats(),
+        "geocode_cache": cache_stats(),
+        "geocode_backfill": backfill.stats(),
+        "known_users": known_users.stats(),
+        "response_cache": supabase.response_cache.stats(),
+        "etag_validators": validators.stats(),
+        "compression": compression.stats(),
+        "image_variants": image_pipeline.stats(),
+        "upload_dedup": upload_index.stats(),
+        "upload_sessions": upload_sessions.stats(),
+        "upstream_calls": upstream_calls.stats(),
+        "profiler": profiler.stats()
+    })
+
+# Prometheus 指标
+@app.route('/metrics')
+def prometheus_metrics():
+    from metrics import CONTENT_TYPE
+    return metrics.render(), 200, {'Content-Type': CONTENT_TYPE}
+
+# 最近的性能分析结果，需要 X-Profile-Token；未配置 PROFILE_TOKEN 时不可用
+@app.route(ADMIN_PREFIX)
+def list_profiles():
+    if not profiler.authorized(request.headers):
+        return jsonify({'error': 'Not found'}), 404
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify({'profiles': profiler.recent(limit)})
+
+@app.route(f'{ADMIN_PREFIX}/<profile_id>')
+def get_profile(profile_id):
+    """默认返回 pstats 文本报告（?sort=&top=）；?format=raw 下载 .prof 文件，可用 snakeviz 等工具查看"""
+    if not profiler.authorized(request.headers):
+        return jsonify({'error': 'Not found'}), 404
+    try:
+        if request.args.get('format') == 'raw':
+            path = profiler.profile_path(profile_id)
+            if path is None:
+                return jsonify({'error': 'Profile not found'}), 404
+            from flask import send_file
+            return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                             download_name=f'{profile_id}.prof')
+        sort = request.args.get('sort', 'cumulative')
+        if sort not in profiler.SORT_KEYS:
+            return jsonify({'error': f"sort 只能是 {', '.join(profiler.SORT_KEYS)}"}), 400
+        report = profiler.summary(profile_id, sort, request.args.get('top', 40, type=int))
+        if report is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        return report, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 # 基础路由保持不变，其他API路由已通过蓝图导入
 
 if __name__ == '__main__':
     print("正在启动打卡达人API服务器...")
-    print(f"Supabase URL: {supabase_url}")
-    print(f"Supabase Key: {supabase_key[:20]}...")  # 只显示密钥前20位用于调试
     print("服务器将在 http://localhost:5000 运行")
     print("健康检查端点: http://localhost:5000/health")
     print("API端点前缀: /api")
@@ -0,0 +1,427 @@
+"""
+ASGI 入口：热点 /api 路由由异步处理函数直接服务，其余路由交给 Flask 应用在线程池中处理。
+
+启动方式：
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+
+import re
+import sys
+import time
+import asyncio
+import tempfile
+import urllib.parse
+
+# 加载环境变量（必须在导入读取配置的模块之前，整个进程只加载一次）
+from dotenv import load_dotenv
+load_dotenv()
+
+import json_codec
+from async_supabase_client import async_supabase as supabase
+from supabase_client import supabase as sync_supabase, SUPABASE_BACKEND
+from routes import placeholder_user, checkin_row, inserted_row, prepare_location, MAX_UPLOAD_BYTES
+from pagination import (
+    CursorError, page_params, page_offset, apply_keyset, finish_page, wants_stream, stream_cursor,
+    count_mode, cached_total, remember_total
+)
+from projection import FieldsError, KEYSET_COLUMNS, select_columns, raise_for_fields
+from etags import validators, compute_etag, parse_if_none_match
+from geocode_worker import backfill
+from metrics import metrics
+from upstream_calls import tracker as upstream_calls, current as current_calls
+from user_cache import known_users, is_fk_violation, is_unique_violation
+
+if SUPABASE_BACKEND == 'memory':
+    # 异步路由使用 HTTP 客户端，与 Flask 路由的内存表不是同一份数据
+    print("错误: ASGI 入口不支持 SUPABASE_BACKEND=memory，请使用 app.py")
+    sys.exit(1)
+
+# 地址回填在后台线程中运行，使用同步客户端
+backfill.bind(sync_supabase)
+
+_routes = []
+
+def route(path, methods=('GET',), etag_tables=None):
+    """注册异步路由，路径参数写法与 Flask 相同，例如 /users/<user_id>
+
+    etag_tables 不为 None 时按 etags.conditional 的方式处理 ETag / If-None-Match。
+    """
+    pattern = re.compile('^' + re.sub(r'<(\w+)>', r'(?P<\1>[^/]+)', path) + '$')
+    def decorator(fn):
+        _routes.append((path, pattern, tuple(methods), fn, etag_tables))
+        return fn
+    return decorator
+
+class Request:
+    def __init__(self, scope, body):
+        self.scope = scope
+        self.method = scope['method']
+        self.path = scope['path']
+        self.body = body
+        query = urllib.parse.parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        self.args = {k: v[0] for k, v in query.items()}
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])}
+
+    def get_json(self):
+        try:
+            return json_codec.loads(self.body) if self.body else None
+        except Exception:
+            return None
+
+    def arg_int(self, name, default):
+        try:
+            return int(self.args.get(name, default))
+        except (TypeError, ValueError):
+            return default
+
+async def keyset_page(request, query):
+    """与 routes.keyset_page 相同的键集分页"""
+    cursor, size = page_params(request.args)
+    offset = page_offset(request.args, size) if cursor is None else 0
+    response = await apply_keyset(query, cursor, size, offset).execute()
+    if getattr(response, 'error', None):
+        raise_for_fields(response.error)
+        raise RuntimeError(response.error)
+    rows, next_cursor = finish_page(response.data, size)
+    return {'data': rows, 'next_cursor': next_cursor, 'page_size': size}
+
+class StreamingBody:
+    """处理函数返回它时，响应体按块发送（prefix + 上游块 + suffix）"""
+    def __init__(self, body, prefix=b'', suffix=b''):
+        self.body = body
+        self.prefix = prefix
+        self.suffix = suffix
+
+async def stream_rows(request, query):
+    """与 routes.stream_rows 相同：把上游 JSON 数组原样转发，包在 {"data": ...} 中"""
+    status, hdrs, body = await apply_keyset(query, stream_cursor(request.args), None).stream()
+    if not 200 <= status < 300:
+        error = await body.read()
+        raise_for_fields(error.decode('utf-8'))
+        raise RuntimeError(error.decode('utf-8') if error else f'status {status}')
+    return StreamingBody(body, b'{"data":', b'}')
+
+def jsonify(obj):
+    return json_codec.dumps(obj)
+
+# =====================
+# 异步 API 路由
+# =====================
+
+@route('/api/users/<user_id>', etag_tables=('users',))
+async def get_user(request, user_id):
+    columns = select_columns(request.args, 'users')
+    response = await supabase.table('users').select(columns).eq('id', user_id).cache().execute()
+    raise_for_fields(response.error)
+    if not response.data:
+        return {'error': 'User not found'}, 404
+    return {'data': response.data[0]}, 200
+
+@route('/api/users/<user_id>/stats', etag_tables=('user_stats', 'checkins', 'journals', 'tasks'))
+async def get_user_stats(request, user_id):
+    columns = select_columns(request.args, 'user_stats')
+    response = await supabase.table('user_stats').select(columns).eq('user_id', user_id).execute()
+    raise_for_fields(response.error)
+    if not response.data:
+        return {'data': {}}, 200
+    return {'data': response.data[0]}, 200
+
+@route('/api/checkins')
+async def get_checkins(request):
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return {'error': 'user_id is required'}, 400
+    columns = select_columns(request.args, 'checkins', required=KEYSET_COLUMNS)
+    query = supabase.table('checkins').select(columns).eq('user_id', user_id)
+    if wants_stream(request.args):
+        return await stream_rows(request, query), 200
+    return await keyset_page(request, query), 200
+
+@route('/api/checkins', methods=('POST',))
+async def create_checkin(request):
+    data = request.get_json() or {}
+    if not data.get('user_id'):
+        return {'error': 'user_id is required'}, 400
+
+    # 地址补全可能读取本地缓存文件（回填关闭时还会同步请求远程服务），放到线程池中避免阻塞事件循环
+    loop = asyncio.get_running_loop()
+    loc, address_pending = await loop.run_in_executor(None, prepare_location, data.get('location') or {})
+    checkin_data = checkin_row(data, loc)
+    # 乐观插入：外键失败时才创建占位用户并重试（与 routes.insert_checkin 相同）
+    user_id = data['user_id']
+    response = await supabase.table('checkins').insert(checkin_data).execute()
+    if getattr(response, 'error', None) and is_fk_violation(response.error):
+        known_users.record_fk_fallback(user_id)
+        uins = await supabase.table('users').insert(placeholder_user(user_id)).execute()
+        if getattr(uins, 'error', None) and not is_unique_violation(uins.error):
+            return {'error': f"用户不存在且创建失败: {uins.error}"}, 400
+        response = await supabase.table('checkins').insert(checkin_data).execute()
+    elif not getattr(response, 'error', None):
+        known_users.record_saved()
+    if getattr(response, 'error', None):
+        return {'error': response.error}, 500
+    known_users.add(user_id)
+    inserted = inserted_row(response, checkin_data)
+    payload = {'data': inserted}
+    if address_pending:
+        payload['address_pending'] = backfill.submit(inserted.get('id'), loc)
+    return payload, 201
+
+@route('/api/plaza')
+async def get_plaza_feed(request):
+    columns = select_columns(request.args, 'plaza_posts', required=KEYSET_COLUMNS)
+    page = await keyset_page(request, supabase.table('plaza_posts').select(columns))
+    page['limit'] = page['page_size']
+    return page, 200
+
+@route('/api/journals')
+async def get_journals(request):
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return {'error': 'user_id is required'}, 400
+    columns = select_columns(request.args, 'journals', required=KEYSET_COLUMNS)
+    query = supabase.table('journals').select(columns).eq('user_id', user_id)
+    if wants_stream(request.args):
+        return await stream_rows(request, query), 200
+    return await keyset_page(request, query), 200
+
+@route('/api/secrets')
+async def get_secrets(request):
+    user_id = request.args.get('user_id')
+    page = request.arg_int('page', 1)
+    page_size = request.arg_int('page_size', 10)
+    if not user_id:
+        return {'error': 'user_id is required'}, 400
+    try:
+        count = count_mode(request.args)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    offset = (page - 1) * page_size
+    total_key = ('secrets', user_id)
+    total = cached_total(total_key)
+    response = await supabase.table('secrets') \
+        .select(select_columns(request.args, 'secrets'), count=None if total is not None else count) \
+        .eq('user_id', user_id) \
+        .order('created_at', desc=True) \
+        .range(offset, offset + page_size - 1) \
+        .execute()
+    if getattr(response, 'error', None):
+        raise_for_fields(response.error)
+        return {'error': str(response.error)}, 500
+    if total is None:
+        total = response.count
+        remember_total(total_key, total)
+    return {
+        'data': response.data,
+        'total': total,
+        'page': page,
+        'page_size': page_size
+    }, 200
+
+# =====================
+# 未迁移的路由交给 Flask（WSGI）处理
+# =====================
+
+_flask_app = None
+
+def _get_flask_app():
+    global _flask_app
+    if _flask_app is None:
+        from app import app as flask_app
+        _flask_app = flask_app
+    return _flask_app
+
+def _call_wsgi(scope, body, size):
+    """body 为 _read_body 读取的请求体文件，由调用方关闭"""
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': (scope.get('server') or ('localhost', 80))[0],
+        'SERVER_PORT': str((scope.get('server') or ('localhost', 80))[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'CONTENT_LENGTH': str(size),
+    }
+    for k, v in scope.get('headers', []):
+        name = k.decode('latin-1').upper().replace('-', '_')
+        value = v.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+
+    result = {}
+    def start_response(status, headers, exc_info=None):
+        result['status'] = int(status.split(' ', 1)[0])
+        result['headers'] = headers
+    chunks = _get_flask_app()(environ, start_response)
+    try:
+        payload = b''.join(chunks)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    return result['status'], result['headers'], payload
+
+# =====================
+# ASGI 应用
+# =====================
+
+# 请求体超过该大小时写入临时文件，上传占用的内存与文件大小无关
+BODY_SPOOL_BYTES = 1024 * 1024
+
+class BodyTooLarge(Exception):
+    pass
+
+async def _read_body(scope, receive, limit=MAX_UPLOAD_BYTES):
+    """读取请求体，返回 (文件对象, 字节数)；超过 limit 时立即停止读取并抛出 BodyTooLarge"""
+    for k, v in scope.get('headers', []):
+        if k == b'content-length' and v.isdigit() and int(v) > limit:
+            raise BodyTooLarge()
+    body = tempfile.SpooledTemporaryFile(max_size=BODY_SPOOL_BYTES)
+    size = 0
+    try:
+        while True:
+            message = await receive()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > limit:
+                raise BodyTooLarge()
+            if chunk:
+                body.write(chunk)
+            if not message.get('more_body'):
+                break
+    except BaseException:
+        body.close()
+        raise
+    body.seek(0)
+    return body, size
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if supabase.resolved:
+                await supabase.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def _send_stream(send, status, headers, stream):
+    # 不带 content-length，由服务器使用 chunked 编码
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    try:
+        await send({'type': 'http.response.body', 'body': stream.prefix, 'more_body': True})
+        async for chunk in stream.body:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': stream.suffix})
+    finally:
+        await stream.body.aclose()
+
+async def _send_not_modified(send, etag):
+    headers = [(b'etag', f'"{etag}"'.encode('latin-1')), (b'access-control-allow-origin', b'*')]
+    await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b''})
+
+async def _send_content(send, status, headers, content):
+    headers.append((b'content-length', str(len(content)).encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': content})
+
+async def _handle(scope, body, send, handler, params, etag_tables):
+    request = Request(scope, body)
+    if etag_tables is not None:
+        # 与 Flask 的 request.full_path 一致，两种入口共用校验值
+        etag_key = f"{scope['path']}?{scope.get('query_string', b'').decode('latin-1')}"
+        tags = parse_if_none_match(request.headers.get('if-none-match'))
+        cached = validators.lookup(etag_key, etag_tables) if tags else None
+        if cached is not None and (cached in tags or '*' in tags):
+            validators.record('hits')
+            return await _send_not_modified(send, cached)
+        versions = validators.snapshot(etag_tables)
+    try:
+        payload, status = await handler(request, **params)
+    except (CursorError, FieldsError) as e:
+        payload, status = {'error': str(e)}, 400
+    except Exception as e:
+        payload, status = {'error': str(e)}, 500
+    headers = [
+        (b'content-type', b'application/json'),
+        (b'access-control-allow-origin', b'*'),
+    ]
+    if isinstance(payload, StreamingBody):
+        return await _send_stream(send, status, headers, payload)
+    content = jsonify(payload)
+    if etag_tables is not None and status == 200:
+        etag = compute_etag(content)
+        validators.remember(etag_key, etag, versions)
+        if etag in tags or '*' in tags:
+            validators.record('revalidated')
+            return await _send_not_modified(send, etag)
+        validators.record('misses')
+        headers.append((b'etag', f'"{etag}"'.encode('latin-1')))
+    await _send_content(send, status, headers, content)
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    try:
+        body, size = await _read_body(scope, receive)
+    except BodyTooLarge:
+        # 与 Flask 入口的 413 响应相同；不再读取剩余的请求体
+        content = jsonify({'error': f'请求体过大，最大 {MAX_UPLOAD_BYTES // (1024 * 1024)} MB'})
+        return await _send_content(send, 413, [(b'content-type', b'application/json'),
+                                               (b'access-control-allow-origin', b'*'),
+                                               (b'connection', b'close')], content)
+    try:
+        await _dispatch(scope, body, size, send)
+    finally:
+        body.close()
+
+async def _dispatch(scope, body, size, send):
+    path, method = scope['path'], scope['method']
+    for rule, pattern, methods, handler, etag_tables in _routes:
+        match = pattern.match(path)
+        if match and method in methods:
+            # 与 Flask 入口相同：延迟计到开始发送响应头为止
+            start = metrics.begin()
+            # 每个 ASGI 请求在自己的任务中处理，不需要复位；gather 出的子任务复制上下文，共用同一份调用记录
+            upstream_calls.begin()
+            log = current_calls()
+
+            async def timed_send(message):
+                if message['type'] == 'http.response.start':
+                    metrics.observe_request(rule, method, message['status'], time.perf_counter() - start)
+                    upstream_calls.check(method, rule, log)
+                    message['headers'] = message['headers'] + [
+                        (name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in upstream_calls.response_headers(log)
+                    ]
+                await send(message)
+
+            try:
+                # 异步路由只处理 JSON 请求体，直接读入内存
+                return await _handle(scope, body.read(), timed_send, handler, match.groupdict(), etag_tables)
+            finally:
+                metrics.end()
+
+    # 其余路由由 Flask 应用处理，指标由 Flask 钩子记录
+    loop = asyncio.get_running_loop()
+    status, raw_headers, content = await loop.run_in_executor(None, _call_wsgi, scope, body, size)
+    headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in raw_headers
+               if k.lower() != 'content-length']
+    await _send_content(send, status, headers, content)
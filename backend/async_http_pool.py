@@ -0,0 +1,265 @@
+import os
+import ssl
+import time
+import asyncio
+from collections import deque
+
+from http_pool import POOL_IDLE_TIMEOUT, HTTP_TIMEOUT, STREAM_CHUNK_SIZE, _split_url
+
+# 异步连接池（asgi.py 使用），与同步连接池分开，WSGI / FC 入口启动时不需要导入 asyncio
+
+# 单进程内允许的并发上游连接数
+ASYNC_POOL_MAX_PER_HOST = int(os.getenv('SUPABASE_ASYNC_POOL_MAX_PER_HOST', '200'))
+
+# 复用的空闲连接可能已被服务端关闭，这些异常表示请求未被处理，可以换新连接重试一次
+_ASYNC_STALE_ERRORS = (
+    asyncio.IncompleteReadError,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+
+class _AsyncConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncConnectionPool:
+    """基于 asyncio 流的 HTTP/1.1 长连接池，用于异步 Supabase 客户端
+
+    连接和信号量都绑定在创建它们的事件循环上，每个事件循环应使用独立的连接池。
+    """
+
+    def __init__(self, max_per_host=ASYNC_POOL_MAX_PER_HOST, idle_timeout=POOL_IDLE_TIMEOUT,
+                 timeout=HTTP_TIMEOUT):
+        self.max_per_host = max(1, max_per_host)
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = {}     # (scheme, host, port) -> deque[_AsyncConnection]
+        self._limits = {}   # (scheme, host, port) -> asyncio.Semaphore
+        self._ssl = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.discards = 0
+        self.retries = 0
+
+    async def _acquire(self, key):
+        idle = self._idle.get(key)
+        now = time.monotonic()
+        while idle:
+            conn = idle.pop()
+            if now - conn.last_used <= self.idle_timeout and not conn.reader.at_eof():
+                self.hits += 1
+                return conn, True
+            self.evictions += 1
+            conn.close()
+        scheme, host, port = key
+        ssl_ctx = None
+        if scheme == 'https':
+            if self._ssl is None:
+                self._ssl = ssl.create_default_context()
+            ssl_ctx = self._ssl
+        reader, writer = await asyncio.open_connection(host, port, ssl=ssl_ctx)
+        self.misses += 1
+        return _AsyncConnection(reader, writer), False
+
+    def _release(self, key, conn, reusable):
+        if reusable:
+            conn.last_used = time.monotonic()
+            self._idle.setdefault(key, deque()).append(conn)
+        else:
+            self.discards += 1
+            conn.close()
+
+    async def _send_head(self, conn, key, method, path, headers, data):
+        """写出请求并读取响应头，返回 (status, headers, lower_headers)"""
+        scheme, host, port = key
+        default_port = 443 if scheme == 'https' else 80
+        lines = [f'{method} {path} HTTP/1.1',
+                 f'Host: {host}' if port == default_port else f'Host: {host}:{port}']
+        for k, v in (headers or {}).items():
+            lines.append(f'{k}: {v}')
+        if data is not None or method in ('POST', 'PUT', 'PATCH'):
+            lines.append(f'Content-Length: {len(data or b"")}')
+        head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        conn.writer.write(head + (data or b''))
+        await conn.writer.drain()
+
+        reader = conn.reader
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('server closed connection')
+        status = int(status_line.split()[1])
+        hdrs = {}
+        lower = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            k, _, v = line.decode('latin-1').partition(':')
+            hdrs[k.strip()] = v.strip()
+            lower[k.strip().lower()] = v.strip()
+        return status, hdrs, lower
+
+    @staticmethod
+    def _keep_alive(method, status, lower):
+        if lower.get('connection', '').lower() == 'close':
+            return False
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            return True
+        # 没有长度信息的响应以关闭连接表示结束
+        return 'content-length' in lower or lower.get('transfer-encoding', '').lower() == 'chunked'
+
+    @staticmethod
+    async def _iter_body(reader, method, status, lower, chunk_size=STREAM_CHUNK_SIZE):
+        """按块产出响应体（已去掉 chunked 编码）"""
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            return
+        if lower.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';')[0].strip(), 16)
+                if size == 0:
+                    # 跳过 trailer
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    return
+                yield await reader.readexactly(size)
+                await reader.readline()
+        elif 'content-length' in lower:
+            remaining = int(lower['content-length'])
+            while remaining > 0:
+                chunk = await reader.readexactly(min(remaining, chunk_size))
+                remaining -= len(chunk)
+                yield chunk
+        else:
+            while True:
+                chunk = await reader.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    async def _roundtrip(self, conn, key, method, path, headers, data):
+        status, hdrs, lower = await self._send_head(conn, key, method, path, headers, data)
+        chunks = [c async for c in self._iter_body(conn.reader, method, status, lower)]
+        return status, hdrs, b''.join(chunks), self._keep_alive(method, status, lower)
+
+    def _limit(self, key):
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = self._limits[key] = asyncio.Semaphore(self.max_per_host)
+        return limit
+
+    async def _exchange(self, key, send):
+        """取连接并执行 send(conn)；复用的连接已失效时换新连接重试一次，返回 (conn, result)"""
+        attempt = 0
+        while True:
+            try:
+                conn, reused = await asyncio.wait_for(self._acquire(key), self.timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                raise RuntimeError(str(e) or 'connect timeout')
+            try:
+                return conn, await asyncio.wait_for(send(conn), self.timeout)
+            except _ASYNC_STALE_ERRORS as e:
+                self._release(key, conn, reusable=False)
+                if reused and attempt == 0:
+                    attempt += 1
+                    self.retries += 1
+                    continue
+                raise RuntimeError(str(e))
+            except (OSError, ValueError, asyncio.TimeoutError) as e:
+                self._release(key, conn, reusable=False)
+                raise RuntimeError(str(e) or 'upstream timeout')
+            except BaseException:
+                # 请求被取消时连接状态未知，不能放回连接池
+                self._release(key, conn, reusable=False)
+                raise
+
+    async def request(self, method, url, headers=None, data=None):
+        """发送请求并读取完整响应，返回 (status, headers, body)"""
+        key, path = _split_url(url)
+        async with self._limit(key):
+            conn, (status, hdrs, body, keep_alive) = await self._exchange(
+                key, lambda c: self._roundtrip(c, key, method, path, headers, data))
+            self._release(key, conn, reusable=keep_alive)
+            return status, hdrs, body
+
+    async def stream(self, method, url, headers=None, data=None, chunk_size=STREAM_CHUNK_SIZE):
+        """发送请求但不读取响应体，返回 (status, headers, AsyncStreamedBody)
+
+        连接和并发名额在响应体读完或调用 aclose() 时才释放，调用方必须保证二者之一发生。
+        """
+        key, path = _split_url(url)
+        limit = self._limit(key)
+        await limit.acquire()
+        try:
+            conn, (status, hdrs, lower) = await self._exchange(
+                key, lambda c: self._send_head(c, key, method, path, headers, data))
+        except BaseException:
+            limit.release()
+            raise
+        chunks = self._iter_body(conn.reader, method, status, lower, chunk_size)
+        body = AsyncStreamedBody(self, key, conn, limit, chunks, self._keep_alive(method, status, lower))
+        return status, hdrs, body
+
+    async def close(self):
+        for idle in self._idle.values():
+            while idle:
+                conn = idle.pop()
+                conn.close()
+        self._idle.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            'evictions': self.evictions,
+            'discards': self.discards,
+            'retries': self.retries,
+            'idle': sum(len(v) for v in self._idle.values()),
+            'max_per_host': self.max_per_host,
+        }
+
+
+class AsyncStreamedBody:
+    """按块读取的异步上游响应体，读完或关闭时归还连接和并发名额"""
+
+    def __init__(self, pool, key, conn, limit, chunks, keep_alive):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._limit = limit
+        self._chunks = chunks
+        self._keep_alive = keep_alive
+
+    async def __aiter__(self):
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(self._chunks.__anext__(), self._pool.timeout)
+                except StopAsyncIteration:
+                    break
+                yield chunk
+            self._finish(reusable=self._keep_alive)
+        finally:
+            self._finish(reusable=False)
+
+    async def read(self):
+        return b''.join([c async for c in self])
+
+    async def aclose(self):
+        self._finish(reusable=False)
+
+    def _finish(self, reusable):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._pool._release(self._key, conn, reusable=reusable)
+        self._limit.release()
@@ -0,0 +1,125 @@
+import time
+import json_codec
+from metrics import metrics
+import upstream_calls
+from supabase_client import (
+    LazyClient, supabase_config, SupabaseClient, Table, Query, InsertQuery,
+    UpdateQuery, DeleteQuery, StorageBucket, StorageClient
+)
+from async_http_pool import AsyncConnectionPool
+
+# 基于 asyncio 的 Supabase 客户端：与同步客户端共用请求构造和响应解析，
+# 只把网络往返换成协程，单进程即可同时挂起数百个上游请求。
+
+class _AsyncExecute:
+    async def execute(self):
+        request = self.build_request()
+        cached = self.cached_result(request)
+        if cached is not None:
+            return cached
+        method, url, headers, data = request
+        status, hdrs, body = await self.table.client._http(method, url, headers=headers, data=data)
+        return self.finish(self.parse_response(status, hdrs, body))
+
+class AsyncQuery(_AsyncExecute, Query):
+    async def stream(self):
+        """不解析响应体，返回 (status, headers, body)；body 异步按块迭代，用完或放弃时需 aclose()"""
+        method, url, headers, data = self.build_request()
+        return await self.table.client._stream(method, url, headers=headers, data=data)
+
+class AsyncInsertQuery(_AsyncExecute, InsertQuery):
+    pass
+
+class AsyncUpdateQuery(_AsyncExecute, UpdateQuery):
+    pass
+
+class AsyncDeleteQuery(_AsyncExecute, DeleteQuery):
+    pass
+
+class AsyncTable(Table):
+    query_class = AsyncQuery
+    insert_class = AsyncInsertQuery
+    update_class = AsyncUpdateQuery
+    delete_class = AsyncDeleteQuery
+
+class AsyncStorageBucket(StorageBucket):
+    async def upload(self, file_path, file_content, content_type='application/octet-stream', upsert=True):
+        """上传文件到存储桶"""
+        method, url, headers, data = self.build_upload(file_path, file_content, content_type, upsert)
+        status, hdrs, body = await self.client._http(method, url, headers=headers, data=data)
+        return self.parse_upload(file_path, status, body)
+
+class AsyncStorageClient(StorageClient):
+    def bucket(self, bucket_name):
+        """获取存储桶实例"""
+        return AsyncStorageBucket(self.client, bucket_name)
+
+    def from_(self, bucket_name):
+        bucket = AsyncStorageBucket(self.client, bucket_name)
+        class BucketCompat:
+            async def upload(self_inner, path, file, file_options=None):
+                ct = None
+                upsert = True
+                if file_options and isinstance(file_options, dict):
+                    ct = file_options.get('content-type') or file_options.get('Content-Type')
+                    upsert = str(file_options.get('upsert', 'true')).lower() != 'false'
+                return await bucket.upload(path, file, ct or 'application/octet-stream', upsert)
+            def get_public_url(self_inner, path):
+                return {'data': {'publicUrl': bucket.get_public_url(path)}}
+        return BucketCompat()
+
+    async def list_buckets(self):
+        """列出所有存储桶"""
+        base_url = f'{self.client.url}/storage/v1/buckets'
+        headers = {
+            'apikey': self.client.key,
+            'Authorization': f'Bearer {self.client.key}'
+        }
+        status, hdrs, body = await self.client._http('GET', base_url, headers=headers)
+        if 200 <= status < 300:
+            try:
+                return json_codec.loads(body)
+            except Exception:
+                return []
+        else:
+            return {'error': body.decode('utf-8') if body else f'status {status}'}
+
+class AsyncSupabaseClient(SupabaseClient):
+    table_class = AsyncTable
+
+    def __init__(self, url, key, pool=None):
+        super().__init__(url, key, pool=pool or AsyncConnectionPool())
+        self.storage = AsyncStorageClient(self)
+
+    def table(self, table_name):
+        return self.from_(table_name)
+
+    async def _http(self, method, url, headers=None, data=None):
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            result = await self.pool.request(method, url, headers=headers, data=data)
+            status = result[0]
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe_upstream(url, method, status, elapsed)
+            upstream_calls.record('supabase', elapsed)
+
+    async def _stream(self, method, url, headers=None, data=None):
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            result = await self.pool.stream(method, url, headers=headers, data=data)
+            status = result[0]
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe_upstream(url, method, status, elapsed)
+            upstream_calls.record('supabase', elapsed)
+
+    async def aclose(self):
+        await self.pool.close()
+
+# 异步客户端（由 asgi.py 使用）
+async_supabase = LazyClient(lambda: AsyncSupabaseClient(*supabase_config()))
@@ -0,0 +1,554 @@
+"""
+API 基准：启动本地 Supabase 替身（fake_supabase.py）和后端服务，逐个路由施加并发负载，
+报告吞吐和 p50/p95/p99 延迟，并与保存的基线比较。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_api.py [--server flask|gunicorn|uvicorn] [--concurrency 8] [--seconds 3]
+                                   [--latency-ms 5] [--jitter-ms 0] [--only checkins]
+                                   [--baseline benchmarks/baseline_api.json] [--save-baseline] [--tolerance 0.25]
+
+- 全部在本机离线运行：Supabase 为本地替身，地理编码设为 none
+- 任一路由出现非预期状态码，或 p95 / 吞吐相对基线变差超过 tolerance，以非零状态退出
+- 基线与机器有关，在同一台机器上用 --save-baseline 生成后再比较；仓库不附带基线，
+  没有基线文件时只检查状态码，不比较性能
+"""
+
+import io
+import os
+import sys
+import json
+import math
+import time
+import zlib
+import socket
+import struct
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline_api.json')
+
+sys.path.insert(0, BENCH_DIR)
+
+from fake_supabase import fixed_id, user_id, ID_KINDS  # noqa: E402
+
+# 与基线比较前必须一致的配置
+COMPARABLE = ('server', 'workers', 'concurrency', 'latency_ms', 'jitter_ms', 'users', 'rows')
+
+
+# =====================
+# 测试数据
+# =====================
+
+def tiny_png(seed):
+    """不依赖 Pillow 生成 16x16 的纯色 PNG，颜色由 seed 决定，保证每次内容不同"""
+    r, g, b = seed & 0xFF, (seed >> 8) & 0xFF, (seed >> 16) & 0xFF
+    raw = b''.join(b'\x00' + bytes((r, g, b)) * 16 for _ in range(16))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 16, 16, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+
+
+def multipart(fields, file_field, filename, content, content_type):
+    boundary = f'bench{random.getrandbits(64):016x}'
+    out = io.BytesIO()
+    for name, value in fields.items():
+        out.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    out.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+              f'Content-Type: {content_type}\r\n\r\n'.encode())
+    out.write(content)
+    out.write(f'\r\n--{boundary}--\r\n'.encode())
+    return out.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+
+class UnexpectedStatus(Exception):
+    pass
+
+
+class Client:
+    """一个负载线程的 keep-alive 连接；record 为 None 时请求不计入结果（用于准备数据）"""
+
+    def __init__(self, port, record):
+        self.port = port
+        self.record = record
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+
+    def call(self, name, method, path, body=None, headers=None, expect=(200,)):
+        headers = dict(headers or {})
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        start = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            if name:
+                self.record(name, time.perf_counter() - start)
+            raise UnexpectedStatus(f'{method} {path}: connection error')
+        elapsed = time.perf_counter() - start
+        if name:
+            self.record(name, elapsed)
+        if response.status not in expect:
+            raise UnexpectedStatus(f'{method} {path}: {response.status} {data[:200]!r}')
+        return json.loads(data) if data and response.getheader('Content-Type', '').startswith('application/json') else None
+
+
+# =====================
+# 场景：每个函数执行一次迭代，覆盖 routes.py 中的全部 /api 路由
+# =====================
+
+class Context:
+    def __init__(self, users, rows):
+        self.users = users
+        self.rows = rows
+        self._lock = threading.Lock()
+        self._counter = 0
+
+    def user(self):
+        return user_id(random.randrange(self.users))
+
+    def next(self):
+        with self._lock:
+            self._counter += 1
+            return self._counter
+
+
+def get_user(c, ctx):
+    c.call('GET /api/users/<id>', 'GET', f'/api/users/{ctx.user()}')
+
+
+def update_user(c, ctx):
+    c.call('PUT /api/users/<id>', 'PUT', f'/api/users/{ctx.user()}', {'bio': f'bench {ctx.next()}'})
+
+
+def user_stats(c, ctx):
+    c.call('GET /api/users/<id>/stats', 'GET', f'/api/users/{ctx.user()}/stats')
+
+
+def list_checkins(c, ctx):
+    page = c.call('GET /api/checkins', 'GET', f'/api/checkins?user_id={ctx.user()}')
+    if page and page.get('next_cursor'):
+        c.call('GET /api/checkins (cursor)', 'GET',
+               f"/api/checkins?user_id={ctx.user()}&cursor={page['next_cursor']}")
+
+
+def stream_checkins(c, ctx):
+    c.call('GET /api/checkins?stream=1', 'GET', f'/api/checkins?user_id={ctx.user()}&stream=1')
+
+
+def checkin_body(ctx, user=None):
+    return {'user_id': user or ctx.user(), 'content': '基准测试打卡',
+            'location': {'latitude': 31.2, 'longitude': 121.4, 'address': '上海市'}}
+
+
+def create_checkin(c, ctx):
+    c.call('POST /api/checkins', 'POST', '/api/checkins', checkin_body(ctx), expect=(201,))
+
+
+def create_checkin_new_user(c, ctx):
+    # 用户不存在：外键失败后创建占位用户再重试
+    c.call('POST /api/checkins (new user)', 'POST', '/api/checkins',
+           checkin_body(ctx, f'bench-new-{ctx.next()}-{random.getrandbits(32):08x}'), expect=(201,))
+
+
+def batch_checkins(c, ctx):
+    items = [checkin_body(ctx) for _ in range(20)]
+    c.call('POST /api/checkins/batch', 'POST', '/api/checkins/batch', {'checkins': items}, expect=(201,))
+
+
+def update_checkin(c, ctx):
+    created = c.call(None, 'POST', '/api/checkins', checkin_body(ctx), expect=(201,))
+    c.call('PUT /api/checkins/<id>', 'PUT', f"/api/checkins/{created['data']['id']}", {'description': '已修改'})
+
+
+def delete_checkin(c, ctx):
+    created = c.call(None, 'POST', '/api/checkins', checkin_body(ctx), expect=(201,))
+    c.call('DELETE /api/checkins/<id>', 'DELETE', f"/api/checkins/{created['data']['id']}")
+
+
+def list_badges(c, ctx):
+    c.call('GET /api/badges', 'GET', f'/api/badges?user_id={ctx.user()}')
+
+
+def get_badge(c, ctx):
+    c.call('GET /api/badges/<id>', 'GET', f"/api/badges/{fixed_id(ID_KINDS['badges'], random.randrange(20))}")
+
+
+def unlock_badge(c, ctx):
+    # 种子数据中每个用户已解锁前一半徽章：已解锁时返回 400，两种路径都在统计内
+    body = {'user_id': ctx.user(), 'badge_id': fixed_id(ID_KINDS['badges'], random.randrange(20))}
+    c.call('POST /api/badges/unlock', 'POST', '/api/badges/unlock', body, expect=(201, 400))
+
+
+def list_friends(c, ctx):
+    c.call('GET /api/friends', 'GET', f'/api/friends?user_id={ctx.user()}')
+
+
+def list_groups(c, ctx):
+    c.call('GET /api/groups', 'GET', '/api/groups')
+
+
+def get_group(c, ctx):
+    c.call('GET /api/groups/<id>', 'GET', f"/api/groups/{fixed_id(ID_KINDS['groups'], random.randrange(20))}")
+
+
+def plaza(c, ctx):
+    c.call('GET /api/plaza', 'GET', '/api/plaza')
+
+
+def list_tasks(c, ctx):
+    c.call('GET /api/tasks', 'GET', f'/api/tasks?user_id={ctx.user()}&status=pending')
+
+
+def task_body(ctx):
+    return {'user_id': ctx.user(), 'title': '基准任务', 'due_date': '2025-12-31'}
+
+
+def create_task(c, ctx):
+    c.call('POST /api/tasks', 'POST', '/api/tasks', task_body(ctx), expect=(201,))
+
+
+def update_task(c, ctx):
+    created = c.call(None, 'POST', '/api/tasks', task_body(ctx), expect=(201,))
+    c.call('PUT /api/tasks/<id>', 'PUT', f"/api/tasks/{created['data']['id']}", {'status': 'completed'})
+
+
+def delete_task(c, ctx):
+    created = c.call(None, 'POST', '/api/tasks', task_body(ctx), expect=(201,))
+    c.call('DELETE /api/tasks/<id>', 'DELETE', f"/api/tasks/{created['data']['id']}")
+
+
+def task_stats(c, ctx):
+    c.call('GET /api/tasks/stats', 'GET', f'/api/tasks/stats?user_id={ctx.user()}')
+
+
+def list_journals(c, ctx):
+    c.call('GET /api/journals', 'GET', f'/api/journals?user_id={ctx.user()}')
+
+
+def journal_body(ctx):
+    return {'user_id': ctx.user(), 'title': '基准手账', 'content': '今天天气很好。' * 20, 'tags': ['bench']}
+
+
+def create_journal(c, ctx):
+    c.call('POST /api/journals', 'POST', '/api/journals', journal_body(ctx), expect=(201,))
+
+
+def update_journal(c, ctx):
+    created = c.call(None, 'POST', '/api/journals', journal_body(ctx), expect=(201,))
+    c.call('PUT /api/journals/<id>', 'PUT', f"/api/journals/{created['data']['id']}", {'mood': 'calm'})
+
+
+def delete_journal(c, ctx):
+    created = c.call(None, 'POST', '/api/journals', journal_body(ctx), expect=(201,))
+    c.call('DELETE /api/journals/<id>', 'DELETE', f"/api/journals/{created['data']['id']}")
+
+
+def list_secrets(c, ctx):
+    c.call('GET /api/secrets', 'GET', f'/api/secrets?user_id={ctx.user()}&page={random.randint(1, 5)}')
+
+
+def secret_body(ctx):
+    return {'user_id': ctx.user(), 'content': '悄悄话'}
+
+
+def create_secret(c, ctx):
+    c.call('POST /api/secrets', 'POST', '/api/secrets', secret_body(ctx), expect=(201,))
+
+
+def update_secret(c, ctx):
+    created = c.call(None, 'POST', '/api/secrets', secret_body(ctx), expect=(201,))
+    c.call('PUT /api/secrets/<id>', 'PUT', f"/api/secrets/{created['data']['id']}", {'content': '改过的悄悄话'})
+
+
+def delete_secret(c, ctx):
+    created = c.call(None, 'POST', '/api/secrets', secret_body(ctx), expect=(201,))
+    c.call('DELETE /api/secrets/<id>', 'DELETE', f"/api/secrets/{created['data']['id']}")
+
+
+def upload_image(c, ctx):
+    body, content_type = multipart({'user_id': ctx.user()}, 'file', 'bench.png', tiny_png(ctx.next()), 'image/png')
+    c.call('POST /api/upload/image', 'POST', '/api/upload/image', body, {'Content-Type': content_type})
+
+
+def upload_image_duplicate(c, ctx):
+    # 内容相同：命中去重索引，不再上传
+    body, content_type = multipart({'user_id': ctx.user()}, 'file', 'bench.png', tiny_png(0), 'image/png')
+    c.call('POST /api/upload/image (dedup)', 'POST', '/api/upload/image', body, {'Content-Type': content_type})
+
+
+def upload_session(c, ctx):
+    content = tiny_png(ctx.next())
+    session = c.call('POST /api/upload/sessions', 'POST', '/api/upload/sessions',
+                     {'user_id': ctx.user(), 'filename': 'bench.png', 'content_type': 'image/png',
+                      'size': len(content)}, expect=(201,))
+    upload_id = session['upload_id']
+    c.call('PUT /api/upload/sessions/<id>/chunks/<n>', 'PUT', f'/api/upload/sessions/{upload_id}/chunks/0',
+           content, {'Content-Type': 'application/octet-stream', 'Upload-Offset': '0'})
+    c.call('GET /api/upload/sessions/<id>', 'GET', f'/api/upload/sessions/{upload_id}')
+    c.call('POST /api/upload/sessions/<id>/complete', 'POST', f'/api/upload/sessions/{upload_id}/complete')
+
+
+def abort_upload_session(c, ctx):
+    session = c.call(None, 'POST', '/api/upload/sessions',
+                     {'user_id': ctx.user(), 'filename': 'bench.png', 'size': 1024}, expect=(201,))
+    c.call('DELETE /api/upload/sessions/<id>', 'DELETE', f"/api/upload/sessions/{session['upload_id']}")
+
+
+SCENARIOS = [
+    get_user, update_user, user_stats,
+    list_checkins, stream_checkins, create_checkin, create_checkin_new_user, batch_checkins,
+    update_checkin, delete_checkin,
+    list_badges, get_badge, unlock_badge,
+    list_friends, list_groups, get_group, plaza,
+    list_tasks, create_task, update_task, delete_task, task_stats,
+    list_journals, create_journal, update_journal, delete_journal,
+    list_secrets, create_secret, update_secret, delete_secret,
+    upload_image, upload_image_duplicate, upload_session, abort_upload_session,
+]
+
+
+# =====================
+# 进程管理
+# =====================
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_fake(args):
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, 'fake_supabase.py'), '--latency-ms', str(args.latency_ms),
+         '--jitter-ms', str(args.jitter_ms), '--users', str(args.users), '--rows', str(args.rows)],
+        stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    if not line.startswith('listening on '):
+        proc.kill()
+        raise SystemExit('Supabase 替身启动失败')
+    return proc, line.split()[-1]
+
+
+def server_command(args, port):
+    if args.server == 'gunicorn':
+        return ['gunicorn', '-w', str(args.workers), '-k', 'gthread', '--threads', str(max(args.concurrency, 4)),
+                '-b', f'127.0.0.1:{port}', 'app:app']
+    if args.server == 'uvicorn':
+        return ['uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port), '--workers', str(args.workers),
+                '--log-level', 'warning']
+    return [sys.executable, '-c',
+            'import sys; from werkzeug.serving import run_simple; from app import app; '
+            'run_simple("127.0.0.1", int(sys.argv[1]), app, threaded=True)', str(port)]
+
+
+def start_server(args, supabase_url, workdir):
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        'SUPABASE_URL': supabase_url,
+        'SUPABASE_KEY': 'bench',
+        'GEOCODING_PROVIDER': 'none',
+        'GEOCODING_FALLBACK': 'none',
+        'UPLOAD_SESSION_DIR': os.path.join(workdir, 'sessions'),
+        'UPSTREAM_CALL_BUDGET': '0',
+    })
+    for name in ('PROFILE_TOKEN', 'PROFILE_SAMPLE_RATE', 'UPLOAD_DEDUP_INDEX_PATH'):
+        env.pop(name, None)
+    log_path = os.path.join(workdir, 'server.log')
+    log = open(log_path, 'wb')
+    proc = subprocess.Popen(server_command(args, port), cwd=BACKEND_DIR, env=env, stdout=log, stderr=log)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            break
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return proc, port, log_path
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    with open(log_path, 'rb') as f:
+        raise SystemExit(f'后端启动失败：\n{f.read().decode("utf-8", "replace")[-2000:]}')
+
+
+# =====================
+# 负载与统计
+# =====================
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    # 最近秩法
+    rank = math.ceil(p / 100 * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def run_scenario(scenario, port, ctx, concurrency, seconds, warmup):
+    samples = {}    # 名称 -> [秒]
+    errors = {}     # 名称 -> 次数
+    messages = []
+    lock = threading.Lock()
+    recording = threading.Event()
+
+    def record(name, elapsed):
+        if not recording.is_set():
+            return
+        with lock:
+            samples.setdefault(name, []).append(elapsed)
+
+    def worker(stop_at):
+        client = Client(port, record)
+        while time.perf_counter() < stop_at:
+            try:
+                scenario(client, ctx)
+            except UnexpectedStatus as e:
+                if recording.is_set():
+                    with lock:
+                        errors[scenario.__name__] = errors.get(scenario.__name__, 0) + 1
+                        if len(messages) < 3:
+                            messages.append(str(e))
+        client.conn.close()
+
+    start = time.perf_counter()
+    timer = threading.Timer(warmup, recording.set)
+    timer.start()
+    threads = [threading.Thread(target=worker, args=(start + warmup + seconds,)) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    timer.cancel()
+    results = {}
+    for name, values in samples.items():
+        values.sort()
+        results[name] = {
+            'requests': len(values),
+            'rps': len(values) / seconds,
+            'p50_ms': percentile(values, 50) * 1000,
+            'p95_ms': percentile(values, 95) * 1000,
+            'p99_ms': percentile(values, 99) * 1000,
+        }
+    return results, sum(errors.values()), messages
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """返回回退描述列表"""
+    regressions = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None:
+            continue
+        if current['p95_ms'] > base['p95_ms'] * (1 + tolerance) and current['p95_ms'] - base['p95_ms'] > min_delta_ms:
+            regressions.append(f"{name}: p95 {base['p95_ms']:.1f} -> {current['p95_ms']:.1f} ms")
+        if current['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append(f"{name}: 吞吐 {base['rps']:.0f} -> {current['rps']:.0f} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--server', choices=('flask', 'gunicorn', 'uvicorn'), default='flask',
+                        help='flask 为 werkzeug 多线程开发服务器，另两种需要安装对应的包')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn / uvicorn 的 worker 进程数')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发连接数')
+    parser.add_argument('--seconds', type=float, default=3, help='每个场景计入统计的时长')
+    parser.add_argument('--warmup', type=float, default=0.5, help='每个场景开始统计前的预热时长')
+    parser.add_argument('--latency-ms', type=float, default=5, help='Supabase 替身每个请求的固定延迟')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Supabase 替身的随机附加延迟上限')
+    parser.add_argument('--users', type=int, default=50, help='种子用户数')
+    parser.add_argument('--rows', type=int, default=200, help='每个用户的种子行数')
+    parser.add_argument('--only', action='append', help='只运行名称包含该子串的场景，可重复')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基线文件')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果写入基线文件')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='允许相对基线变差的比例')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0, help='p95 变差小于该值时不算回退（过滤噪声）')
+    parser.add_argument('--json', help='把结果另存为 JSON')
+    args = parser.parse_args()
+
+    scenarios = [s for s in SCENARIOS if not args.only or any(o in s.__name__ for o in args.only)]
+    if not scenarios:
+        raise SystemExit('没有匹配的场景')
+    config = {name: getattr(args, name) for name in COMPARABLE}
+
+    workdir = tempfile.mkdtemp(prefix='aikada_bench_')
+    fake, supabase_url = start_fake(args)
+    server = None
+    try:
+        server, port, log_path = start_server(args, supabase_url, workdir)
+        ctx = Context(args.users, args.rows)
+        results, failures = {}, []
+        print(f"{args.server}, concurrency {args.concurrency}, upstream latency {args.latency_ms} ms"
+              f"{f' + 0~{args.jitter_ms} ms' if args.jitter_ms else ''}, {args.seconds}s per scenario")
+        print(f"{'route':<44} {'reqs':>7} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for scenario in scenarios:
+            scenario_results, error_count, messages = run_scenario(
+                scenario, port, ctx, args.concurrency, args.seconds, args.warmup)
+            for name, r in scenario_results.items():
+                results[name] = r
+                print(f"{name:<44} {r['requests']:>7} {r['rps']:>8.1f} {r['p50_ms']:>8.2f} "
+                      f"{r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+            if error_count:
+                failures.append(f'{scenario.__name__}: {error_count} 次非预期响应，例如 {messages[0]}')
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        fake.terminate()
+        fake.wait()
+
+    report = {'config': config, 'python': sys.version.split()[0], 'created_at': time.time(), 'results': results}
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if failures:
+        print('\n请求失败（服务日志：' + log_path + '）:\n  ' + '\n  '.join(failures))
+        sys.exit(1)
+
+    if args.save_baseline:
+        previous = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as f:
+                previous = json.load(f)
+            if previous.get('config') != config:
+                previous = {}
+        # 只运行部分场景时保留其余场景的基线
+        report['results'] = dict(previous.get('results', {}), **results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'\n基线已写入 {args.baseline}')
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f'\n没有基线文件 {args.baseline}，未比较性能；用 --save-baseline 生成')
+        return
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('config') != config:
+        differs = ', '.join(f"{k}={baseline.get('config', {}).get(k)}" for k in COMPARABLE
+                            if baseline.get('config', {}).get(k) != config[k])
+        raise SystemExit(f'\n基线的运行配置不同（{differs}），无法比较；用相同参数运行或重新 --save-baseline')
+    regressions = compare(results, baseline['results'], args.tolerance, args.min_delta_ms)
+    if regressions:
+        print('\n性能回退（超过基线 {:.0%}）:\n  '.format(args.tolerance) + '\n  '.join(regressions))
+        sys.exit(1)
+    print(f'\n与基线相比没有超过 {args.tolerance:.0%} 的回退')
+
+
+if __name__ == '__main__':
+    main()
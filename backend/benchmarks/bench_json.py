@@ -0,0 +1,104 @@
+"""
+JSON 编解码微基准：比较标准库 json、orjson（如已安装）和当前 json_codec
+在典型打卡列表、手账列表上的编码 / 解码吞吐。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_json.py [--rows 100] [--seconds 1]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json_codec  # noqa: E402
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def checkin_rows(n):
+    base = datetime.datetime(2024, 5, 1, 8, 30)
+    return [{
+        'id': f'7f0c1a4e-0000-4000-8000-{i:012d}',
+        'user_id': 'user123',
+        'description': '今天完成了晨跑打卡，5 公里，配速 5:30',
+        'photos': [f'https://example.supabase.co/storage/v1/object/public/image/{i}.jpg'],
+        'location': '上海市徐汇区滨江大道',
+        'geolocation': {
+            'latitude': 31.1863 + i * 1e-5,
+            'longitude': 121.4603 - i * 1e-5,
+            'accuracy': 12.5,
+            'address': '上海市徐汇区滨江大道',
+        },
+        'created_at': (base - datetime.timedelta(minutes=i)).isoformat(),
+    } for i in range(n)]
+
+
+def journal_rows(n):
+    base = datetime.datetime(2024, 5, 1, 21, 0)
+    content = '今天去了美丽的海滩，度过了愉快的一天。' * 20
+    return [{
+        'id': f'3b9d2c6f-0000-4000-8000-{i:012d}',
+        'user_id': 'user123',
+        'title': f'旅行日记 第 {i} 天',
+        'content': content,
+        'mood': 'happy',
+        'weather': 'sunny',
+        'tags': ['旅行', '海滩', '生活'],
+        'images': [],
+        'is_public': i % 2 == 0,
+        'created_at': (base - datetime.timedelta(days=i)).isoformat(),
+        'updated_at': (base - datetime.timedelta(days=i)).isoformat(),
+    } for i in range(n)]
+
+
+def measure(fn, arg, seconds):
+    """在给定时间内反复调用，返回每秒调用次数"""
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        fn(arg)
+        count += 1
+        if time.perf_counter() >= deadline:
+            break
+    return count / (time.perf_counter() - start)
+
+
+def codecs():
+    items = [('stdlib json', lambda o: json.dumps(o).encode('utf-8'), json.loads)]
+    if orjson is not None:
+        items.append(('orjson', orjson.dumps, orjson.loads))
+    items.append((f'json_codec ({json_codec.BACKEND})', json_codec.dumps, json_codec.loads))
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100, help='每个负载的行数')
+    parser.add_argument('--seconds', type=float, default=1.0, help='每项测量的时长')
+    args = parser.parse_args()
+
+    payloads = [('checkins', {'data': checkin_rows(args.rows)}),
+                ('journals', {'data': journal_rows(args.rows)})]
+
+    print(f"{'payload':<10} {'codec':<22} {'encode/s':>10} {'decode/s':>10} {'enc MB/s':>9} {'dec MB/s':>9}")
+    for name, payload in payloads:
+        raw = json.dumps(payload).encode('utf-8')
+        for label, encode, decode in codecs():
+            size = len(encode(payload))
+            enc = measure(encode, payload, args.seconds)
+            dec = measure(decode, raw, args.seconds)
+            print(f'{name:<10} {label:<22} {enc:>10.0f} {dec:>10.0f} '
+                  f'{enc * size / 1e6:>9.1f} {dec * len(raw) / 1e6:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
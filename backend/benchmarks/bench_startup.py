@@ -0,0 +1,110 @@
+"""
+冷启动基准：在全新的子进程中测量导入 FC 入口（index.py）的耗时和第一个请求的响应时间。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_startup.py [--runs 10] [--path /health] [--top 15]
+                                       [--max-import-ms 400] [--max-first-response-ms 50]
+
+给出阈值时按中位数比较，超过即以非零状态退出，可在 CI 中发现冷启动回退。
+未设置 SUPABASE_URL / SUPABASE_KEY 时使用占位值（/health 不访问上游）。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 子进程：导入入口后立即用最小的 WSGI environ 调用一次 handler
+CHILD = r'''
+import io, sys, json, time
+t0 = time.perf_counter()
+import index
+t1 = time.perf_counter()
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': sys.argv[1], 'QUERY_STRING': '', 'SERVER_NAME': 'bench',
+    'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http',
+    'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.multithread': False,
+    'wsgi.multiprocess': False, 'wsgi.run_once': False,
+}
+status = []
+body = b''.join(index.handler(environ, lambda s, h, exc_info=None: status.append(s)))
+t2 = time.perf_counter()
+print(json.dumps({'import_ms': (t1 - t0) * 1000, 'first_response_ms': (t2 - t1) * 1000,
+                  'status': status[0], 'bytes': len(body)}))
+'''
+
+
+def child_env():
+    env = dict(os.environ)
+    env.setdefault('SUPABASE_URL', 'http://127.0.0.1:9')
+    env.setdefault('SUPABASE_KEY', 'bench')
+    return env
+
+
+def run_once(path):
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', CHILD, path], cwd=BACKEND_DIR, env=child_env(),
+                         capture_output=True, text=True)
+    process_ms = (time.perf_counter() - start) * 1000
+    if out.returncode != 0:
+        raise SystemExit(f'子进程失败：\n{out.stderr}')
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result['process_ms'] = process_ms
+    return result
+
+
+def slowest_imports(top):
+    """用 -X importtime 找出自身耗时最多的模块"""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import index'], cwd=BACKEND_DIR,
+                         env=child_env(), capture_output=True, text=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='子进程次数')
+    parser.add_argument('--path', default='/health', help='第一个请求的路径')
+    parser.add_argument('--top', type=int, default=15, help='列出自身导入耗时最多的模块数，0 表示不列出')
+    parser.add_argument('--max-import-ms', type=float, help='导入耗时中位数上限')
+    parser.add_argument('--max-first-response-ms', type=float, help='首个响应耗时中位数上限')
+    args = parser.parse_args()
+
+    results = [run_once(args.path) for _ in range(args.runs)]
+    statuses = {r['status'] for r in results}
+    print(f"{args.runs} runs, {args.path} -> {', '.join(sorted(statuses))}")
+    print(f"{'metric':<20} {'median':>9} {'min':>9} {'max':>9}")
+    medians = {}
+    for metric in ('import_ms', 'first_response_ms', 'process_ms'):
+        values = [r[metric] for r in results]
+        medians[metric] = statistics.median(values)
+        print(f'{metric:<20} {medians[metric]:>9.1f} {min(values):>9.1f} {max(values):>9.1f}')
+
+    if args.top:
+        print(f"\n{'self ms':>8} {'cum ms':>8}  module")
+        for self_us, cumulative_us, name in slowest_imports(args.top):
+            print(f'{self_us / 1000:>8.1f} {cumulative_us / 1000:>8.1f}  {name}')
+
+    failed = []
+    if args.max_import_ms is not None and medians['import_ms'] > args.max_import_ms:
+        failed.append(f"import_ms {medians['import_ms']:.1f} > {args.max_import_ms}")
+    if args.max_first_response_ms is not None and medians['first_response_ms'] > args.max_first_response_ms:
+        failed.append(f"first_response_ms {medians['first_response_ms']:.1f} > {args.max_first_response_ms}")
+    if failed:
+        print('\n冷启动回退: ' + '; '.join(failed))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
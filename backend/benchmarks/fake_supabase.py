@@ -0,0 +1,186 @@
+"""
+本地 Supabase 替身：把 memory_supabase_client.MemoryBackend（内存中的 PostgREST 和 Storage）包装成 HTTP 服务，
+供基准测试离线使用，后端照常通过连接池访问它。支持的查询和写入见 memory_supabase_client。
+
+用法（在 backend 目录下）：
+    python benchmarks/fake_supabase.py [--port 54321] [--latency-ms 5] [--jitter-ms 2] [--users 50] [--rows 200]
+
+启动后第一行输出 "listening on http://127.0.0.1:<端口>"。
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_supabase_client import MemoryBackend
+
+
+def fixed_id(kind, n):
+    """可复现的 UUID 形式 ID，基准脚本用同样的规则构造请求路径"""
+    return f'{kind:08x}-0000-4000-8000-{n:012d}'
+
+
+# fixed_id 的 kind：不同表使用不同前缀，避免 ID 冲突
+ID_KINDS = {'checkins': 1, 'journals': 2, 'tasks': 3, 'secrets': 4, 'friends': 5,
+            'groups': 6, 'plaza_posts': 7, 'badges': 8, 'user_badges': 9}
+
+
+def user_id(n):
+    return f'bench-user-{n:04d}'
+
+
+def seed(users=50, rows=200, badges=20, groups=20, seed_value=42):
+    """生成可复现的初始数据：每个用户 rows 条打卡 / 手账 / 任务 / 密室消息"""
+    rng = random.Random(seed_value)
+    base = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+    def stamp(minutes):
+        return (base + datetime.timedelta(minutes=minutes)).isoformat()
+
+    tables = {name: [] for name in ('users', 'user_stats', 'user_task_stats', 'checkins', 'journals', 'tasks',
+                                    'secrets', 'friends', 'groups', 'plaza_posts', 'badges', 'user_badges')}
+    for b in range(badges):
+        tables['badges'].append({'id': fixed_id(ID_KINDS['badges'], b), 'name': f'徽章 {b}',
+                                 'description': '连续打卡 7 天', 'icon_url': f'badge-{b}.png', 'earned_at': stamp(b)})
+    for g in range(groups):
+        tables['groups'].append({'id': fixed_id(ID_KINDS['groups'], g), 'name': f'团体 {g}',
+                                 'description': '周末徒步小组', 'leader_id': None, 'created_at': stamp(g)})
+    n = 0
+    for u in range(users):
+        uid = user_id(u)
+        tables['users'].append({'id': uid, 'name': f'用户 {u}', 'avatar_url': f'avatar-{u}.png', 'interests': ['跑步'],
+                                'created_at': stamp(u), 'updated_at': stamp(u)})
+        tables['user_stats'].append({'user_id': uid, 'total_checkins': rows, 'checkin_streak': rng.randint(0, 30),
+                                     'total_journals': rows, 'total_tasks_completed': rows // 2})
+        tables['user_task_stats'].append({'user_id': uid, 'total_tasks': rows, 'completed_tasks': rows // 2,
+                                          'pending_tasks': rows - rows // 2})
+        for i in range(rows):
+            n += 1
+            created = stamp(n)
+            lat, lng = 31.2 + rng.random() / 10, 121.4 + rng.random() / 10
+            tables['checkins'].append({
+                'id': fixed_id(ID_KINDS['checkins'], n), 'user_id': uid, 'description': '今天完成了晨跑打卡，5 公里',
+                'photos': [f'https://example.supabase.co/storage/v1/object/public/image/{n}.jpg'],
+                'location': '上海市徐汇区滨江大道',
+                'geolocation': {'latitude': lat, 'longitude': lng, 'accuracy': 12.5, 'address': '上海市徐汇区滨江大道'},
+                'created_at': created,
+            })
+            tables['journals'].append({
+                'id': fixed_id(ID_KINDS['journals'], n), 'user_id': uid, 'title': f'手账 {i}',
+                'content': '今天天气很好，和朋友去公园散步。' * 4, 'mood': 'happy', 'weather': 'sunny',
+                'tags': ['生活', '运动'], 'images': [], 'is_public': i % 3 == 0,
+                'created_at': created, 'updated_at': created,
+            })
+            tables['tasks'].append({
+                'id': fixed_id(ID_KINDS['tasks'], n), 'user_id': uid, 'title': f'任务 {i}', 'description': '背 20 个单词',
+                'due_date': stamp(n + 1440), 'status': 'completed' if i % 2 else 'pending', 'priority': 'medium',
+                'category': 'study', 'reminder': None, 'created_at': created, 'updated_at': created,
+            })
+            tables['secrets'].append({
+                'id': fixed_id(ID_KINDS['secrets'], n), 'user_id': uid, 'content': '悄悄话', 'image_url': None,
+                'created_at': created, 'updated_at': created,
+            })
+            tables['plaza_posts'].append({
+                'id': fixed_id(ID_KINDS['plaza_posts'], n), 'user_id': uid, 'content': '分享今天的打卡',
+                'photos': [], 'created_at': created,
+            })
+        for f in range(min(users - 1, 20)):
+            n += 1
+            tables['friends'].append({'id': fixed_id(ID_KINDS['friends'], n), 'user_id': uid,
+                                      'friend_id': user_id((u + f + 1) % users), 'status': 'accepted',
+                                      'created_at': stamp(n)})
+        for b in range(badges // 2):
+            n += 1
+            tables['user_badges'].append({'id': fixed_id(ID_KINDS['user_badges'], n), 'user_id': uid,
+                                          'badge_id': fixed_id(ID_KINDS['badges'], b), 'unlocked_at': stamp(n)})
+    return tables
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 响应头和响应体分两次写出；不关闭 Nagle 时长连接上的每个请求都会等客户端的延迟 ACK（约 40 ms）
+    disable_nagle_algorithm = True
+    backend = None
+    latency = 0.0
+    jitter = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            parts = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b''.join(parts)
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _handle(self):
+        body = self._body()
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.random() * self.jitter)
+        status, headers, payload = self.backend.request(self.command, self.path, dict(self.headers.items()), body)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        # 客户端（后端连接池）丢弃连接属于正常情况，不打印
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def serve(port=0, latency_ms=0.0, jitter_ms=0.0, tables=None):
+    """在当前线程外启动服务，返回 server（server.server_address[1] 为端口）"""
+    handler = type('BoundHandler', (Handler,), {
+        'backend': MemoryBackend(tables if tables is not None else seed()),
+        'latency': latency_ms / 1000,
+        'jitter': jitter_ms / 1000,
+    })
+    server = Server(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=0, help='监听端口，0 表示随机')
+    parser.add_argument('--latency-ms', type=float, default=0, help='每个请求固定增加的延迟')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='在固定延迟上随机增加 0~jitter 毫秒')
+    parser.add_argument('--users', type=int, default=50, help='初始用户数')
+    parser.add_argument('--rows', type=int, default=200, help='每个用户的初始打卡 / 手账 / 任务 / 密室消息数')
+    args = parser.parse_args()
+    server = serve(args.port, args.latency_ms, args.jitter_ms, seed(args.users, args.rows))
+    print(f'listening on http://127.0.0.1:{server.server_address[1]}', flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
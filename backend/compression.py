@@ -0,0 +1,193 @@
+import os
+import zlib
+import threading
+
+try:
+    import brotli
+except ImportError:  # 可选依赖，未安装时只提供 gzip
+    brotli = None
+
+# 响应压缩配置
+COMPRESS_ENABLED = os.getenv('COMPRESS', '1') != '0'
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', '6'))
+COMPRESS_BR_QUALITY = int(os.getenv('COMPRESS_BR_QUALITY', '4'))
+COMPRESS_MIMETYPES = os.getenv(
+    'COMPRESS_MIMETYPES',
+    'application/json,text/plain,text/html,text/css,application/javascript'
+)
+
+# 压缩后的表示与原表示不同，强 ETag 需要区分；etags.parse_if_none_match 比较时会去掉后缀
+ETAG_SUFFIXES = {'gzip': '-gzip', 'br': '-br'}
+
+
+def parse_accept_encoding(header):
+    """返回 {编码: q 值}"""
+    accepted = {}
+    for item in (header or '').split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+class _Compressor:
+    def __init__(self, encoding, level, quality):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._obj = brotli.Compressor(quality=quality)
+        else:
+            self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = gzip 头
+
+    def compress(self, data):
+        """压缩一块并立即刷出，流式响应的每块都能尽快到达客户端"""
+        if self.encoding == 'br':
+            return self._obj.process(data) + self._obj.flush()
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._obj.finish()
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+class Compression:
+    """按 Accept-Encoding 协商 gzip / br 的 Flask 响应压缩
+
+    - 普通响应：小于 min_size 或压缩后不变小时不压缩
+    - 流式响应：无法预知大小，内容类型在白名单内就逐块压缩
+    - bytes_in / bytes_out 为压缩前后的字节数
+    """
+
+    def __init__(self, app=None, min_size=COMPRESS_MIN_SIZE, level=COMPRESS_LEVEL,
+                 br_quality=COMPRESS_BR_QUALITY, mimetypes=COMPRESS_MIMETYPES,
+                 enabled=COMPRESS_ENABLED):
+        self.min_size = min_size
+        self.level = level
+        self.br_quality = br_quality
+        self.mimetypes = {m.strip() for m in mimetypes.split(',') if m.strip()}
+        self.enabled = enabled
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+        self._lock = threading.Lock()
+        self._stats = {e: {'responses': 0, 'bytes_in': 0, 'bytes_out': 0} for e in self.encodings}
+        self.skipped = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.after_request(self.after_request)
+
+    def choose_encoding(self, accept_encoding):
+        accepted = parse_accept_encoding(accept_encoding)
+        best, best_q = None, 0.0
+        for encoding in self.encodings:
+            q = accepted.get(encoding, accepted.get('*', 0.0))
+            if q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    def _record(self, encoding, bytes_in, bytes_out, responses=0):
+        with self._lock:
+            stats = self._stats[encoding]
+            stats['responses'] += responses
+            stats['bytes_in'] += bytes_in
+            stats['bytes_out'] += bytes_out
+
+    def _skip(self):
+        with self._lock:
+            self.skipped += 1
+
+    def after_request(self, response):
+        from flask import request
+        if not self.enabled or request.method == 'HEAD':
+            return response
+        if response.status_code == 304:
+            self._echo_etag_suffix(request, response)
+            return response
+        if response.status_code < 200 or response.status_code == 204 \
+                or 'Content-Encoding' in response.headers \
+                or response.mimetype not in self.mimetypes:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.choose_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self._stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                self._skip()
+                return response
+            compressor = _Compressor(encoding, self.level, self.br_quality)
+            compressed = compressor.compress(data) + compressor.finish()
+            if len(compressed) >= len(data):
+                self._skip()
+                return response
+            response.set_data(compressed)
+            self._record(encoding, len(data), len(compressed), responses=1)
+
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(etag + ETAG_SUFFIXES[encoding], weak=weak)
+        return response
+
+    def _stream(self, chunks, encoding):
+        compressor = _Compressor(encoding, self.level, self.br_quality)
+        self._record(encoding, 0, 0, responses=1)
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                out = compressor.compress(chunk)
+                self._record(encoding, len(chunk), len(out))
+                if out:
+                    yield out
+            out = compressor.finish()
+            self._record(encoding, 0, len(out))
+            yield out
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    @staticmethod
+    def _echo_etag_suffix(request, response):
+        """304 的 ETag 与客户端缓存的表示保持一致（带上它持有的编码后缀）"""
+        etag, weak = response.get_etag()
+        if not etag:
+            return
+        for tag in (request.headers.get('If-None-Match') or '').split(','):
+            tag = tag.strip()
+            tag = tag[2:] if tag.startswith('W/') else tag
+            tag = tag.strip('"')
+            for suffix in ETAG_SUFFIXES.values():
+                if tag == etag + suffix:
+                    response.set_etag(tag, weak=weak)
+                    return
+
+    def stats(self):
+        with self._lock:
+            encodings = {}
+            for encoding, s in self._stats.items():
+                encodings[encoding] = dict(s, ratio=round(s['bytes_out'] / s['bytes_in'], 4) if s['bytes_in'] else 0.0)
+            return {
+                'enabled': self.enabled,
+                'min_size': self.min_size,
+                'encodings': encodings,
+                'skipped': self.skipped,
+            }
+
+
+compression = Compression()
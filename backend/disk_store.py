@@ -0,0 +1,57 @@
+import os
+import time
+import threading
+
+
+class DiskStore:
+    """带过期时间的 SQLite 键值表，让进程内缓存在 worker 重启和 FC 冷启动后仍然可用
+
+    每个使用方一张表（key, value, expires_at），列名可指定以沿用已有的库文件；
+    dumps / loads 负责值与 TEXT 之间的转换，默认原样存取字符串。
+    出错时抛出 sqlite3.Error，由调用方计入 disk_errors。
+    """
+
+    def __init__(self, path, table, key_column='key', value_column='value', dumps=None, loads=None):
+        self.path = path
+        self.table = table
+        self.key_column = key_column
+        self.value_column = value_column
+        self.dumps = dumps or (lambda value: value)
+        self.loads = loads or (lambda text: text)
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            # 冷启动时不导入 sqlite3，只有配置了路径并第一次读写时才需要
+            import sqlite3
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=1)
+            self._conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} '
+                f'({self.key_column} TEXT PRIMARY KEY, {self.value_column} TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+        return self._conn
+
+    def get(self, key):
+        """返回 (值, 剩余秒数)，不存在或已过期时返回 None"""
+        with self._lock:
+            row = self._connect().execute(
+                f'SELECT {self.value_column}, expires_at FROM {self.table} WHERE {self.key_column} = ?', (key,)
+            ).fetchone()
+        if not row:
+            return None
+        remaining = row[1] - time.time()
+        return (self.loads(row[0]), remaining) if remaining > 0 else None
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                f'INSERT OR REPLACE INTO {self.table} ({self.key_column}, {self.value_column}, expires_at) '
+                'VALUES (?, ?, ?)',
+                (key, self.dumps(value), time.time() + ttl)
+            )
+            conn.commit()
@@ -0,0 +1,126 @@
+import os
+import hashlib
+import functools
+import threading
+
+from ttl_cache import TTLCache
+
+# 条件请求校验值缓存：在有效期内且相关表没有经本进程写入时，直接回 304 不访问上游
+ETAG_VALIDATOR_TTL = float(os.getenv('ETAG_VALIDATOR_TTL', '30'))
+ETAG_VALIDATOR_CACHE_SIZE = int(os.getenv('ETAG_VALIDATOR_CACHE_SIZE', '10000'))
+# 压缩后的响应 ETag 带编码后缀（见 compression.py），比较时按原始表示处理
+_ENCODING_SUFFIXES = ('-gzip', '-br')
+
+
+def compute_etag(body):
+    """由响应体计算强 ETag（不含引号）"""
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def parse_if_none_match(header):
+    """返回 If-None-Match 中的 ETag 集合（去掉引号、W/ 前缀和编码后缀），'*' 原样保留"""
+    tags = set()
+    for item in (header or '').split(','):
+        item = item.strip()
+        if item.startswith('W/'):
+            item = item[2:]
+        item = item.strip('"')
+        for suffix in _ENCODING_SUFFIXES:
+            if item.endswith(suffix):
+                item = item[:-len(suffix)]
+                break
+        if item:
+            tags.add(item)
+    return tags
+
+
+class ValidatorCache:
+    """按请求路径缓存最近一次响应的 ETag，以及生成它时所依赖各表的版本号
+
+    insert/update/delete 成功后表版本加一，依赖该表的校验值随即失效。
+    其他实例或绕过本服务的写入无法感知，因此校验值只保留 ETAG_VALIDATOR_TTL 秒。
+    """
+
+    def __init__(self, ttl=ETAG_VALIDATOR_TTL, maxsize=ETAG_VALIDATOR_CACHE_SIZE):
+        self.enabled = ttl > 0
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl) if self.enabled else None
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0           # 未访问上游直接返回 304
+        self.revalidated = 0    # 访问上游后 ETag 未变，返回 304
+        self.misses = 0
+
+    def invalidate(self, table_name):
+        with self._lock:
+            self._versions[table_name] = self._versions.get(table_name, 0) + 1
+
+    def snapshot(self, tables):
+        return tuple(self._versions.get(t, 0) for t in tables)
+
+    def lookup(self, key, tables):
+        """返回仍然有效的 ETag，否则返回 None"""
+        if not self.enabled:
+            return None
+        entry = self._cache.get(key)
+        if entry is None or entry[1] != self.snapshot(tables):
+            return None
+        return entry[0]
+
+    def remember(self, key, etag, versions):
+        # versions 需在访问上游之前取得，期间发生的写入会让这条记录直接失效
+        if self.enabled:
+            self._cache.set(key, (etag, versions))
+
+    def record(self, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def stats(self):
+        stats = {
+            'enabled': self.enabled,
+            'hits': self.hits,
+            'revalidated': self.revalidated,
+            'misses': self.misses,
+        }
+        if self.enabled:
+            stats['size'] = len(self._cache)
+        return stats
+
+
+validators = ValidatorCache()
+
+
+def conditional(*tables):
+    """Flask 路由装饰器：为 200 响应加 ETag，处理 If-None-Match
+
+    tables 是响应依赖的表（视图要列出其底层表），用于服务端校验值失效。
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            from flask import request, make_response
+            key = request.full_path
+            tags = parse_if_none_match(request.headers.get('If-None-Match'))
+            if tags:
+                etag = validators.lookup(key, tables)
+                if etag is not None and (etag in tags or '*' in tags):
+                    validators.record('hits')
+                    response = make_response('', 304)
+                    response.set_etag(etag)
+                    return response
+
+            versions = validators.snapshot(tables)
+            response = make_response(fn(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            etag = compute_etag(response.get_data())
+            validators.remember(key, etag, versions)
+            if etag in tags or '*' in tags:
+                validators.record('revalidated')
+                response = make_response('', 304)
+            else:
+                validators.record('misses')
+            response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,229 @@
+import os
+import json
+import math
+import threading
+
+# 本地地名库（离线反向地理编码）配置
+GAZETTEER_PATH = os.getenv('GEOCODING_GAZETTEER_PATH', '')
+GAZETTEER_CELL_DEG = float(os.getenv('GAZETTEER_CELL_DEG', '0.01'))          # 网格边长（度），约 1.1km
+# 点位默认匹配半径；点位可用 radius 单独指定，超过一个格子边长的半径不放入网格，改为逐个按距离检查
+GAZETTEER_MAX_DISTANCE_M = float(os.getenv('GAZETTEER_MAX_DISTANCE_M', '150'))
+# 覆盖格子数超过该值的大面（行政区等）不放入网格，改为按外包框逐个检查
+GAZETTEER_MAX_POLYGON_CELLS = int(os.getenv('GAZETTEER_MAX_POLYGON_CELLS', '400'))
+
+_EARTH_RADIUS_M = 6371000.0
+_METERS_PER_DEG = math.radians(1) * _EARTH_RADIUS_M
+
+
+def _distance_m(lat1, lng1, lat2, lng2):
+    """小范围内的等距圆柱近似距离（米）"""
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * _EARTH_RADIUS_M
+
+
+def _point_in_ring(lat, lng, ring):
+    """射线法判断点是否在环内，ring 为 GeoJSON 顺序的 [lng, lat] 列表"""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i][0], ring[i][1]
+        xj, yj = ring[j][0], ring[j][1]
+        if (yi > lat) != (yj > lat) and lng < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class _Place:
+    __slots__ = ('name', 'lat', 'lng', 'radius', 'polygons', 'bbox', 'area')
+
+    def __init__(self, name, lat=None, lng=None, radius=None, polygons=None):
+        self.name = name
+        self.lat = lat
+        self.lng = lng
+        self.radius = radius
+        self.polygons = polygons or []   # [[外环, 内环...], ...]
+        self.bbox = None
+        self.area = 0.0
+        if self.polygons:
+            xs = [p[0] for poly in self.polygons for p in poly[0]]
+            ys = [p[1] for poly in self.polygons for p in poly[0]]
+            self.bbox = (min(ys), min(xs), max(ys), max(xs))
+            self.area = (self.bbox[2] - self.bbox[0]) * (self.bbox[3] - self.bbox[1])
+
+    def contains(self, lat, lng):
+        min_lat, min_lng, max_lat, max_lng = self.bbox
+        if not (min_lat <= lat <= max_lat and min_lng <= lng <= max_lng):
+            return False
+        for poly in self.polygons:
+            if _point_in_ring(lat, lng, poly[0]) and not any(_point_in_ring(lat, lng, hole) for hole in poly[1:]):
+                return True
+        return False
+
+
+def _ring(coords):
+    ring = [(float(p[0]), float(p[1])) for p in coords]
+    if len(ring) < 3:
+        raise ValueError('polygon ring needs at least 3 points')
+    return ring
+
+
+def _parse_feature(feature):
+    """GeoJSON Feature -> _Place；数据不合法时返回 None"""
+    try:
+        props = feature.get('properties') or {}
+        name = props.get('display_name') or props.get('name')
+        geom = feature.get('geometry') or {}
+        if not name or not geom:
+            return None
+        gtype = geom.get('type')
+        coords = geom.get('coordinates')
+        radius = props.get('radius')
+        if gtype == 'Point':
+            return _Place(name, lat=float(coords[1]), lng=float(coords[0]),
+                          radius=float(radius) if radius is not None else None)
+        if gtype == 'Polygon':
+            return _Place(name, polygons=[[_ring(r) for r in coords]])
+        if gtype == 'MultiPolygon':
+            return _Place(name, polygons=[[_ring(r) for r in poly] for poly in coords])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+    return None
+
+
+def _parse_entry(entry):
+    """简单格式：{"name", "lat", "lng", "radius"?, "polygon"?: [[lng, lat], ...]}"""
+    name = entry.get('display_name') or entry.get('name')
+    if not name:
+        return None
+    try:
+        if entry.get('polygon'):
+            return _Place(name, polygons=[[_ring(entry['polygon'])]])
+        radius = entry.get('radius')
+        return _Place(name, lat=float(entry['lat']), lng=float(entry['lng']),
+                      radius=float(radius) if radius is not None else None)
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class Gazetteer:
+    """基于均匀经纬度网格索引的本地地名库"""
+
+    def __init__(self, places=(), cell_deg=GAZETTEER_CELL_DEG, max_distance_m=GAZETTEER_MAX_DISTANCE_M):
+        self.cell_deg = cell_deg
+        self.max_distance_m = max_distance_m
+        self._points = {}      # (row, col) -> [_Place]
+        self._polygons = {}    # (row, col) -> [_Place]
+        self._large = []       # 覆盖范围过大的面
+        self._wide = []        # 匹配半径超过一个格子的点位
+        # 网格中点位的最大匹配半径，决定查询要检查多少圈格子；更大的半径放入 _wide，不拖慢每次查询
+        self._cell_m = cell_deg * _METERS_PER_DEG
+        self._reach_m = max_distance_m
+        self.size = 0
+        for place in places:
+            self.add(place)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        """加载 GeoJSON FeatureCollection 或简单 JSON 列表；不合法的条目跳过，文件无法解析时抛出 ValueError"""
+        with open(path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+        if isinstance(raw, dict):
+            entries, parse = raw.get('features') or [], _parse_feature
+        elif isinstance(raw, list):
+            entries, parse = raw, _parse_entry
+        else:
+            raise ValueError('expected a FeatureCollection or a list')
+        places = [parse(e) if isinstance(e, dict) else None for e in entries]
+        skipped = sum(1 for p in places if p is None)
+        if skipped:
+            print(f"⚠️ 本地地名库 {path} 中有 {skipped} 条数据不合法，已跳过")
+        return cls([p for p in places if p is not None], **kwargs)
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    def add(self, place):
+        self.size += 1
+        if place.polygons:
+            min_lat, min_lng, max_lat, max_lng = place.bbox
+            r0, c0 = self._cell(min_lat, min_lng)
+            r1, c1 = self._cell(max_lat, max_lng)
+            if (r1 - r0 + 1) * (c1 - c0 + 1) > GAZETTEER_MAX_POLYGON_CELLS:
+                self._large.append(place)
+                return
+            for r in range(r0, r1 + 1):
+                for c in range(c0, c1 + 1):
+                    self._polygons.setdefault((r, c), []).append(place)
+        elif place.radius is not None and place.radius > max(self._cell_m, self.max_distance_m):
+            self._wide.append(place)
+        else:
+            self._points.setdefault(self._cell(place.lat, place.lng), []).append(place)
+            if place.radius is not None:
+                self._reach_m = max(self._reach_m, place.radius)
+
+    def _radius(self, place):
+        return place.radius if place.radius is not None else self.max_distance_m
+
+    def lookup(self, lat, lng):
+        """返回坐标处的地名，未命中返回 None
+
+        优先返回包含该点的最小面（场馆优先于所在公园），否则返回匹配半径内最近的点位。
+        """
+        row, col = self._cell(lat, lng)
+        best = None
+        for place in self._polygons.get((row, col), ()):
+            if (best is None or place.area < best.area) and place.contains(lat, lng):
+                best = place
+        if best is not None:
+            return best.name
+
+        nearest = None
+        nearest_dist = None
+        # 网格中最大半径覆盖的格子圈数；经度方向的格子随纬度变窄，需要更多圈
+        rows = max(1, math.ceil(self._reach_m / self._cell_m))
+        cols = max(1, math.ceil(self._reach_m / (self._cell_m * max(math.cos(math.radians(lat)), 0.01))))
+        for dr in range(-rows, rows + 1):
+            for dc in range(-cols, cols + 1):
+                for place in self._points.get((row + dr, col + dc), ()):
+                    dist = _distance_m(lat, lng, place.lat, place.lng)
+                    if dist <= self._radius(place) and (nearest_dist is None or dist < nearest_dist):
+                        nearest, nearest_dist = place, dist
+        for place in self._wide:
+            dist = _distance_m(lat, lng, place.lat, place.lng)
+            if dist <= place.radius and (nearest_dist is None or dist < nearest_dist):
+                nearest, nearest_dist = place, dist
+        if nearest is not None:
+            return nearest.name
+
+        for place in self._large:
+            if (best is None or place.area < best.area) and place.contains(lat, lng):
+                best = place
+        return best.name if best is not None else None
+
+
+_gazetteer = None
+_load_lock = threading.Lock()
+
+
+def get_gazetteer():
+    """首次使用时加载地名库；文件不存在或无法解析时返回空库（只提示一次）"""
+    global _gazetteer
+    if _gazetteer is None:
+        with _load_lock:
+            if _gazetteer is None:
+                if GAZETTEER_PATH and os.path.exists(GAZETTEER_PATH):
+                    try:
+                        _gazetteer = Gazetteer.load(GAZETTEER_PATH)
+                    except (OSError, ValueError) as e:
+                        print(f"❌ 加载本地地名库失败，使用空库: {e}")
+                        _gazetteer = Gazetteer()
+                else:
+                    print(f"⚠️ 未找到本地地名库: {GAZETTEER_PATH or '未设置 GEOCODING_GAZETTEER_PATH'}")
+                    _gazetteer = Gazetteer()
+    return _gazetteer
+
+
+def lookup(lat, lng):
+    return get_gazetteer().lookup(lat, lng)
@@ -0,0 +1,161 @@
+import os
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+from ttl_cache import TTLCache
+from disk_store import DiskStore
+
+# 反向地理编码缓存配置
+GEOCODE_CACHE_PRECISION = int(os.getenv('GEOCODE_CACHE_PRECISION', '7'))   # 7 位 geohash 约 150m 见方
+GEOCODE_CACHE_TTL = float(os.getenv('GEOCODE_CACHE_TTL', str(7 * 24 * 3600)))
+GEOCODE_CACHE_NEGATIVE_TTL = float(os.getenv('GEOCODE_CACHE_NEGATIVE_TTL', '60'))
+GEOCODE_CACHE_SIZE = int(os.getenv('GEOCODE_CACHE_SIZE', '10000'))
+GEOCODE_CACHE_PATH = os.getenv('GEOCODE_CACHE_PATH', '')  # 为空时不落盘
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_encode(lat, lng, precision=GEOCODE_CACHE_PRECISION):
+    """把经纬度编码为 geohash 字符串"""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    ch = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                ch = (ch << 1) | 1
+                lng_lo = mid
+            else:
+                ch <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[ch])
+            bits = 0
+            ch = 0
+    return ''.join(chars)
+
+
+class GeocodeCache:
+    """按 geohash 量化坐标的反向地理编码缓存
+
+    - 内存层：LRU + TTL
+    - 相同格子的并发查询只发起一次上游请求，其余请求等待结果
+    - 可选的 SQLite 持久化层
+    """
+
+    def __init__(self, precision=GEOCODE_CACHE_PRECISION, ttl=GEOCODE_CACHE_TTL,
+                 maxsize=GEOCODE_CACHE_SIZE, negative_ttl=GEOCODE_CACHE_NEGATIVE_TTL,
+                 path=GEOCODE_CACHE_PATH):
+        self.precision = precision
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.store = DiskStore(path, 'geocode', value_column='address') if path else None
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.disk_hits = 0
+        self.loads = 0
+        self.deduplicated = 0
+        self.disk_errors = 0
+
+    def key(self, lat, lng):
+        return geohash_encode(lat, lng, self.precision)
+
+    def peek(self, lat, lng):
+        """只查缓存，不触发上游请求；未命中返回 None"""
+        key = self.key(lat, lng)
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        return self._load_from_disk(key)
+
+    def _load_from_disk(self, key):
+        if not self.store:
+            return None
+        try:
+            found = self.store.get(key)
+        except sqlite3.Error:
+            self.disk_errors += 1
+            return None
+        if not found:
+            return None
+        address, remaining = found
+        self.memory.set(key, address, ttl=min(remaining, self.ttl))
+        with self._lock:
+            self.disk_hits += 1
+        return address
+
+    def get_or_load(self, lat, lng, loader, strict=False):
+        """返回缓存的地址，未命中时调用 loader(lat, lng)
+
+        loader 抛出异常时：默认按空结果短暂缓存；strict=True 时不写缓存并把异常抛给调用方。
+        """
+        key = self.key(lat, lng)
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        value = self._load_from_disk(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.loads += 1
+            else:
+                self.deduplicated += 1
+        if not leader:
+            return future.result()
+
+        error = None
+        try:
+            value = loader(lat, lng) or ''
+        except Exception as e:
+            error = e
+            value = ''
+        try:
+            if error is None or not strict:
+                # 空结果通常是上游失败或限流，只短暂缓存避免反复打到上游
+                ttl = self.ttl if value else self.negative_ttl
+                self.memory.set(key, value, ttl=ttl)
+                if value and self.store:
+                    try:
+                        self.store.set(key, value, self.ttl)
+                    except sqlite3.Error:
+                        self.disk_errors += 1
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_result(value)
+        if error is not None and strict:
+            raise error
+        return value
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats.update({
+            'precision': self.precision,
+            'disk_hits': self.disk_hits,
+            'loads': self.loads,
+            'deduplicated': self.deduplicated,
+            'disk_errors': self.disk_errors,
+            'persistent': bool(self.store),
+        })
+        return stats
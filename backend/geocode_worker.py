@@ -0,0 +1,152 @@
+import os
+import time
+import queue
+import threading
+
+# 打卡地址后台回填配置
+GEOCODE_BACKFILL_ENABLED = os.getenv('GEOCODE_BACKFILL', '1') != '0'
+GEOCODE_BACKFILL_WORKERS = int(os.getenv('GEOCODE_BACKFILL_WORKERS', '4'))
+GEOCODE_BACKFILL_QUEUE_SIZE = int(os.getenv('GEOCODE_BACKFILL_QUEUE_SIZE', '1000'))
+GEOCODE_BACKFILL_RETRIES = int(os.getenv('GEOCODE_BACKFILL_RETRIES', '3'))
+GEOCODE_BACKFILL_RETRY_DELAY = float(os.getenv('GEOCODE_BACKFILL_RETRY_DELAY', '1'))
+
+
+class _Job:
+    __slots__ = ('checkin_id', 'geolocation', 'enqueued_at')
+
+    def __init__(self, checkin_id, geolocation):
+        self.checkin_id = checkin_id
+        self.geolocation = geolocation
+        self.enqueued_at = time.time()
+
+
+class GeocodeBackfill:
+    """在请求之外解析打卡地址，再回写 checkins.location 和 geolocation.address
+
+    - 有界队列：队列满时丢弃任务（地址保持为空），不会拖慢请求
+    - 远程服务的并发上限由 geocoding.GEOCODING_CONCURRENCY 控制
+    - 失败按指数退避重试
+    - 回填延迟 = 入队到写回完成的时间
+    """
+
+    def __init__(self, client=None, workers=GEOCODE_BACKFILL_WORKERS,
+                 queue_size=GEOCODE_BACKFILL_QUEUE_SIZE, retries=GEOCODE_BACKFILL_RETRIES,
+                 retry_delay=GEOCODE_BACKFILL_RETRY_DELAY, enabled=GEOCODE_BACKFILL_ENABLED):
+        self.client = client
+        self.workers = max(1, workers)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.enabled = enabled
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.empty = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retried = 0
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+        self._lag_total = 0.0
+
+    def bind(self, client):
+        self.client = client
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f'geocode-backfill-{i}', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, checkin_id, geolocation):
+        """提交回填任务，队列已满或未启用时返回 False"""
+        if not self.enabled or self.client is None or checkin_id is None:
+            return False
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(_Job(checkin_id, dict(geolocation)))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._process(job)
+            except Exception as e:
+                print(f"❌ 地址回填失败 checkin={job.checkin_id}: {e}")
+                with self._lock:
+                    self.failed += 1
+            finally:
+                self._queue.task_done()
+
+    def _process(self, job):
+        from geocoding import reverse_geocode
+        geo = job.geolocation
+        attempt = 0
+        while True:
+            try:
+                address = reverse_geocode(geo['latitude'], geo['longitude'], strict=True)
+                if address:
+                    geo['address'] = address
+                    result = self.client.table('checkins') \
+                        .update({'location': address, 'geolocation': geo}) \
+                        .eq('id', job.checkin_id) \
+                        .execute()
+                    if getattr(result, 'error', None):
+                        raise RuntimeError(result.error)
+                break
+            except Exception:
+                if attempt >= self.retries:
+                    raise
+                time.sleep(self.retry_delay * (2 ** attempt))
+                attempt += 1
+                with self._lock:
+                    self.retried += 1
+
+        lag = time.time() - job.enqueued_at
+        with self._lock:
+            if address:
+                self.completed += 1
+            else:
+                self.empty += 1
+            self.lag_last = lag
+            self.lag_max = max(self.lag_max, lag)
+            self._lag_total += lag
+
+    def oldest_pending_age(self):
+        """队首任务已等待的秒数，用于观察积压"""
+        with self._queue.mutex:
+            head = self._queue.queue[0] if self._queue.queue else None
+        return time.time() - head.enqueued_at if head else 0.0
+
+    def stats(self):
+        finished = self.completed + self.empty
+        return {
+            'enabled': self.enabled,
+            'queued': self._queue.qsize(),
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'empty': self.empty,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'retried': self.retried,
+            'lag_last_seconds': round(self.lag_last, 3),
+            'lag_avg_seconds': round(self._lag_total / finished, 3) if finished else 0.0,
+            'lag_max_seconds': round(self.lag_max, 3),
+            'oldest_pending_seconds': round(self.oldest_pending_age(), 3),
+        }
+
+
+backfill = GeocodeBackfill()
@@ -1,11 +1,32 @@
 import os
-import json
+import time
 import urllib.request
 import urllib.parse
 import urllib.error
+import threading
+import json_codec
+from geo_cache import GeocodeCache
+from metrics import metrics
+import upstream_calls
 
 PROVIDER = os.getenv('GEOCODING_PROVIDER', 'nominatim').lower()
+# local 模式下本地地名库未命中时使用的远程服务：nominatim / mapbox / none
+FALLBACK_PROVIDER = os.getenv('GEOCODING_FALLBACK', 'nominatim').lower()
 MAPBOX_TOKEN = os.getenv('MAPBOX_TOKEN', '')
+# 每个远程服务的最大并发请求数，Nominatim 的使用政策要求不超过 1
+GEOCODING_CONCURRENCY = os.getenv('GEOCODING_CONCURRENCY', 'nominatim=1,mapbox=8')
+
+def _parse_limits(spec):
+    limits = {}
+    for item in spec.split(','):
+        name, _, value = item.partition('=')
+        if name.strip() and value.strip().isdigit():
+            limits[name.strip().lower()] = threading.BoundedSemaphore(max(1, int(value)))
+    return limits
+
+_provider_limits = _parse_limits(GEOCODING_CONCURRENCY)
+
+# 远程服务失败时抛出异常，由调用方决定是否吞掉（同步路径）或重试（后台回填）
 
 def _nominatim_reverse(lat, lng):
     params = {
@@ -17,34 +38,75 @@ def _nominatim_reverse(lat, lng):
     }
     url = 'https://nominatim.openstreetmap.org/reverse?' + urllib.parse.urlencode(params)
     req = urllib.request.Request(url, headers={'User-Agent': 'aikada/1.0'})
-    try:
-        with urllib.request.urlopen(req, timeout=5) as resp:
-            body = resp.read()
-            data = json.loads(body.decode('utf-8'))
-            return data.get('display_name') or ''
-    except Exception:
-        return ''
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        body = resp.read()
+        data = json_codec.loads(body)
+        return data.get('display_name') or ''
 
 def _mapbox_reverse(lat, lng):
     if not MAPBOX_TOKEN:
         return ''
     coords = f"{lng},{lat}"
     url = f"https://api.mapbox.com/geocoding/v5/mapbox.places/{urllib.parse.quote(coords)}.json?access_token={MAPBOX_TOKEN}&limit=1&language=zh"
-    try:
-        with urllib.request.urlopen(url, timeout=5) as resp:
-            body = resp.read()
-            data = json.loads(body.decode('utf-8'))
-            features = data.get('features') or []
-            if features:
-                return features[0].get('place_name') or ''
-            return ''
-    except Exception:
+    with urllib.request.urlopen(url, timeout=5) as resp:
+        body = resp.read()
+        data = json_codec.loads(body)
+        features = data.get('features') or []
+        if features:
+            return features[0].get('place_name') or ''
         return ''
 
-def reverse_geocode(lat, lng):
-    if PROVIDER == 'mapbox':
-        return _mapbox_reverse(lat, lng)
-    return _nominatim_reverse(lat, lng)
+def _provider_reverse(lat, lng):
+    provider = FALLBACK_PROVIDER if PROVIDER == 'local' else PROVIDER
+    if provider == 'none':
+        return ''
+    fn = _mapbox_reverse if provider == 'mapbox' else _nominatim_reverse
+    limit = _provider_limits.get(provider)
+    if limit is None:
+        return _timed(provider, fn, lat, lng)
+    with limit:
+        return _timed(provider, fn, lat, lng)
+
+def _timed(provider, fn, lat, lng):
+    # 只计远程调用本身，不含等待并发名额的时间
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        addr = fn(lat, lng)
+        outcome = 'ok' if addr else 'empty'
+        return addr
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe_geocoding(provider, outcome, elapsed)
+        upstream_calls.record('geocode', elapsed)
+
+# 同一场馆/公园反复打卡，按 geohash 格子缓存地址
+_cache = GeocodeCache()
+
+def reverse_geocode(lat, lng, strict=False):
+    """返回坐标的地址，没有结果时返回空字符串
+
+    strict=True 时远程服务的异常会抛出且不写入缓存，供后台回填重试。
+    """
+    if PROVIDER == 'local':
+        # 本地地名库只需内存查找，命中时不经过缓存也不访问网络
+        from gazetteer import lookup
+        addr = lookup(lat, lng)
+        if addr:
+            return addr
+    return _cache.get_or_load(lat, lng, _provider_reverse, strict=strict)
+
+def cached_address(lat, lng):
+    """不访问网络即可得到的地址（本地地名库或缓存），没有时返回 None"""
+    if PROVIDER == 'local':
+        from gazetteer import lookup
+        addr = lookup(lat, lng)
+        if addr:
+            return addr
+    return _cache.peek(lat, lng) or None
+
+def cache_stats():
+    return _cache.stats()
 
 def clamp_location(loc):
     try:
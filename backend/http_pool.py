@@ -0,0 +1,227 @@
+import os
+import time
+import threading
+import http.client
+import urllib.parse
+from collections import deque
+
+# 连接池配置
+POOL_MAX_PER_HOST = int(os.getenv('SUPABASE_POOL_MAX_PER_HOST', '10'))
+POOL_IDLE_TIMEOUT = float(os.getenv('SUPABASE_POOL_IDLE_TIMEOUT', '30'))
+POOL_ACQUIRE_TIMEOUT = float(os.getenv('SUPABASE_POOL_ACQUIRE_TIMEOUT', '10'))
+HTTP_TIMEOUT = float(os.getenv('SUPABASE_HTTP_TIMEOUT', '30'))
+# 流式转发时每次从上游读取的最大字节数；上传文件对象时也按这个大小分块发送
+STREAM_CHUNK_SIZE = int(os.getenv('SUPABASE_STREAM_CHUNK_SIZE', '65536'))
+
+# 复用的空闲连接可能已被服务端关闭，这些异常表示请求未被处理，可以换新连接重试一次
+_STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+
+
+def _split_url(url):
+    parts = urllib.parse.urlsplit(url)
+    scheme = parts.scheme or 'http'
+    port = parts.port or (443 if scheme == 'https' else 80)
+    path = parts.path or '/'
+    if parts.query:
+        path = f'{path}?{parts.query}'
+    return (scheme, parts.hostname, port), path
+
+
+class ConnectionPool:
+    """按上游主机复用 HTTP/1.1 长连接的线程安全连接池"""
+
+    def __init__(self, max_per_host=POOL_MAX_PER_HOST, idle_timeout=POOL_IDLE_TIMEOUT,
+                 acquire_timeout=POOL_ACQUIRE_TIMEOUT, timeout=HTTP_TIMEOUT):
+        self.max_per_host = max(1, max_per_host)
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._idle = {}     # (scheme, host, port) -> deque[(conn, last_used)]
+        self._in_use = {}   # (scheme, host, port) -> 正在使用的连接数
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.discards = 0
+        self.retries = 0
+
+    def _new_connection(self, key):
+        scheme, host, port = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, blocksize=STREAM_CHUNK_SIZE)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout, blocksize=STREAM_CHUNK_SIZE)
+
+    def _evict_expired(self, key, now):
+        """移除超过空闲时间的连接（需持有锁），返回待关闭的连接"""
+        idle = self._idle.get(key)
+        expired = []
+        while idle and now - idle[0][1] > self.idle_timeout:
+            expired.append(idle.popleft()[0])
+        self.evictions += len(expired)
+        return expired
+
+    def acquire(self, key):
+        """取出一个连接，返回 (conn, reused)"""
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                expired = self._evict_expired(key, now)
+                idle = self._idle.get(key)
+                in_use = self._in_use.get(key, 0)
+                if idle:
+                    # 后进先出：最近用过的连接最不可能已被服务端关闭
+                    conn = idle.pop()[0]
+                    self._in_use[key] = in_use + 1
+                    self.hits += 1
+                    reused = True
+                    break
+                if in_use < self.max_per_host:
+                    conn = None
+                    self._in_use[key] = in_use + 1
+                    self.misses += 1
+                    reused = False
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise RuntimeError(f'connection pool exhausted for {key[1]}')
+                self._cond.wait(remaining)
+        for c in expired:
+            c.close()
+        if conn is None:
+            conn = self._new_connection(key)
+        return conn, reused
+
+    def release(self, key, conn, reusable=True):
+        with self._cond:
+            self._in_use[key] = max(0, self._in_use.get(key, 0) - 1)
+            if reusable:
+                self._idle.setdefault(key, deque()).append((conn, time.monotonic()))
+            else:
+                self.discards += 1
+            self._cond.notify()
+        if not reusable:
+            conn.close()
+
+    def _send(self, method, url, headers, data):
+        """发送请求并读取响应头，返回 (key, conn, resp)；复用的连接已失效时换新连接重试一次
+
+        data 可以是 bytes，也可以是文件对象（不带 Content-Length 时以 chunked 编码分块发送，
+        不会整体读入内存）。文件对象重试前回到起始位置，无法回退的可迭代对象不重试。
+        """
+        key, path = _split_url(url)
+        rewind = data.tell() if hasattr(data, 'seek') else None
+        retryable = data is None or isinstance(data, (bytes, bytearray)) or rewind is not None
+        attempt = 0
+        while True:
+            if attempt and rewind is not None:
+                data.seek(rewind)
+            conn, reused = self.acquire(key)
+            try:
+                conn.request(method, path, body=data, headers=headers or {})
+                return key, conn, conn.getresponse()
+            except _STALE_ERRORS as e:
+                self.release(key, conn, reusable=False)
+                if reused and attempt == 0 and retryable:
+                    attempt += 1
+                    with self._cond:
+                        self.retries += 1
+                    continue
+                raise RuntimeError(str(e))
+            except (OSError, http.client.HTTPException) as e:
+                self.release(key, conn, reusable=False)
+                raise RuntimeError(str(e))
+
+    def request(self, method, url, headers=None, data=None):
+        """发送请求并读取完整响应，返回 (status, headers, body)"""
+        key, conn, resp = self._send(method, url, headers, data)
+        try:
+            body = resp.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.release(key, conn, reusable=False)
+            raise RuntimeError(str(e))
+        self.release(key, conn, reusable=not resp.will_close)
+        return resp.status, dict(resp.getheaders()), body
+
+    def stream(self, method, url, headers=None, data=None, chunk_size=STREAM_CHUNK_SIZE):
+        """发送请求但不读取响应体，返回 (status, headers, StreamedBody)
+
+        连接在响应体读完或调用 close() 时才归还连接池，调用方必须保证二者之一发生。
+        """
+        key, conn, resp = self._send(method, url, headers, data)
+        return resp.status, dict(resp.getheaders()), StreamedBody(self, key, conn, resp, chunk_size)
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._cond:
+            conns = [c for idle in self._idle.values() for c, _ in idle]
+            self._idle.clear()
+        for c in conns:
+            c.close()
+
+    def stats(self):
+        with self._cond:
+            idle = sum(len(v) for v in self._idle.values())
+            in_use = sum(self._in_use.values())
+            hosts = len(set(self._idle) | {k for k, v in self._in_use.items() if v})
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            'evictions': self.evictions,
+            'discards': self.discards,
+            'retries': self.retries,
+            'idle': idle,
+            'in_use': in_use,
+            'hosts': hosts,
+            'max_per_host': self.max_per_host,
+        }
+
+
+class StreamedBody:
+    """按块读取的上游响应体，读完或关闭时把连接还给连接池"""
+
+    def __init__(self, pool, key, conn, resp, chunk_size=STREAM_CHUNK_SIZE):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._resp = resp
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        try:
+            while True:
+                # read1 有多少返回多少，不等凑满一块，首字节延迟更低
+                chunk = self._resp.read1(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+            # 带 Content-Length 的响应读完时 read1 不会自动关闭响应，连接仍认为有未完成的响应，
+            # 不关闭就归还会让下一个请求报 ResponseNotReady
+            self._resp.close()
+            self._finish(reusable=not self._resp.will_close)
+        finally:
+            # 中途断开（客户端关闭连接、读取出错）时连接状态未知，直接丢弃
+            self._finish(reusable=False)
+
+    def read(self):
+        return b''.join(self)
+
+    def close(self):
+        self._finish(reusable=False)
+
+    def _finish(self, reusable):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        self._pool.release(self._key, conn, reusable=reusable)
+
+
+# 进程内共享的默认连接池
+default_pool = ConnectionPool()
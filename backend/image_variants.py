@@ -0,0 +1,141 @@
+"""
+上传图片的派生尺寸：在独立进程池中把原图解码、缩放并编码为 WebP（去掉 EXIF）。
+
+本模块会在子进程中被导入，不要在顶层导入 Flask 或 Supabase 客户端。
+Pillow 和进程池只在渲染时导入，Web 进程启动时不加载。
+"""
+
+import os
+import tempfile
+import threading
+import importlib.util
+
+# 可选依赖，未安装时只上传原图
+PILLOW_AVAILABLE = importlib.util.find_spec('PIL') is not None
+
+# 派生图配置：名称=最长边像素
+IMAGE_DERIVATIVES_ENABLED = os.getenv('IMAGE_DERIVATIVES', '1') != '0'
+IMAGE_VARIANTS = os.getenv('IMAGE_VARIANTS', 'thumb=320,feed=1080,full=2560')
+IMAGE_WEBP_QUALITY = int(os.getenv('IMAGE_WEBP_QUALITY', '80'))
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', str(min(4, os.cpu_count() or 1))))
+IMAGE_RENDER_TIMEOUT = float(os.getenv('IMAGE_RENDER_TIMEOUT', '20'))
+# 超过该像素数的图片不处理，防止解压炸弹占满内存
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', str(50_000_000)))
+
+
+def _parse_variants(spec):
+    variants = []
+    for item in spec.split(','):
+        name, _, value = item.partition('=')
+        if name.strip() and value.strip().isdigit():
+            variants.append((name.strip(), int(value)))
+    return variants
+
+
+def render_variants(path, variants, quality, out_dir=None):
+    """在子进程中执行：生成各尺寸的 WebP 临时文件，返回 {名称: 文件路径}
+
+    - JPEG 用 draft 模式按需缩小解码，大图不必完整解码
+    - 按 EXIF 方向旋转后保存，不写入 EXIF（去掉定位等隐私信息）
+    - 不放大：原图比目标尺寸小时按原尺寸输出
+    """
+    from PIL import Image, ImageOps
+    Image.MAX_IMAGE_PIXELS = IMAGE_MAX_PIXELS
+    largest = max(size for _, size in variants)
+    outputs = {}
+    with Image.open(path) as im:
+        im.draft('RGB', (largest, largest))
+        im = ImageOps.exif_transpose(im)
+        if im.mode not in ('RGB', 'RGBA'):
+            im = im.convert('RGBA' if 'transparency' in im.info or im.mode in ('LA', 'PA') else 'RGB')
+        # 只保留色彩配置，EXIF / XMP 不写入派生图
+        icc_profile = im.info.get('icc_profile')
+        im.info = {}
+        # 从大到小逐级缩放，每一级都从上一级结果开始，减少重采样的像素量
+        for name, size in sorted(variants, key=lambda v: -v[1]):
+            im.thumbnail((size, size), Image.LANCZOS)
+            fd, out_path = tempfile.mkstemp(suffix='.webp', dir=out_dir)
+            with os.fdopen(fd, 'wb') as f:
+                im.save(f, 'WEBP', quality=quality, method=4, icc_profile=icc_profile)
+            outputs[name] = out_path
+    return outputs
+
+
+def _discard_outputs(future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    for path in future.result().values():
+        remove_quietly(path)
+
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class DerivativePipeline:
+    """按需启动的进程池，负责把原图渲染为各尺寸 WebP"""
+
+    def __init__(self, variants=IMAGE_VARIANTS, quality=IMAGE_WEBP_QUALITY, workers=IMAGE_WORKERS,
+                 timeout=IMAGE_RENDER_TIMEOUT, enabled=IMAGE_DERIVATIVES_ENABLED):
+        self.variants = _parse_variants(variants)
+        self.quality = quality
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.enabled = enabled and PILLOW_AVAILABLE and bool(self.variants)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.rendered = 0
+        self.failed = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    import multiprocessing
+                    from concurrent.futures import ProcessPoolExecutor
+                    # spawn：子进程不继承 Web 进程中的线程和连接
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def submit(self, path):
+        """提交渲染任务，返回 Future；未启用时返回 None"""
+        if not self.enabled:
+            return None
+        return self._get_executor().submit(render_variants, path, self.variants, self.quality)
+
+    def discard(self, future):
+        """不再需要结果（超时、原图上传失败）时，任务完成后删除它生成的临时文件"""
+        if future is not None:
+            future.add_done_callback(_discard_outputs)
+
+    def result(self, future):
+        """等待渲染结果，失败时返回 {}（原图上传不受影响）"""
+        if future is None:
+            return {}
+        try:
+            outputs = future.result(timeout=self.timeout)
+        except Exception as e:
+            print(f"❌ 派生图生成失败: {e}")
+            self.discard(future)
+            with self._lock:
+                self.failed += 1
+            return {}
+        with self._lock:
+            self.rendered += 1
+        return outputs
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'variants': dict(self.variants),
+            'workers': self.workers,
+            'rendered': self.rendered,
+            'failed': self.failed,
+        }
+
+
+pipeline = DerivativePipeline()
@@ -0,0 +1,71 @@
+"""
+统一的 JSON 编解码：安装了 orjson 时使用 orjson，否则回退到标准库 json。
+
+- dumps 返回 UTF-8 bytes（不转义非 ASCII 字符），可直接作为请求体或响应体
+- loads 接受 bytes 或 str
+- datetime / date / time 编码为 ISO 8601 字符串，Decimal 编码为数字，set 编码为数组
+"""
+
+import datetime
+import decimal
+import json
+import uuid
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def _default(obj):
+    """两种实现都不能直接编码的类型"""
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, decimal.Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+    def loads(data):
+        return orjson.loads(data)
+
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_default)
+
+    def dumps(obj):
+        return _encoder.encode(obj).encode('utf-8')
+
+    def loads(data):
+        return json.loads(data)
+
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:  # 只使用 ASGI 入口或客户端时不需要 Flask
+    DefaultJSONProvider = None
+
+if DefaultJSONProvider is not None:
+    class FastJSONProvider(DefaultJSONProvider):
+        """Flask 使用同一套编解码，jsonify 直接输出 bytes，不再经过 str 中转"""
+
+        def dumps(self, obj, **kwargs):
+            return dumps(obj).decode('utf-8')
+
+        def loads(self, s, **kwargs):
+            return loads(s)
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(dumps(obj), mimetype=self.mimetype)
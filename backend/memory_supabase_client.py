@@ -0,0 +1,552 @@
+"""
+进程内的 Supabase：InMemorySupabaseClient 与 EnhancedSupabaseClient 接口相同，
+查询构造、响应解析、缓存和写入通知都走同一套代码，只把连接池换成 MemoryBackend。
+
+MemoryBackend 按 PostgREST / Storage 的协议处理请求（URL、Prefer、Range 头和 JSON 响应），数据保存在内存表中：
+- select（含 badges(*)、users(id,name) 这类按 <单数表名>_id 外键嵌入）、eq/neq/lt/lte/gt/gte/in/is/like/ilike 过滤、
+  not. 取反、or=(...) / and(...) 逻辑表达式、order、limit、offset、Range 头
+- Prefer: count=exact|planned|estimated（Content-Range 返回总数，此时超出范围返回 416）、return=representation、
+  resolution=ignore-duplicates
+- insert / update / delete，主键和外键约束失败时返回与 PostgREST 相同的错误码（23505 / 23503）
+- Storage 对象上传（PUT 覆盖；POST + x-upsert: false 已存在时返回 400 + statusCode 409）、公开读取、列出存储桶
+- 等值（eq / in）过滤用到的列按需建立哈希索引，写入时同步维护
+
+不访问网络，适合单元测试和剖析后端自身的开销；数据随进程退出丢失。
+"""
+
+import os
+import re
+import uuid
+import datetime
+import threading
+import urllib.parse
+
+import json_codec
+from supabase_client import EnhancedSupabaseClient
+
+# 预置数据：JSON 文件，格式为 {表名: [行]}
+SUPABASE_MEMORY_FIXTURES = os.getenv('SUPABASE_MEMORY_FIXTURES', '')
+SUPABASE_MEMORY_BUCKETS = os.getenv('SUPABASE_MEMORY_BUCKETS', 'image')
+
+# 公开 URL 使用的地址，只用于拼接 URL，不会被访问
+MEMORY_URL = 'http://supabase.memory'
+
+# 外键：表 -> {列: 被引用的表}，与数据库中的约束一致；写入时检查
+FOREIGN_KEYS = {
+    'checkins': {'user_id': 'users'},
+    'user_badges': {'user_id': 'users', 'badge_id': 'badges'},
+}
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_CONDITION = re.compile(r'^(not\.)?(eq|neq|lt|lte|gt|gte|in|is|like|ilike)\.(.*)$', re.S)
+
+
+class QueryError(ValueError):
+    pass
+
+
+# =====================
+# 查询参数解析
+# =====================
+
+def _split_top_level(expr):
+    """按最外层逗号切分，忽略括号和双引号内的逗号"""
+    items, depth, quoted, escaped, start = [], 0, False, False, 0
+    for i, ch in enumerate(expr):
+        if escaped:
+            escaped = False
+        elif ch == '\\':
+            escaped = True
+        elif ch == '"':
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            items.append(expr[start:i])
+            start = i + 1
+    items.append(expr[start:])
+    return [item.strip() for item in items if item.strip()]
+
+
+def _unquote(value):
+    if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+        return re.sub(r'\\(.)', r'\1', value[1:-1])
+    return value
+
+
+def parse_condition(column, expr):
+    """'eq.5'、'not.in.("a","b")' -> ('cond', 列, 是否取反, 操作符, 值)"""
+    match = _CONDITION.match(expr)
+    if not match:
+        raise QueryError(f'unsupported filter: {column}={expr}')
+    negate, op, raw = match.groups()
+    if op == 'in':
+        if not (raw.startswith('(') and raw.endswith(')')):
+            raise QueryError(f'invalid in filter: {raw}')
+        value = [_unquote(v) for v in _split_top_level(raw[1:-1])]
+    else:
+        value = _unquote(raw)
+    return ('cond', column, bool(negate), op, value)
+
+
+def parse_logic(op, expr):
+    """or=(a.lt.1,and(a.eq.1,b.lt.2)) 括号内的部分 -> (op, [子条件])"""
+    terms = []
+    for term in _split_top_level(expr):
+        for name in ('and', 'or'):
+            if term.startswith(name + '(') and term.endswith(')'):
+                terms.append(parse_logic(name, term[len(name) + 1:-1]))
+                break
+        else:
+            column, _, rest = term.partition('.')
+            terms.append(parse_condition(column, rest))
+    return (op, terms)
+
+
+def parse_params(params):
+    """[(键, 值)] -> (select, 过滤条件, order, limit, offset)"""
+    select, filters, order, limit, offset = '*', [], [], None, 0
+    for key, value in params:
+        if key == 'select':
+            select = value
+        elif key == 'order':
+            for item in value.split(','):
+                parts = item.strip().split('.')
+                order.append((parts[0], len(parts) > 1 and parts[1] == 'desc'))
+        elif key == 'limit':
+            limit = int(value)
+        elif key == 'offset':
+            offset = int(value)
+        elif key in ('or', 'and'):
+            if not (value.startswith('(') and value.endswith(')')):
+                raise QueryError(f'invalid logic tree: {value}')
+            filters.append(parse_logic(key, value[1:-1]))
+        else:
+            filters.append(parse_condition(key, value))
+    return select, filters, order, limit, offset
+
+
+# =====================
+# 条件匹配
+# =====================
+
+def _text(value):
+    """非标量值（JSON 列）按 JSON 文本比较"""
+    return value if isinstance(value, str) else json_codec.dumps(value).decode('utf-8')
+
+
+def _compare(current, op, value):
+    if op == 'is':
+        target = {'null': None, 'true': True, 'false': False}.get(value.lower(), value)
+        return current is target
+    if current is None:
+        return False
+    if op == 'in':
+        return any(_compare(current, 'eq', v) for v in value)
+    if isinstance(current, bool):
+        value = value == 'true'
+    elif isinstance(current, (int, float)):
+        try:
+            value = float(value)
+        except ValueError:
+            return False
+    else:
+        current = _text(current)
+    if op in ('like', 'ilike'):
+        pattern = '^' + '.*'.join(re.escape(part) for part in re.split(r'[*%]', value)) + '$'
+        return re.match(pattern, current, re.I if op == 'ilike' else 0) is not None
+    try:
+        if op == 'eq':
+            return current == value
+        if op == 'neq':
+            return current != value
+        if op == 'lt':
+            return current < value
+        if op == 'lte':
+            return current <= value
+        if op == 'gt':
+            return current > value
+        if op == 'gte':
+            return current >= value
+    except TypeError:
+        return False
+    raise QueryError(f'unsupported operator: {op}')
+
+
+def matches(row, node):
+    kind = node[0]
+    if kind == 'cond':
+        _, column, negate, op, value = node
+        return _compare(row.get(column), op, value) != negate
+    results = (matches(row, child) for child in node[1])
+    return all(results) if kind == 'and' else any(results)
+
+
+def _sort(rows, order):
+    # 从最后一个排序列开始做稳定排序；NULL 升序时在后、降序时在前（与 PostgreSQL 默认一致）
+    for column, desc in reversed(order):
+        present = [r for r in rows if r.get(column) is not None]
+        nulls = [r for r in rows if r.get(column) is None]
+        present.sort(key=lambda r: r[column], reverse=desc)
+        rows = nulls + present if desc else present + nulls
+    return rows
+
+
+def _index_key(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return float(value)
+    return _text(value)
+
+
+def _lookup_keys(raw):
+    """过滤值（URL 中的字符串）可能命中的索引键：文本列按原文，数值列按数值"""
+    keys = [raw]
+    try:
+        keys.append(float(raw))
+    except ValueError:
+        pass
+    return keys
+
+
+class MemoryTable:
+    """一张内存表：按插入顺序保存行，等值过滤用到的列在第一次使用时建立哈希索引
+
+    更新时整行替换而不是原地修改，读取方拿到的行不会在序列化途中被改动。
+    """
+
+    def __init__(self, rows=()):
+        self.rows = {}      # 行号 -> 行
+        self.indexes = {}   # 列 -> {索引键: {行号}}
+        self._next = 0
+        for row in rows:
+            self.add(dict(row))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _index_row(self, rowid, row):
+        for column, index in self.indexes.items():
+            index.setdefault(_index_key(row.get(column)), set()).add(rowid)
+
+    def _unindex_row(self, rowid, row):
+        for column, index in self.indexes.items():
+            key = _index_key(row.get(column))
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(rowid)
+                if not ids:
+                    del index[key]
+
+    def add(self, row):
+        rowid = self._next
+        self._next += 1
+        self.rows[rowid] = row
+        self._index_row(rowid, row)
+        return rowid
+
+    def replace(self, rowid, row):
+        self._unindex_row(rowid, self.rows[rowid])
+        self.rows[rowid] = row
+        self._index_row(rowid, row)
+
+    def remove(self, rowid):
+        self._unindex_row(rowid, self.rows.pop(rowid))
+
+    def lookup(self, column, values):
+        """eq / in 条件可能命中的行号"""
+        index = self.indexes.get(column)
+        if index is None:
+            index = self.indexes[column] = {}
+            for rowid, row in self.rows.items():
+                index.setdefault(_index_key(row.get(column)), set()).add(rowid)
+        found = set()
+        for raw in values:
+            for key in _lookup_keys(raw):
+                found |= index.get(key, set())
+        return found
+
+    def find(self, filters):
+        """返回 [(行号, 行)]，按插入顺序；先用索引缩小范围，再逐行完整匹配"""
+        rowids = None
+        for node in filters:
+            if node[0] == 'cond' and not node[2] and node[3] in ('eq', 'in'):
+                found = self.lookup(node[1], node[4] if node[3] == 'in' else [node[4]])
+                rowids = found if rowids is None else rowids & found
+        candidates = self.rows.items() if rowids is None else ((i, self.rows[i]) for i in sorted(rowids))
+        return [(i, row) for i, row in candidates if all(matches(row, f) for f in filters)]
+
+
+class MemoryBody:
+    """与 http_pool.StreamedBody 相同的接口：按块迭代、read()、close()"""
+
+    def __init__(self, body, chunk_size=STREAM_CHUNK_SIZE):
+        self._body = body
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        for i in range(0, len(self._body), self.chunk_size):
+            yield self._body[i:i + self.chunk_size]
+
+    def read(self):
+        return self._body
+
+    def close(self):
+        pass
+
+
+def _error(status, code, message, details=None):
+    return status, {'code': code, 'details': details, 'hint': None, 'message': message}
+
+
+class MemoryBackend:
+    """代替连接池：request / stream 的参数和返回值与 http_pool.ConnectionPool 相同，请求在进程内处理"""
+
+    def __init__(self, tables=None, buckets=('image',)):
+        self.tables = {name: MemoryTable(rows) for name, rows in (tables or {}).items()}
+        self.buckets = tuple(buckets)
+        self.objects = {}   # (存储桶, 路径) -> (Content-Type, bytes)
+        self._lock = threading.RLock()
+        self.requests = 0
+
+    # ---------- 连接池接口 ----------
+
+    def request(self, method, url, headers=None, data=None):
+        """返回 (status, headers, body)"""
+        if hasattr(data, 'read'):
+            data = data.read()
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        parsed = urllib.parse.urlsplit(url)
+        with self._lock:
+            self.requests += 1
+        try:
+            if '/rest/v1/' in parsed.path:
+                status, payload, extra = self._rest(method, parsed.path.split('/rest/v1/', 1)[1],
+                                                    parsed.query, headers, data)
+            elif '/storage/v1/' in parsed.path:
+                status, payload, extra = self._storage(method, parsed.path.split('/storage/v1/', 1)[1],
+                                                       headers, data)
+            else:
+                status, payload, extra = 404, {'message': 'not found'}, {}
+        except (QueryError, ValueError) as e:
+            status, payload = _error(400, 'PGRST100', str(e))
+            extra = {}
+        if isinstance(payload, bytes):
+            body = payload
+        else:
+            body = json_codec.dumps(payload) if payload is not None else b''
+            extra.setdefault('Content-Type', 'application/json; charset=utf-8')
+        extra['Content-Length'] = str(len(body))
+        return status, extra, body
+
+    def stream(self, method, url, headers=None, data=None, chunk_size=STREAM_CHUNK_SIZE):
+        status, hdrs, body = self.request(method, url, headers, data)
+        return status, hdrs, MemoryBody(body, chunk_size)
+
+    def close(self):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'requests': self.requests,
+                'tables': {name: len(table) for name, table in self.tables.items()},
+                'objects': len(self.objects),
+            }
+
+    # ---------- 直接读写（测试准备数据、检查结果） ----------
+
+    def load(self, tables):
+        """追加预置数据 {表名: [行]}"""
+        with self._lock:
+            for name, rows in tables.items():
+                table = self._table(name)
+                for row in rows:
+                    table.add(dict(row))
+
+    def rows(self, table):
+        """表中全部行的副本，按插入顺序"""
+        with self._lock:
+            return [dict(row) for row in self._table(table).rows.values()]
+
+    # ---------- PostgREST ----------
+
+    def _table(self, name):
+        # 不存在的表视为空表，第一次写入时创建
+        table = self.tables.get(name)
+        if table is None:
+            table = self.tables[name] = MemoryTable()
+        return table
+
+    def _project(self, row, select):
+        if select.strip() == '*':
+            return dict(row)
+        out = {}
+        for item in _split_top_level(select):
+            name, paren, rest = item.partition('(')
+            name = name.strip()
+            if not paren:
+                if name == '*':
+                    # *,badges(*)：全部列加上嵌入
+                    out.update(row)
+                elif name in row:
+                    out[name] = row[name]
+                continue
+            # 嵌入关联表：按 <单数表名>_id 外键查找
+            key = row.get(name.rstrip('s') + '_id')
+            found = self._table(name).find([('cond', 'id', False, 'eq', str(key))]) if key is not None else []
+            out[name] = self._project(found[0][1], rest[:-1] or '*') if found else None
+        return out
+
+    def _check_foreign_keys(self, table_name, row):
+        for column, target in FOREIGN_KEYS.get(table_name, {}).items():
+            value = row.get(column)
+            if value is not None and not self._table(target).lookup('id', [str(value)]):
+                return _error(409, '23503',
+                              f'insert or update on table "{table_name}" violates foreign key constraint '
+                              f'"{table_name}_{column}_fkey"',
+                              f'Key ({column})=({value}) is not present in table "{target}".')
+        return None
+
+    def _rest(self, method, table_name, query, headers, data):
+        params = urllib.parse.parse_qsl(query, keep_blank_values=True)
+        prefer = dict(p.strip().partition('=')[::2] for p in headers.get('prefer', '').split(',') if p.strip())
+        if method == 'GET':
+            return self._select(table_name, params, headers.get('range'), prefer.get('count'))
+        if method == 'POST':
+            rows = json_codec.loads(data) if data else []
+            ignore = prefer.get('resolution') == 'ignore-duplicates'
+            status, payload = self._insert(table_name, rows if isinstance(rows, list) else [rows], ignore)
+        elif method == 'PATCH':
+            status, payload = self._update(table_name, params, json_codec.loads(data) if data else {})
+        elif method == 'DELETE':
+            status, payload = self._delete(table_name, params)
+        else:
+            return 405, {'message': 'method not allowed'}, {}
+        if status < 300 and prefer.get('return') != 'representation':
+            return (201 if method == 'POST' else 204), None, {}
+        return status, payload, {}
+
+    def _select(self, table_name, params, range_header, count):
+        select, filters, order, limit, offset = parse_params(params)
+        if range_header and range_header.startswith('items='):
+            start, _, end = range_header[len('items='):].partition('-')
+            offset, limit = int(start), int(end) - int(start) + 1
+        with self._lock:
+            rows = _sort([row for _, row in self._table(table_name).find(filters)], order)
+            total = len(rows)
+            # 只有要求计数时 PostgREST 才对超出范围的请求返回 416，否则返回空数组
+            if count and 0 < total <= offset:
+                return 416, {'code': 'PGRST103', 'details': None, 'hint': None,
+                             'message': 'Requested range not satisfiable'}, {'Content-Range': f'*/{total}'}
+            page = rows[offset:offset + limit if limit is not None else None]
+            data = [self._project(r, select) for r in page]
+        shown = f'{offset}-{offset + len(data) - 1}' if data else '*'
+        return 200, data, {'Content-Range': f'{shown}/{total if count else "*"}'}
+
+    def _insert(self, table_name, rows, ignore_duplicates=False):
+        now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        with self._lock:
+            table = self._table(table_name)
+            prepared, ids = [], set()
+            for row in rows:
+                row = dict(row)
+                row.setdefault('id', str(uuid.uuid4()))
+                row.setdefault('created_at', now)
+                key = str(row['id'])
+                if key in ids or table.lookup('id', [key]):
+                    if ignore_duplicates:
+                        continue
+                    return _error(409, '23505', f'duplicate key value violates unique constraint "{table_name}_pkey"',
+                                  f'Key (id)=({row["id"]}) already exists.')
+                error = self._check_foreign_keys(table_name, row)
+                if error:
+                    return error
+                ids.add(key)
+                prepared.append(row)
+            # 整批检查通过后才写入，与数据库事务一致
+            for row in prepared:
+                table.add(row)
+        return 201, prepared
+
+    def _update(self, table_name, params, patch):
+        select, filters, _, _, _ = parse_params(params)
+        with self._lock:
+            table = self._table(table_name)
+            changes = []
+            for rowid, row in table.find(filters):
+                updated = dict(row, **patch)
+                error = self._check_foreign_keys(table_name, updated)
+                if error:
+                    return error
+                changes.append((rowid, updated))
+            for rowid, updated in changes:
+                table.replace(rowid, updated)
+            return 200, [self._project(row, select) for _, row in changes]
+
+    def _delete(self, table_name, params):
+        select, filters, _, _, _ = parse_params(params)
+        with self._lock:
+            table = self._table(table_name)
+            removed = table.find(filters)
+            for rowid, _ in removed:
+                table.remove(rowid)
+            return 200, [self._project(row, select) for _, row in removed]
+
+    # ---------- Storage ----------
+
+    def _storage(self, method, path, headers, data):
+        if path in ('bucket', 'buckets') and method == 'GET':
+            return 200, [{'id': b, 'name': b, 'public': True} for b in self.buckets], {}
+        if not path.startswith('object/'):
+            return 404, {'statusCode': '404', 'error': 'not_found', 'message': 'Not found'}, {}
+        path = path[len('object/'):]
+        if path.startswith('public/'):
+            path = path[len('public/'):]
+        bucket, _, key = path.partition('/')
+        if bucket not in self.buckets:
+            return 404, {'statusCode': '404', 'error': 'Bucket not found', 'message': 'Bucket not found'}, {}
+        if method == 'GET':
+            with self._lock:
+                found = self.objects.get((bucket, key))
+            if found is None:
+                return 404, {'statusCode': '404', 'error': 'not_found', 'message': 'Object not found'}, {}
+            return 200, found[1], {'Content-Type': found[0]}
+        if method not in ('POST', 'PUT'):
+            return 405, {'message': 'method not allowed'}, {}
+        upsert = method == 'PUT' or headers.get('x-upsert', '').lower() == 'true'
+        with self._lock:
+            if not upsert and (bucket, key) in self.objects:
+                return 400, {'statusCode': '409', 'error': 'Duplicate', 'message': 'The resource already exists'}, {}
+            self.objects[(bucket, key)] = (headers.get('content-type', 'application/octet-stream'), data or b'')
+        return 200, {'Key': f'{bucket}/{key}'}, {}
+
+
+class InMemorySupabaseClient(EnhancedSupabaseClient):
+    """接口与 EnhancedSupabaseClient 相同；self.pool 是 MemoryBackend，GET /stats 的 http_pool 显示它的统计"""
+
+    def __init__(self, tables=None, buckets=('image',), url=MEMORY_URL, key='memory'):
+        super().__init__(url, key, pool=MemoryBackend(tables, buckets))
+
+    @property
+    def backend(self):
+        return self.pool
+
+    @classmethod
+    def from_env(cls):
+        """按 SUPABASE_MEMORY_FIXTURES / SUPABASE_MEMORY_BUCKETS 创建"""
+        tables = None
+        if SUPABASE_MEMORY_FIXTURES:
+            with open(SUPABASE_MEMORY_FIXTURES, 'rb') as f:
+                tables = json_codec.loads(f.read())
+        buckets = [b.strip() for b in SUPABASE_MEMORY_BUCKETS.split(',') if b.strip()]
+        return cls(tables, buckets)
@@ -0,0 +1,269 @@
+"""
+Prometheus 指标：请求延迟直方图、状态码计数、处理中的请求数、Supabase 上游调用和地理编码耗时，
+以及压缩、上传去重等模块的累计字节数（采集时读取各模块的 stats()）。
+
+记录路径上不加锁：每个线程写自己的分片（预先分配好桶的列表），只有采集（GET /metrics）时才汇总各分片。
+已退出线程的分片在新线程登记和采集时并入汇总值，开发服务器每个请求一个线程、从不采集也不会无限增长。
+"""
+
+import os
+import time
+import bisect
+import threading
+
+METRICS_ENABLED = os.getenv('METRICS', '1') != '0'
+
+# 秒；覆盖缓存命中（亚毫秒）到上游超时
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    """按线程分片的指标：shard 为 {标签元组: 值}，只由所属线程写入"""
+
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []      # [(线程, shard)]
+        self._retired = {}     # 已退出线程的汇总值
+        self._lock = threading.Lock()   # 只在新线程第一次写入和采集时使用
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._retire_dead()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _retire_dead(self):
+        """把已退出线程的分片并入 _retired；调用方持有 _lock"""
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                self._merge(self._retired, shard.copy())
+        self._shards = alive
+
+    def _merge(self, total, values):
+        raise NotImplementedError
+
+    def collect(self):
+        """返回 {标签元组: 汇总值}"""
+        with self._lock:
+            self._retire_dead()
+            total = {}
+            self._merge(total, self._retired)
+            for _, shard in self._shards:
+                self._merge(total, shard.copy())
+        return total
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def _merge(self, total, values):
+        for labels, value in values.items():
+            total[labels] = total.get(labels, 0) + value
+
+    def render(self):
+        values = self.collect()
+        if not values and not self.labelnames:
+            values = {(): 0}
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_number(value)}'
+                for labels, value in sorted(values.items())]
+
+
+class Gauge(Counter):
+    """可增可减的计数（如处理中的请求数），同样按线程分片累加"""
+    kind = 'gauge'
+
+    def add(self, amount, labels=()):
+        self.inc(labels, amount)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._size = len(self.buckets) + 2   # 各桶（不累积）、+Inf 桶、总和
+
+    def observe(self, value, labels=()):
+        shard = self._shard()
+        cells = shard.get(labels)
+        if cells is None:
+            cells = shard[labels] = [0] * self._size
+        cells[bisect.bisect_left(self.buckets, value)] += 1
+        cells[-1] += value
+
+    def _merge(self, total, values):
+        for labels, cells in values.items():
+            cells = list(cells)
+            merged = total.get(labels)
+            if merged is None:
+                total[labels] = cells
+            else:
+                for i, v in enumerate(cells):
+                    merged[i] += v
+
+    def render(self):
+        lines = []
+        bounds = self.buckets + (float('inf'),)
+        for labels, cells in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, cells):
+                cumulative += count
+                le = 'le="' + _format_number(float(bound)) + '"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_number(cells[-1])}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+class StatsCounter:
+    """由其他模块自己累计的计数：采集时调用 read()，返回 {标签元组: 值}"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames, read):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.read = read
+
+    def render(self):
+        return [f'{self.name}{_format_labels(self.labelnames, labels)} {_format_number(value)}'
+                for labels, value in sorted(self.read().items())]
+
+
+def upstream_target(url):
+    """Supabase URL -> 指标中的 table 标签：REST 为表名，Storage 统一为 storage"""
+    i = url.find('/rest/v1/')
+    if i >= 0:
+        start = i + len('/rest/v1/')
+        end = len(url)
+        for sep in ('?', '/'):
+            j = url.find(sep, start)
+            if j >= 0:
+                end = min(end, j)
+        return url[start:end] or 'unknown'
+    if '/storage/v1/' in url:
+        return 'storage'
+    return 'other'
+
+
+class Metrics:
+    """应用的全部指标；init_app 为 Flask 应用加上请求级记录"""
+
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self.requests = Counter(
+            'http_requests_total', 'HTTP requests by route, method and status.',
+            ('route', 'method', 'status'))
+        self.latency = Histogram(
+            'http_request_duration_seconds', 'Time until the response (headers for streamed bodies) is ready.',
+            ('route', 'method'))
+        self.in_flight = Gauge('http_requests_in_flight', 'Requests currently being handled.')
+        self.upstream = Histogram(
+            'supabase_request_duration_seconds', 'Supabase REST/Storage calls until response headers.',
+            ('table', 'method', 'status'))
+        self.geocoding = Histogram(
+            'geocoding_request_duration_seconds', 'Reverse geocoding provider calls.',
+            ('provider', 'outcome'))
+        self.families = [self.requests, self.latency, self.in_flight, self.upstream, self.geocoding]
+
+    def register(self, family):
+        """加入一组在采集时才读取的指标（如 StatsCounter）"""
+        self.families.append(family)
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        from flask import request
+        request.environ['metrics.start'] = self.begin()
+
+    def _after_request(self, response):
+        from flask import request
+        start = request.environ.get('metrics.start')
+        if start is not None:
+            self.observe_request(request.url_rule.rule if request.url_rule else '<unmatched>',
+                                 request.method, response.status_code, time.perf_counter() - start)
+        return response
+
+    def _teardown_request(self, exc):
+        from flask import request
+        if request.environ.pop('metrics.start', None) is not None:
+            self.end()
+
+    def begin(self):
+        """请求开始：处理中的请求数加一，返回开始时间"""
+        if self.enabled:
+            self.in_flight.add(1)
+        return time.perf_counter()
+
+    def end(self):
+        if self.enabled:
+            self.in_flight.add(-1)
+
+    def observe_request(self, route, method, status, seconds):
+        if self.enabled:
+            self.requests.inc((route, method, str(status)))
+            self.latency.observe(seconds, (route, method))
+
+    def observe_upstream(self, url, method, status, seconds):
+        if self.enabled:
+            self.upstream.observe(seconds, (upstream_target(url), method, str(status)))
+
+    def observe_geocoding(self, provider, outcome, seconds):
+        if self.enabled:
+            self.geocoding.observe(seconds, (provider, outcome))
+
+    def render(self):
+        """Prometheus 文本格式（0.0.4）"""
+        lines = []
+        for family in self.families:
+            lines.append(f'# HELP {family.name} {family.help}')
+            lines.append(f'# TYPE {family.name} {family.kind}')
+            lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -0,0 +1,26 @@
+-- 列表键集分页的复合索引
+-- 列表接口按 (created_at DESC, id DESC) 排序，并用 created_at < X OR (created_at = X AND id < Y) 定位游标
+-- （见 pagination.apply_keyset）。有这些索引时无论翻到多深，数据库都只需沿索引定位，页面延迟保持稳定；
+-- 没有时每页都要对该用户的全部行排序。
+-- 索引方向与查询一致（DESC 默认 NULLS FIRST，与 PostgREST 的 order=created_at.desc 相同）。
+-- CONCURRENTLY 不锁表，但不能在事务中执行：在 SQL 编辑器中逐条执行。
+
+-- 1) 按用户筛选的列表
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_checkins_user_created_id
+    ON checkins (user_id, created_at DESC, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_journals_user_created_id
+    ON journals (user_id, created_at DESC, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_user_created_id
+    ON tasks (user_id, created_at DESC, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_friends_user_created_id
+    ON friends (user_id, created_at DESC, id DESC);
+
+-- 2) 全站列表
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_plaza_posts_created_id
+    ON plaza_posts (created_at DESC, id DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_groups_created_id
+    ON groups (created_at DESC, id DESC);
+
+-- 3) 密室消息仍按页码（OFFSET）分页，按用户和时间排序
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_secrets_user_created
+    ON secrets (user_id, created_at DESC);
@@ -0,0 +1,140 @@
+import os
+import json
+import base64
+
+from supabase_client import quote_value
+from ttl_cache import TTLCache
+
+# 列表接口分页配置
+PAGE_SIZE_DEFAULT = int(os.getenv('PAGE_SIZE_DEFAULT', '20'))
+PAGE_SIZE_MAX = int(os.getenv('PAGE_SIZE_MAX', '100'))
+# PostgREST 计数方式：exact 为 COUNT(*)，planned/estimated 使用查询计划估算，适合大表
+COUNT_MODES = ('exact', 'planned', 'estimated')
+# 总数缓存秒数，0 表示不缓存
+COUNT_CACHE_TTL = float(os.getenv('COUNT_CACHE_TTL', '0'))
+COUNT_CACHE_SIZE = int(os.getenv('COUNT_CACHE_SIZE', '10000'))
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(row, sort_column='created_at', tiebreak_column='id'):
+    """把一页最后一行的 (排序列, id) 编码为不透明游标"""
+    raw = json.dumps([row.get(sort_column), row.get(tiebreak_column)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except Exception:
+        raise CursorError('invalid cursor')
+    # 排序列可以为 NULL（该行 created_at 为空），id 不能为空
+    if not isinstance(value, list) or len(value) != 2 or value[1] is None:
+        raise CursorError('invalid cursor')
+    return value[0], value[1]
+
+
+def page_params(args, default_size=PAGE_SIZE_DEFAULT):
+    """从查询参数读取 (cursor, page_size)；page_size 也接受旧的 limit 参数"""
+    raw_size = args.get('page_size') or args.get('limit')
+    try:
+        size = int(raw_size) if raw_size is not None else default_size
+    except (TypeError, ValueError):
+        size = default_size
+    size = max(1, min(size, PAGE_SIZE_MAX))
+    cursor = args.get('cursor')
+    return (decode_cursor(cursor) if cursor else None), size
+
+
+def page_offset(args, size):
+    """兼容旧客户端的 page 参数（从 1 开始），换算为偏移量；未传时为 0，不合法时抛出 CursorError
+
+    只用于没有 cursor 的请求，深翻页仍按 OFFSET 扫描，响应中的 next_cursor 可用于继续翻页。
+    """
+    raw = args.get('page')
+    if raw is None or raw == '':
+        return 0
+    try:
+        page = int(raw)
+    except (TypeError, ValueError):
+        page = 0
+    if page < 1:
+        raise CursorError('page must be a positive integer')
+    return (page - 1) * size
+
+
+def apply_keyset(query, cursor, size, offset=0, sort_column='created_at', tiebreak_column='id'):
+    """按 (sort_column, id) 倒序的键集分页：从游标之后取 size + 1 行，用多出的一行判断是否还有下一页
+
+    与 OFFSET 不同，无论翻到多深，数据库都只需沿索引定位到游标位置，页面延迟保持稳定
+    （需要 migrations 中的 (user_id, created_at desc, id desc) 等复合索引）。
+    size 为 None 时不限制行数（流式导出）；offset 用于旧的 page 参数。
+    """
+    query.order(sort_column, desc=True).order(tiebreak_column, desc=True)
+    if cursor is not None:
+        last_id = quote_value(cursor[1])
+        if cursor[0] is None:
+            # 倒序时 NULL 排在最前：之后是同为 NULL 且 id 更小的行，以及全部非 NULL 的行
+            query.or_(
+                f'and({sort_column}.is.null,{tiebreak_column}.lt.{last_id}),'
+                f'{sort_column}.not.is.null'
+            )
+        else:
+            value = quote_value(cursor[0])
+            query.or_(
+                f'{sort_column}.lt.{value},'
+                f'and({sort_column}.eq.{value},{tiebreak_column}.lt.{last_id})'
+            )
+    if size is None:
+        return query
+    if offset:
+        return query.range(offset, offset + size)
+    return query.limit(size + 1)
+
+
+def finish_page(rows, size, sort_column='created_at', tiebreak_column='id'):
+    """截取一页数据并生成下一页游标，没有更多数据时游标为 None"""
+    rows = rows or []
+    if len(rows) > size:
+        rows = rows[:size]
+        return rows, encode_cursor(rows[-1], sort_column, tiebreak_column)
+    return rows, None
+
+
+def wants_stream(args):
+    return (args.get('stream') or '').lower() in ('1', 'true', 'yes')
+
+
+def stream_cursor(args):
+    """流式导出时可选的起始游标"""
+    cursor = args.get('cursor')
+    return decode_cursor(cursor) if cursor else None
+
+
+def count_mode(args, default='exact'):
+    """读取 count 参数，不合法时抛出 ValueError"""
+    mode = (args.get('count') or default).lower()
+    if mode not in COUNT_MODES:
+        raise ValueError(f"count must be one of {', '.join(COUNT_MODES)}")
+    return mode
+
+
+# 分页总数的短期缓存：命中时分页查询不再要求 PostgREST 计数
+count_cache = TTLCache(maxsize=COUNT_CACHE_SIZE, ttl=COUNT_CACHE_TTL) if COUNT_CACHE_TTL > 0 else None
+
+
+def cached_total(key):
+    return count_cache.get(key) if count_cache is not None else None
+
+
+def remember_total(key, total):
+    if count_cache is not None and total is not None:
+        count_cache.set(key, total)
+
+
+def forget_total(key):
+    if count_cache is not None:
+        count_cache.pop(key)
@@ -0,0 +1,195 @@
+"""
+按需对单个 Flask 请求做 cProfile，排查生产环境中偶发的慢路由。
+
+- 请求头 X-Profile-Token 与 PROFILE_TOKEN 一致时分析该请求；PROFILE_SAMPLE_RATE 大于 0 时按比例随机抽样
+- 结果写入 PROFILE_DIR（<id>.prof + <id>.json），只保留最近 PROFILE_KEEP 个
+- 同一时刻只分析一个请求，其余请求照常处理，不排队
+- 两者都未配置时 init_app 不注册任何钩子，请求路径上没有额外开销
+"""
+
+import os
+import re
+import hmac
+import time
+import uuid
+import random
+import tempfile
+import threading
+
+import json_codec
+
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'aikada_profiles'))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '50'))
+
+TOKEN_HEADER = 'X-Profile-Token'
+ID_HEADER = 'X-Profile-Id'
+
+# 管理接口自身不分析，否则查看结果时会把真正要看的结果轮转掉
+ADMIN_PREFIX = '/admin/profiles'
+
+_ID_PATTERN = re.compile(r'^\d{8}T\d{12}-[0-9a-f]{6}$')
+
+
+def _new_id():
+    """按时间排序的 id（精确到微秒），目录按文件名排序即为时间顺序"""
+    now = time.time()
+    return time.strftime('%Y%m%dT%H%M%S', time.localtime(now)) + f'{int(now % 1 * 1e6):06d}-{uuid.uuid4().hex[:6]}'
+
+
+class RequestProfiler:
+    """请求级 cProfile：before_request 开始、teardown_request 结束并落盘"""
+
+    SORT_KEYS = ('cumulative', 'tottime', 'ncalls')
+
+    def __init__(self, token=PROFILE_TOKEN, sample_rate=PROFILE_SAMPLE_RATE, directory=PROFILE_DIR, keep=PROFILE_KEEP):
+        self.token = token
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.keep = keep
+        self.enabled = bool(token) or sample_rate > 0
+        # cProfile 在 3.12+ 是全进程唯一的，统一只允许一个请求同时被分析
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+        self.profiled = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def authorized(self, headers):
+        """请求头中的令牌是否正确；未配置 PROFILE_TOKEN 时一律拒绝"""
+        supplied = headers.get(TOKEN_HEADER, '')
+        return bool(self.token) and bool(supplied) and hmac.compare_digest(supplied, self.token)
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _wanted(self, headers):
+        if self.token and TOKEN_HEADER in headers:
+            return self.authorized(headers)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _before_request(self):
+        from flask import request
+        if request.path.startswith(ADMIN_PREFIX) or not self._wanted(request.headers):
+            return
+        if not self._busy.acquire(blocking=False):
+            with self._lock:
+                self.skipped += 1
+            return
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 进程已在其他分析器下运行
+            self._busy.release()
+            with self._lock:
+                self.skipped += 1
+            return
+        request.environ['profiler.session'] = (_new_id(), profile, time.perf_counter())
+
+    def _after_request(self, response):
+        from flask import request
+        session = request.environ.get('profiler.session')
+        if session is not None:
+            response.headers[ID_HEADER] = session[0]
+            request.environ['profiler.status'] = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        from flask import request
+        session = request.environ.pop('profiler.session', None)
+        if session is None:
+            return
+        profile_id, profile, start = session
+        profile.disable()
+        duration = time.perf_counter() - start
+        self._busy.release()
+        meta = {
+            'id': profile_id,
+            'method': request.method,
+            'path': request.path,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'status': request.environ.get('profiler.status', 500),
+            'duration_ms': round(duration * 1000, 1),
+            'created_at': time.time(),
+        }
+        try:
+            self._write(profile, meta)
+        except OSError as e:
+            print(f"⚠️ 写入性能分析结果失败: {e}")
+            with self._lock:
+                self.errors += 1
+            return
+        with self._lock:
+            self.profiled += 1
+
+    def _write(self, profile, meta):
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, meta['id'])
+        profile.dump_stats(base + '.prof.tmp')
+        os.replace(base + '.prof.tmp', base + '.prof')
+        with open(base + '.json', 'wb') as f:
+            f.write(json_codec.dumps(meta))
+        self._rotate()
+
+    def _rotate(self):
+        ids = sorted(name[:-len('.json')] for name in os.listdir(self.directory) if name.endswith('.json'))
+        for profile_id in ids[:-self.keep] if self.keep > 0 else ids:
+            for ext in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + ext))
+                except FileNotFoundError:
+                    pass
+
+    def recent(self, limit=None):
+        """最近的分析结果（新的在前）"""
+        try:
+            names = sorted((n for n in os.listdir(self.directory) if n.endswith('.json')), reverse=True)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names[:limit]:
+            try:
+                with open(os.path.join(self.directory, name), 'rb') as f:
+                    entries.append(json_codec.loads(f.read()))
+            except (OSError, ValueError):
+                continue
+        return entries
+
+    def profile_path(self, profile_id):
+        """<id>.prof 的路径；id 不合法或文件不存在时返回 None"""
+        if not _ID_PATTERN.match(profile_id):
+            return None
+        path = os.path.join(self.directory, profile_id + '.prof')
+        return path if os.path.exists(path) else None
+
+    def summary(self, profile_id, sort='cumulative', top=40):
+        """pstats 文本报告，sort 为 SORT_KEYS 之一"""
+        import io
+        import pstats
+        path = self.profile_path(profile_id)
+        if path is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats(sort).print_stats(top)
+        return out.getvalue()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'token': bool(self.token),
+                'sample_rate': self.sample_rate,
+                'profiled': self.profiled,
+                'skipped': self.skipped,
+                'errors': self.errors,
+            }
+
+
+profiler = RequestProfiler()
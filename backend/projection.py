@@ -0,0 +1,142 @@
+"""
+fields= 查询参数：把客户端要求的字段映射为 PostgREST 的 select 列表
+
+    fields=id,title,created_at
+    fields=id,description,users(name,avatar_url)   # 嵌入关联表
+    fields=id,users                                # 嵌入关联表的全部允许字段
+
+只允许白名单中的列和嵌入资源，未传 fields 时保持原来的 select。
+"""
+
+import json_codec
+
+# 每张表允许客户端选择的列，以及可嵌入的关联表（需存在外键）和其中允许的列。
+# README_API_SETUP.md 中有建表语句的表（users、checkins、badges、groups、plaza_posts、friends）与建表语句一致，
+# 其余表按后端写入的列；数据库改列时同步更新这里。
+FIELD_ALLOWLISTS = {
+    'users': {
+        'columns': ('id', 'name', 'age', 'grade', 'avatar_url', 'interests', 'created_at'),
+    },
+    'user_stats': {
+        'columns': ('user_id', 'total_checkins', 'checkin_streak', 'total_journals',
+                    'total_tasks_completed'),
+    },
+    'checkins': {
+        'columns': ('id', 'user_id', 'activity_type', 'description', 'photos', 'location',
+                    'geolocation', 'created_at'),
+        'embeds': {'users': ('id', 'name', 'avatar_url')},
+    },
+    'user_badges': {
+        'columns': ('id', 'user_id', 'badge_id', 'unlocked_at'),
+        'embeds': {'badges': ('id', 'name', 'description', 'icon_url')},
+    },
+    'badges': {
+        'columns': ('id', 'user_id', 'name', 'description', 'icon_url', 'earned_at'),
+    },
+    'friends': {
+        'columns': ('id', 'user_id', 'friend_id', 'status', 'created_at'),
+    },
+    'groups': {
+        'columns': ('id', 'name', 'description', 'leader_id', 'created_at'),
+    },
+    'plaza_posts': {
+        'columns': ('id', 'user_id', 'content', 'photos', 'created_at'),
+    },
+    'tasks': {
+        'columns': ('id', 'user_id', 'title', 'description', 'due_date', 'status', 'priority',
+                    'category', 'reminder', 'created_at', 'updated_at'),
+    },
+    'user_task_stats': {
+        'columns': ('user_id', 'total_tasks', 'completed_tasks', 'pending_tasks'),
+    },
+    'journals': {
+        'columns': ('id', 'user_id', 'title', 'content', 'mood', 'weather', 'tags', 'images',
+                    'is_public', 'created_at', 'updated_at'),
+    },
+    'secrets': {
+        'columns': ('id', 'user_id', 'content', 'image_url', 'created_at', 'updated_at'),
+    },
+}
+
+# 键集分页依赖这两列生成游标
+KEYSET_COLUMNS = ('created_at', 'id')
+
+
+# PostgREST 拒绝 select 的错误码：列不存在 / 找不到嵌入的关联关系
+_SCHEMA_ERRORS = ('42703', 'PGRST200')
+
+
+class FieldsError(ValueError):
+    pass
+
+
+def raise_for_fields(error):
+    """白名单与数据库不一致时 PostgREST 拒绝查询：转换为 FieldsError，路由返回 400 而不是 500"""
+    if not error:
+        return
+    text = str(error)
+    if not any(code in text for code in _SCHEMA_ERRORS):
+        return
+    try:
+        text = json_codec.loads(text).get('message') or text
+    except (ValueError, AttributeError):
+        pass
+    raise FieldsError(f'unknown field: {text}')
+
+
+def _split_top_level(expr):
+    """按最外层逗号切分，括号内的逗号属于嵌入资源"""
+    items, depth, start = [], 0, 0
+    for i, ch in enumerate(expr):
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+            if depth < 0:
+                raise FieldsError('invalid fields: unbalanced parentheses')
+        elif ch == ',' and depth == 0:
+            items.append(expr[start:i])
+            start = i + 1
+    if depth != 0:
+        raise FieldsError('invalid fields: unbalanced parentheses')
+    items.append(expr[start:])
+    return [item.strip() for item in items if item.strip()]
+
+
+def select_columns(args, table, default='*', required=()):
+    """根据 fields 参数生成 select 列表；不合法时抛出 FieldsError
+
+    required 中的列总会被选中（如分页游标需要的 created_at、id）。
+    """
+    raw = args.get('fields')
+    if not raw:
+        return default
+    spec = FIELD_ALLOWLISTS[table]
+    columns = spec['columns']
+    embeds = spec.get('embeds', {})
+
+    selected = []
+    for item in _split_top_level(raw):
+        name, paren, rest = item.partition('(')
+        name = name.strip()
+        if paren:
+            if name not in embeds:
+                raise FieldsError(f'unknown embedded resource: {name}')
+            sub = [c.strip() for c in rest[:-1].split(',') if c.strip()] if rest.endswith(')') else []
+            unknown = [c for c in sub if c not in embeds[name]]
+            if not sub or unknown:
+                raise FieldsError(f"invalid fields for {name}: {','.join(unknown) or rest}")
+            entry = f"{name}({','.join(sub)})"
+        elif name in embeds:
+            entry = f"{name}({','.join(embeds[name])})"
+        elif name in columns:
+            entry = name
+        else:
+            raise FieldsError(f'unknown field: {name}')
+        if entry not in selected:
+            selected.append(entry)
+
+    for column in required:
+        if column not in selected:
+            selected.append(column)
+    return ','.join(selected)
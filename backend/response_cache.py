@@ -0,0 +1,83 @@
+import os
+import threading
+
+from ttl_cache import TTLCache
+
+# 读穿缓存配置：表名=秒数，只有列出的表可以缓存
+RESPONSE_CACHE_TTLS = os.getenv('RESPONSE_CACHE_TTLS', 'badges=300,groups=60,users=30')
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '5000'))
+
+
+def _parse_ttls(spec):
+    ttls = {}
+    for item in spec.split(','):
+        name, _, value = item.partition('=')
+        try:
+            ttl = float(value)
+        except ValueError:
+            continue
+        if name.strip() and ttl > 0:
+            ttls[name.strip()] = ttl
+    return ttls
+
+
+class ResponseCache:
+    """按表配置 TTL 的查询结果缓存，写入同一张表时整表失效
+
+    失效通过每张表的代数实现：写入时代数加一，旧代数的条目不再可达，由 LRU 自然淘汰。
+    查询开始时记录代数，若期间发生写入，结果会存到旧代数下，不会把旧数据当成新数据。
+
+    store 只需提供 get/set(ttl=)/stats，可替换为其他实现（如共享缓存）。
+    多进程部署时失效只作用于当前进程，其他进程最多滞后一个 TTL。
+    """
+
+    def __init__(self, ttls=None, maxsize=RESPONSE_CACHE_SIZE, store=None):
+        self.ttls = _parse_ttls(RESPONSE_CACHE_TTLS) if ttls is None else dict(ttls)
+        self.store = store or TTLCache(maxsize=maxsize, ttl=max(self.ttls.values() or [60]))
+        self._generations = {}
+        self._table_stats = {}   # table -> [hits, misses, invalidations]
+        self._lock = threading.Lock()
+
+    def enabled_for(self, table):
+        return table in self.ttls
+
+    def generation(self, table):
+        return self._generations.get(table, 0)
+
+    def _record(self, table, index):
+        with self._lock:
+            stats = self._table_stats.setdefault(table, [0, 0, 0])
+            stats[index] += 1
+
+    def get(self, table, key, generation):
+        value = self.store.get((table, generation, key))
+        self._record(table, 0 if value is not None else 1)
+        return value
+
+    def set(self, table, key, generation, value):
+        self.store.set((table, generation, key), value, ttl=self.ttls[table])
+
+    def invalidate(self, table):
+        if table not in self.ttls:
+            return
+        with self._lock:
+            self._generations[table] = self._generations.get(table, 0) + 1
+            self._table_stats.setdefault(table, [0, 0, 0])[2] += 1
+
+    def stats(self):
+        tables = {}
+        with self._lock:
+            items = [(t, list(v)) for t, v in self._table_stats.items()]
+        for table, (hits, misses, invalidations) in items:
+            total = hits + misses
+            tables[table] = {
+                'ttl': self.ttls.get(table),
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': round(hits / total, 4) if total else 0.0,
+                'invalidations': invalidations,
+            }
+        return {'tables': tables, 'store': self.store.stats()}
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,323 @@
+"""
+可续传的分块上传：先创建上传会话，再按编号上传各块（可重传、可乱序），随时查询进度，收齐后完成上传。
+
+各块以文件形式保存在本地目录（同一主机上的多个 worker 共享），完成时由 ChunkReader
+按顺序流式读出交给 Storage，不再拼接出一份完整文件。长时间没有进展的会话会被清理。
+"""
+
+import os
+import re
+import time
+import uuid
+import shutil
+import hashlib
+import tempfile
+import threading
+
+import json_codec
+
+# 分块上传配置
+UPLOAD_SESSION_DIR = os.getenv('UPLOAD_SESSION_DIR', os.path.join(tempfile.gettempdir(), 'aikada_uploads'))
+UPLOAD_SESSION_TTL = float(os.getenv('UPLOAD_SESSION_TTL', str(24 * 3600)))   # 最后一次活动后保留的秒数
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(4 * 1024 * 1024)))  # 默认块大小，也是上限
+UPLOAD_SESSION_MAX_BYTES = int(os.getenv('UPLOAD_SESSION_MAX_BYTES', str(200 * 1024 * 1024)))
+
+MIN_CHUNK_SIZE = 64 * 1024
+_COPY_BUFFER = 64 * 1024
+_SWEEP_INTERVAL = 300
+_SESSION_ID = re.compile(r'^[0-9a-f]{32}$')
+_FINALIZING = '.finalizing'
+
+
+class UploadSessionError(ValueError):
+    """会话参数或状态错误，status 为对应的 HTTP 状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _part_name(index):
+    return f'part-{index:06d}'
+
+
+def _copy_limited(stream, f, limit):
+    """把 stream 分块写入 f，超过 limit 字节时抛出 413，返回写入的字节数"""
+    written = 0
+    while True:
+        data = stream.read(_COPY_BUFFER)
+        if not data:
+            return written
+        written += len(data)
+        if written > limit:
+            raise UploadSessionError(f'chunk exceeds {limit} bytes', 413)
+        f.write(data)
+
+
+class ChunkReader:
+    """按顺序读出会话的各块，表现为一个只读、可 seek 的文件对象"""
+
+    def __init__(self, directory, chunk_size, chunks, size):
+        self._paths = [os.path.join(directory, _part_name(i)) for i in range(chunks)]
+        self.chunk_size = chunk_size
+        self.size = size
+        self._pos = 0
+        self._index = None
+        self._file = None
+
+    def read(self, n=-1):
+        remaining = self.size - self._pos if n is None or n < 0 else min(n, self.size - self._pos)
+        out = []
+        while remaining > 0:
+            index, offset = divmod(self._pos, self.chunk_size)
+            if index != self._index:
+                self.close()
+                self._file = open(self._paths[index], 'rb')
+                self._index = index
+            self._file.seek(offset)
+            data = self._file.read(min(remaining, self.chunk_size - offset))
+            if not data:
+                break
+            out.append(data)
+            self._pos += len(data)
+            remaining -= len(data)
+        return b''.join(out)
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += self.size
+        self._pos = max(0, min(offset, self.size))
+        return self._pos
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class UploadSessions:
+    """本地目录中的上传会话：<root>/<upload_id>/meta.json 与 part-NNNNNN
+
+    会话状态全部在磁盘上（已收到哪些块由块文件是否存在决定），各 worker 进程看到的进度一致。
+    块先写入临时文件再改名，重传同一块是幂等的。
+    """
+
+    def __init__(self, root=UPLOAD_SESSION_DIR, ttl=UPLOAD_SESSION_TTL, chunk_size=UPLOAD_CHUNK_SIZE,
+                 max_bytes=UPLOAD_SESSION_MAX_BYTES):
+        self.root = root
+        self.ttl = ttl
+        self.chunk_size = max(MIN_CHUNK_SIZE, chunk_size)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self.created = 0
+        self.completed = 0
+        self.aborted = 0
+        self.expired = 0
+        self.chunks_received = 0
+        self.bytes_received = 0
+
+    def _count(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def _dir(self, upload_id):
+        if not _SESSION_ID.match(upload_id or ''):
+            raise UploadSessionError('upload session not found', 404)
+        return os.path.join(self.root, upload_id)
+
+    def create(self, filename, content_type, size, user_id, chunk_size=None, sha256=None):
+        """创建会话，返回会话信息（含 upload_id、块大小和块数）"""
+        self.sweep()
+        if not isinstance(size, int) or size <= 0:
+            raise UploadSessionError('size must be a positive integer')
+        if size > self.max_bytes:
+            raise UploadSessionError(f'file exceeds {self.max_bytes} bytes', 413)
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+        if not isinstance(chunk_size, int) or not MIN_CHUNK_SIZE <= chunk_size <= self.chunk_size:
+            raise UploadSessionError(f'chunk_size must be between {MIN_CHUNK_SIZE} and {self.chunk_size}')
+        if sha256 is not None and not re.match(r'^[0-9a-fA-F]{64}$', str(sha256)):
+            raise UploadSessionError('sha256 must be a hex digest')
+
+        upload_id = uuid.uuid4().hex
+        meta = {
+            'upload_id': upload_id,
+            'filename': filename,
+            'content_type': content_type,
+            'size': size,
+            'chunk_size': chunk_size,
+            'chunks': -(-size // chunk_size),
+            'sha256': sha256.lower() if sha256 else None,
+            'user_id': user_id,
+            'created_at': time.time(),
+        }
+        directory = self._dir(upload_id)
+        os.makedirs(directory)
+        with open(os.path.join(directory, 'meta.json'), 'wb') as f:
+            f.write(json_codec.dumps(meta))
+        self._count('created')
+        return self.progress(upload_id)
+
+    def load(self, upload_id):
+        directory = self._dir(upload_id)
+        try:
+            last_active = os.stat(directory).st_mtime
+            with open(os.path.join(directory, 'meta.json'), 'rb') as f:
+                meta = json_codec.loads(f.read())
+        except FileNotFoundError:
+            if os.path.isdir(directory + _FINALIZING):
+                raise UploadSessionError('upload is being finalized', 409)
+            raise UploadSessionError('upload session not found', 404)
+        if time.time() - last_active > self.ttl:
+            self._remove(directory, 'expired')
+            raise UploadSessionError('upload session expired', 404)
+        return meta
+
+    def _expected_length(self, meta, index):
+        if index == meta['chunks'] - 1:
+            return meta['size'] - index * meta['chunk_size']
+        return meta['chunk_size']
+
+    def write_chunk(self, upload_id, index, stream, offset=None):
+        """保存第 index 块（从 0 开始）；offset 若提供必须等于 index * chunk_size"""
+        meta = self.load(upload_id)
+        if not 0 <= index < meta['chunks']:
+            raise UploadSessionError(f"chunk index must be between 0 and {meta['chunks'] - 1}")
+        if offset is not None and offset != index * meta['chunk_size']:
+            raise UploadSessionError(f"offset for chunk {index} must be {index * meta['chunk_size']}")
+        expected = self._expected_length(meta, index)
+
+        directory = self._dir(upload_id)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        except FileNotFoundError:
+            raise UploadSessionError('upload is being finalized', 409)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                written = _copy_limited(stream, f, expected)
+            if written != expected:
+                raise UploadSessionError(f'chunk {index} must be {expected} bytes, got {written}')
+            os.replace(tmp_path, os.path.join(directory, _part_name(index)))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        os.utime(directory)
+        self._count('chunks_received')
+        self._count('bytes_received', written)
+        return self.progress(upload_id, meta)
+
+    def progress(self, upload_id, meta=None):
+        """返回会话信息和进度：已收到的字节数、缺少的块编号"""
+        meta = meta or self.load(upload_id)
+        directory = self._dir(upload_id)
+        present = set(os.listdir(directory))
+        received = [i for i in range(meta['chunks']) if _part_name(i) in present]
+        missing = [i for i in range(meta['chunks']) if _part_name(i) not in present]
+        received_bytes = sum(self._expected_length(meta, i) for i in received)
+        return dict(
+            meta,
+            received_bytes=received_bytes,
+            received_chunks=len(received),
+            missing_chunks=missing,
+            complete=not missing,
+            expires_at=os.stat(directory).st_mtime + self.ttl,
+        )
+
+    def claim(self, upload_id):
+        """开始完成上传：检查块已收齐，把会话目录改名锁定，返回 (meta, 锁定后的目录)"""
+        info = self.progress(upload_id)
+        if not info['complete']:
+            raise UploadSessionError(f"{len(info['missing_chunks'])} chunks missing", 409)
+        directory = self._dir(upload_id)
+        try:
+            os.rename(directory, directory + _FINALIZING)
+        except FileNotFoundError:
+            raise UploadSessionError('upload is being finalized', 409)
+        return info, directory + _FINALIZING
+
+    def release(self, upload_id):
+        """完成上传失败，恢复会话以便重试"""
+        directory = self._dir(upload_id)
+        os.rename(directory + _FINALIZING, directory)
+        os.utime(directory)
+
+    def reader(self, meta, directory):
+        return ChunkReader(directory, meta['chunk_size'], meta['chunks'], meta['size'])
+
+    def digest(self, meta, directory):
+        """按顺序读一遍各块，返回 SHA-256"""
+        h = hashlib.sha256()
+        with self.reader(meta, directory) as reader:
+            while True:
+                data = reader.read(_COPY_BUFFER * 16)
+                if not data:
+                    break
+                h.update(data)
+        return h.hexdigest()
+
+    def finish(self, directory, outcome='completed'):
+        """删除已锁定的会话目录"""
+        self._remove(directory, outcome)
+
+    def abort(self, upload_id):
+        self.load(upload_id)
+        self._remove(self._dir(upload_id), 'aborted')
+
+    def _remove(self, directory, outcome):
+        shutil.rmtree(directory, ignore_errors=True)
+        self._count(outcome)
+
+    def sweep(self, force=False):
+        """清理超过 ttl 没有活动的会话（最多每 5 分钟一次）"""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_sweep < _SWEEP_INTERVAL:
+                return
+            self._last_sweep = now
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return
+        for name in names:
+            path = os.path.join(self.root, name)
+            try:
+                if now - os.stat(path).st_mtime > self.ttl:
+                    self._remove(path, 'expired')
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        try:
+            active = sum(1 for name in os.listdir(self.root) if _SESSION_ID.match(name))
+        except FileNotFoundError:
+            active = 0
+        return {
+            'active': active,
+            'chunk_size': self.chunk_size,
+            'ttl': self.ttl,
+            'created': self.created,
+            'completed': self.completed,
+            'aborted': self.aborted,
+            'expired': self.expired,
+            'chunks_received': self.chunks_received,
+            'bytes_received': self.bytes_received,
+        }
+
+
+upload_sessions = UploadSessions()
@@ -1,6 +1,13 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request
 import datetime
 import os
+from pagination import (
+    CursorError, page_params, page_offset, apply_keyset, finish_page, wants_stream, stream_cursor,
+    count_mode, cached_total, remember_total, forget_total
+)
+from projection import FieldsError, KEYSET_COLUMNS, select_columns, raise_for_fields
+from etags import conditional
+import json_codec
 # 使用自定义的 Supabase 客户端（requests/urllib 实现）
 
 # 创建API蓝图
@@ -13,6 +20,41 @@ def init_supabase(supabase_client):
     """初始化Supabase客户端"""
     global supabase
     supabase = supabase_client
+    from geocode_worker import backfill
+    backfill.bind(supabase_client)
+
+def keyset_page(query):
+    """对列表查询做 (created_at, id) 键集分页，返回响应 JSON；游标无效时抛出 CursorError"""
+    cursor, size = page_params(request.args)
+    offset = page_offset(request.args, size) if cursor is None else 0
+    response = apply_keyset(query, cursor, size, offset).execute()
+    if getattr(response, 'error', None):
+        raise_for_fields(response.error)
+        raise RuntimeError(response.error)
+    rows, next_cursor = finish_page(response.data, size)
+    return {'data': rows, 'next_cursor': next_cursor, 'page_size': size}
+
+def stream_rows(query):
+    """stream=1：不分页，把上游 JSON 数组按块原样转发，包在 {"data": ...} 中
+
+    不解析也不重新序列化，内存占用与行数无关；可带 cursor 从游标之后开始导出。
+    """
+    status, hdrs, body = apply_keyset(query, stream_cursor(request.args), None).stream()
+    if not 200 <= status < 300:
+        error = body.read()
+        raise_for_fields(error.decode('utf-8'))
+        raise RuntimeError(error.decode('utf-8') if error else f'status {status}')
+
+    def generate():
+        yield b'{"data":'
+        for chunk in body:
+            yield chunk
+        yield b'}'
+
+    response = Response(generate(), mimetype='application/json')
+    # 客户端中途断开或生成器未启动时同样归还上游连接
+    response.call_on_close(body.close)
+    return response
 
 # =====================
 # 0. 用户系统 (User System)
@@ -20,12 +62,17 @@ def init_supabase(supabase_client):
 
 # 获取用户信息
 @api_bp.route('/users/<user_id>', methods=['GET'])
+@conditional('users')
 def get_user(user_id):
     try:
-        response = supabase.table('users').select('*').eq('id', user_id).execute()
+        columns = select_columns(request.args, 'users')
+        response = supabase.table('users').select(columns).eq('id', user_id).cache().execute()
+        raise_for_fields(response.error)
         if not response.data:
             return jsonify({'error': 'User not found'}), 404
         return jsonify({'data': response.data[0]}), 200
+    except FieldsError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -40,7 +87,7 @@ def update_user(user_id):
     try:
         # 添加更新时间
         if 'updated_at' not in data:
-            data['updated_at'] = datetime.datetime.now().isoformat()
+            data['updated_at'] = datetime.datetime.now()
         
         response = supabase.table('users').update(data).eq('id', user_id).execute()
         return jsonify({'data': response.data[0]}), 200
@@ -49,12 +96,17 @@ def update_user(user_id):
 
 # 获取用户统计信息
 @api_bp.route('/users/<user_id>/stats', methods=['GET'])
+@conditional('user_stats', 'checkins', 'journals', 'tasks')
 def get_user_stats(user_id):
     try:
-        response = supabase.table('user_stats').select('*').eq('user_id', user_id).execute()
+        columns = select_columns(request.args, 'user_stats')
+        response = supabase.table('user_stats').select(columns).eq('user_id', user_id).execute()
+        raise_for_fields(response.error)
         if not response.data:
             return jsonify({'data': {}}), 200
         return jsonify({'data': response.data[0]}), 200
+    except FieldsError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -71,11 +123,90 @@ def get_checkins():
         return jsonify({'error': 'user_id is required'}), 400
     
     try:
-        response = supabase.table('checkins').select('*').eq('user_id', user_id).execute()
-        return jsonify({'data': response.data}), 200
+        columns = select_columns(request.args, 'checkins', required=KEYSET_COLUMNS)
+        query = supabase.table('checkins').select(columns).eq('user_id', user_id)
+        if wants_stream(request.args):
+            return stream_rows(query)
+        return jsonify(keyset_page(query)), 200
+    except (CursorError, FieldsError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def placeholder_user(user_id):
+    """外键约束要求用户存在时使用的占位用户"""
+    return {
+        'id': user_id,
+        'name': '测试用户',
+        'created_at': datetime.datetime.now()
+    }
+
+def checkin_row(data, loc):
+    """根据请求数据和规范化后的定位构造 checkins 行"""
+    # 兼容你当前的表结构：
+    # - description(TEXT) 用于记录内容，可选
+    # - photos(TEXT[]) 仅当存在图片时写入
+    # - geolocation(JSONB) 存完整定位
+    # - location(TEXT) 存地址字符串
+    checkin_data = {
+        'user_id': data['user_id'],
+        'description': data.get('content'),
+        'geolocation': loc,
+        'location': (loc.get('address') if isinstance(loc, dict) else None),
+        'created_at': datetime.datetime.now()
+    }
+    images = data.get('images')
+    if isinstance(images, list) and len(images) > 0:
+        checkin_data['photos'] = images
+    return checkin_data
+
+def prepare_location(loc_in):
+    """规范化定位并尽量在本地补全地址，返回 (loc, 是否需要后台回填地址)
+
+    本地地名库或缓存能给出地址时直接填入；否则交给后台回填，不在请求中等待远程服务。
+    """
+    from geocoding import clamp_location, cached_address, reverse_geocode
+    from geocode_worker import backfill
+    loc = clamp_location(loc_in) if isinstance(loc_in, dict) else None
+    if not loc or loc.get('address'):
+        return loc, False
+    addr = cached_address(loc['latitude'], loc['longitude'])
+    if not addr and not backfill.enabled:
+        addr = reverse_geocode(loc['latitude'], loc['longitude'])
+    if addr:
+        loc['address'] = addr
+        return loc, False
+    return loc, backfill.enabled
+
+def inserted_row(response, fallback):
+    """取出 insert 返回的第一行，没有返回内容时使用提交的数据"""
+    if isinstance(response.data, list) and len(response.data) > 0:
+        return response.data[0]
+    if isinstance(response.data, dict):
+        return response.data
+    return fallback
+
+def insert_checkin(checkin_data):
+    """乐观插入打卡，返回 (response, 用户错误信息)
+
+    用户几乎总是已存在，因此不先查询 users 表；只有外键约束失败时才创建占位用户并重试。
+    """
+    from user_cache import known_users, is_fk_violation, is_unique_violation
+    user_id = checkin_data['user_id']
+    response = supabase.table('checkins').insert(checkin_data).execute()
+    if getattr(response, 'error', None) and is_fk_violation(response.error):
+        known_users.record_fk_fallback(user_id)
+        uins = supabase.table('users').insert(placeholder_user(user_id)).execute()
+        # 并发请求可能已经创建了同一个占位用户
+        if getattr(uins, 'error', None) and not is_unique_violation(uins.error):
+            return response, f"用户不存在且创建失败: {uins.error}"
+        response = supabase.table('checkins').insert(checkin_data).execute()
+    elif not getattr(response, 'error', None):
+        known_users.record_saved()
+    if not getattr(response, 'error', None):
+        known_users.add(user_id)
+    return response, None
+
 # 创建新的打卡记录
 @api_bp.route('/checkins', methods=['POST'])
 def create_checkin():
@@ -86,56 +217,163 @@ def create_checkin():
         return jsonify({'error': 'user_id is required'}), 400
     
     try:
-        from geocoding import clamp_location, reverse_geocode
-        # 确保用户存在，否则尝试创建一个占位用户以通过外键约束
-        try:
-            ures = supabase.table('users').select('id').eq('id', data['user_id']).execute()
-            if not ures.data:
-                placeholder_user = {
-                    'id': data['user_id'],
-                    'name': '测试用户',
-                    'created_at': datetime.datetime.now().isoformat()
-                }
-                uins = supabase.table('users').insert(placeholder_user).execute()
-                if getattr(uins, 'error', None):
-                    return jsonify({'error': f"用户不存在且创建失败: {uins.error}"}), 400
-        except Exception as ue:
-            # 如果用户表存在非空约束导致创建失败，返回明确错误
-            return jsonify({'error': f"用户不存在，请在 users 表创建该用户或设置有效 user_id。详情: {str(ue)}"}), 400
-
-        loc_in = data.get('location') or {}
-        loc = clamp_location(loc_in) if isinstance(loc_in, dict) else None
-        if loc and not loc.get('address'):
-            addr = reverse_geocode(loc['latitude'], loc['longitude'])
-            if addr:
-                loc['address'] = addr
-        # 兼容你当前的表结构：
-        # - description(TEXT) 用于记录内容，可选
-        # - photos(TEXT[]) 仅当存在图片时写入
-        # - geolocation(JSONB) 存完整定位
-        # - location(TEXT) 存地址字符串
-        checkin_data = {
-            'user_id': data['user_id'],
-            'description': data.get('content'),
-            'geolocation': loc,
-            'location': (loc.get('address') if isinstance(loc, dict) else None),
-            'created_at': datetime.datetime.now().isoformat()
-        }
-        images = data.get('images')
-        if isinstance(images, list) and len(images) > 0:
-            checkin_data['photos'] = images
-        
-        response = supabase.table('checkins').insert(checkin_data).execute()
+        loc, address_pending = prepare_location(data.get('location') or {})
+        checkin_data = checkin_row(data, loc)
+        response, user_error = insert_checkin(checkin_data)
+        if user_error:
+            return jsonify({'error': user_error}), 400
         if getattr(response, 'error', None):
             return jsonify({'error': response.error}), 500
-        inserted = None
-        if isinstance(response.data, list) and len(response.data) > 0:
-            inserted = response.data[0]
-        elif isinstance(response.data, dict):
-            inserted = response.data
-        else:
-            inserted = checkin_data
-        return jsonify({'data': inserted}), 201
+        inserted = inserted_row(response, checkin_data)
+        payload = {'data': inserted}
+        if address_pending:
+            # 地址稍后由后台回填到 location 和 geolocation.address
+            from geocode_worker import backfill
+            payload['address_pending'] = backfill.submit(inserted.get('id'), loc)
+        return jsonify(payload), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 批量创建打卡记录（老师带队出行时一次提交整班的打卡）
+CHECKIN_BATCH_MAX_ITEMS = int(os.getenv('CHECKIN_BATCH_MAX_ITEMS', '500'))
+CHECKIN_BATCH_CHUNK_SIZE = int(os.getenv('CHECKIN_BATCH_CHUNK_SIZE', '100'))
+
+def _chunks(items, size):
+    size = max(1, size)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def ensure_users(user_ids):
+    """批量确认用户存在，缺失的用户批量创建占位用户；返回 {user_id: 错误信息}"""
+    from user_cache import known_users
+    # 已知存在的用户不再查询
+    unknown = [uid for uid in user_ids if not known_users.is_known(uid)]
+    if len(unknown) < len(user_ids):
+        known_users.record_saved(len(user_ids) - len(unknown))
+    user_ids = unknown
+    existing = set()
+    for chunk in _chunks(user_ids, CHECKIN_BATCH_CHUNK_SIZE):
+        res = supabase.table('users').select('id').in_('id', chunk).execute()
+        if getattr(res, 'error', None):
+            return {uid: f"查询用户失败: {res.error}" for uid in user_ids}
+        existing.update(str(row.get('id')) for row in (res.data or []))
+    missing = [uid for uid in user_ids if str(uid) not in existing]
+    errors = {}
+    for chunk in _chunks(missing, CHECKIN_BATCH_CHUNK_SIZE):
+        # 并发请求可能刚创建了其中部分用户：已存在的行跳过，否则一条 23505 会让整批插入回滚
+        uins = supabase.table('users').insert([placeholder_user(uid) for uid in chunk]) \
+            .ignore_duplicates('id').execute()
+        if getattr(uins, 'error', None):
+            errors.update({uid: f"用户不存在且创建失败: {uins.error}" for uid in chunk})
+    # 只记住确认存在的用户（查询到的、新插入或已存在而跳过的）
+    for uid in user_ids:
+        if uid not in errors:
+            known_users.add(uid)
+    return errors
+
+# 某一行的数据导致整批回滚：PostgREST 对约束和类型错误返回 400 / 409，错误码 23xxx 为约束失败
+ROW_ERROR_STATUSES = (400, 409)
+
+def is_row_error(response):
+    if getattr(response, 'status', None) in ROW_ERROR_STATUSES:
+        return True
+    try:
+        code = json_codec.loads(str(response.error)).get('code')
+    except (ValueError, AttributeError):
+        return False
+    return str(code or '').startswith('23')
+
+def insert_checkin_rows(entries):
+    """批量插入打卡，返回 [(条目, 插入的行, 错误信息)]，entries 为 [(index, row, loc, address_pending)]
+
+    PostgREST 的多行插入是一个事务，一行出错整批回滚：因某一行的数据失败时对半拆分重试，
+    只有出错的行报告各自的错误，其余行照常插入。上游故障（5xx、连接错误等）不拆分，
+    整批报告同一个错误，避免对已经不可用的上游成倍重试。
+    """
+    from user_cache import known_users, is_fk_violation
+    try:
+        response = supabase.table('checkins').insert([row for _, row, _, _ in entries]).execute()
+    except Exception as e:
+        return [(entry, None, str(e)) for entry in entries]
+    if not getattr(response, 'error', None):
+        returned = response.data if isinstance(response.data, list) else []
+        return [(entry, returned[pos] if pos < len(returned) else entry[1], None)
+                for pos, entry in enumerate(entries)]
+    if not is_row_error(response):
+        return [(entry, None, response.error) for entry in entries]
+    if len(entries) > 1:
+        middle = len(entries) // 2
+        return insert_checkin_rows(entries[:middle]) + insert_checkin_rows(entries[middle:])
+    if is_fk_violation(response.error):
+        # 缓存中的用户已被删除：忘掉该用户，下次请求重新确认
+        known_users.record_fk_fallback(entries[0][1]['user_id'])
+    return [(entries[0], None, response.error)]
+
+@api_bp.route('/checkins/batch', methods=['POST'])
+def create_checkins_batch():
+    from geocoding import clamp_location
+    from geocode_worker import backfill
+    data = request.get_json(silent=True)
+    items = data.get('checkins') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'checkins array is required'}), 400
+    if len(items) > CHECKIN_BATCH_MAX_ITEMS:
+        return jsonify({'error': f'too many checkins (max {CHECKIN_BATCH_MAX_ITEMS})'}), 400
+
+    try:
+        results = [None] * len(items)
+        valid = []  # [(index, item)]
+        for i, item in enumerate(items):
+            if not isinstance(item, dict) or not item.get('user_id'):
+                results[i] = {'index': i, 'success': False, 'error': 'user_id is required'}
+                continue
+            if not isinstance(item['user_id'], str):
+                results[i] = {'index': i, 'success': False, 'error': 'user_id must be a string'}
+                continue
+            loc_in = item.get('location')
+            if loc_in is not None and (not isinstance(loc_in, dict) or (loc_in and clamp_location(loc_in) is None)):
+                results[i] = {'index': i, 'success': False, 'error': 'invalid location'}
+                continue
+            valid.append((i, item))
+
+        user_ids = list(dict.fromkeys(item['user_id'] for _, item in valid))
+        user_errors = ensure_users(user_ids) if user_ids else {}
+
+        rows = []  # [(index, row, loc, address_pending)]
+        for i, item in valid:
+            if item['user_id'] in user_errors:
+                results[i] = {'index': i, 'success': False, 'error': user_errors[item['user_id']]}
+                continue
+            loc, address_pending = prepare_location(item.get('location') or {})
+            rows.append((i, checkin_row(item, loc), loc, address_pending))
+
+        # PostgREST 批量插入要求每行的列一致
+        if any('photos' in row for _, row, _, _ in rows):
+            for _, row, _, _ in rows:
+                row.setdefault('photos', None)
+
+        # 每块单独处理：某一块出错时，之前已插入的块仍逐条返回结果，客户端只需重试失败的条目
+        for chunk in _chunks(rows, CHECKIN_BATCH_CHUNK_SIZE):
+            try:
+                for (i, row, loc, address_pending), inserted, error in insert_checkin_rows(chunk):
+                    if error:
+                        results[i] = {'index': i, 'success': False, 'error': error}
+                        continue
+                    result = {'index': i, 'success': True, 'data': inserted}
+                    if address_pending:
+                        result['address_pending'] = backfill.submit(inserted.get('id'), loc)
+                    results[i] = result
+            except Exception as e:
+                for i, _, _, _ in chunk:
+                    if results[i] is None:
+                        results[i] = {'index': i, 'success': False, 'error': str(e)}
+
+        succeeded = sum(1 for r in results if r['success'])
+        return jsonify({
+            'results': results,
+            'succeeded': succeeded,
+            'failed': len(results) - succeeded
+        }), 201 if succeeded else 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -164,6 +402,7 @@ def delete_checkin(checkin_id):
 
 # 获取用户的徽章和成就
 @api_bp.route('/badges', methods=['GET'])
+@conditional('user_badges', 'badges')
 def get_badges():
     user_id = request.args.get('user_id')
     
@@ -171,27 +410,36 @@ def get_badges():
         return jsonify({'error': 'user_id is required'}), 400
     
     try:
+        columns = select_columns(request.args, 'user_badges', default='id, badge_id, unlocked_at, badges(*)')
         response = supabase.table('user_badges') \
-            .select('id, badge_id, unlocked_at, badges(*)') \
+            .select(columns) \
             .eq('user_id', user_id) \
             .order('unlocked_at', desc=True) \
             .execute()
+        raise_for_fields(response.error)
         
         return jsonify({
             'data': response.data,
             'total': len(response.data)
         }), 200
+    except FieldsError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # 获取单个徽章详情
 @api_bp.route('/badges/<badge_id>', methods=['GET'])
+@conditional('badges')
 def get_badge(badge_id):
     try:
-        response = supabase.table('badges').select('*').eq('id', badge_id).execute()
+        columns = select_columns(request.args, 'badges')
+        response = supabase.table('badges').select(columns).eq('id', badge_id).cache().execute()
+        raise_for_fields(response.error)
         if not response.data:
             return jsonify({'error': 'Badge not found'}), 404
         return jsonify({'data': response.data[0]}), 200
+    except FieldsError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -218,7 +466,7 @@ def unlock_badge():
         unlock_data = {
             'user_id': data['user_id'],
             'badge_id': data['badge_id'],
-            'unlocked_at': datetime.datetime.now().isoformat()
+            'unlocked_at': datetime.datetime.now()
         }
         
         response = supabase.table('user_badges').insert(unlock_data).execute()
@@ -238,8 +486,11 @@ def get_friends():
         return jsonify({'error': 'user_id is required'}), 400
     
     try:
-        response = supabase.table('friends').select('*').eq('user_id', user_id).execute()
-        return jsonify({'data': response.data}), 200
+        columns = select_columns(request.args, 'friends', required=KEYSET_COLUMNS)
+        query = supabase.table('friends').select(columns).eq('user_id', user_id)
+        return jsonify(keyset_page(query)), 200
+    except (CursorError, FieldsError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -251,8 +502,11 @@ def get_friends():
 @api_bp.route('/groups', methods=['GET'])
 def get_groups():
     try:
-        response = supabase.table('groups').select('*').execute()
-        return jsonify({'data': response.data}), 200
+        columns = select_columns(request.args, 'groups', required=KEYSET_COLUMNS)
+        query = supabase.table('groups').select(columns).cache()
+        return jsonify(keyset_page(query)), 200
+    except (CursorError, FieldsError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -260,10 +514,14 @@ def get_groups():
 @api_bp.route('/groups/<group_id>', methods=['GET'])
 def get_group_details(group_id):
     try:
-        response = supabase.table('groups').select('*').eq('id', group_id).execute()
+        columns = select_columns(request.args, 'groups')
+        response = supabase.table('groups').select(columns).eq('id', group_id).cache().execute()
+        raise_for_fields(response.error)
         if not response.data:
             return jsonify({'error': 'Group not found'}), 404
         return jsonify({'data': response.data[0]}), 200
+    except FieldsError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -271,16 +529,16 @@ def get_group_details(group_id):
 # 4. 广场 (Plaza)
 # =====================
 
-# 获取广场动态 (简化版，使用limit代替range)
+# 获取广场动态（按 cursor 键集分页，limit 与 page_size 等价）
 @api_bp.route('/plaza', methods=['GET'])
 def get_plaza_feed():
-    page = int(request.args.get('page', 1))
-    limit = int(request.args.get('limit', 20))
-    
     try:
-        # 简化版：只使用limit，不支持分页
-        response = supabase.table('plaza_posts').select('*').limit(limit).execute()
-        return jsonify({'data': response.data, 'page': page, 'limit': limit}), 200
+        columns = select_columns(request.args, 'plaza_posts', required=KEYSET_COLUMNS)
+        page = keyset_page(supabase.table('plaza_posts').select(columns))
+        page['limit'] = page['page_size']
+        return jsonify(page), 200
+    except (CursorError, FieldsError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -298,13 +556,15 @@ def get_tasks():
     status = request.args.get('status')
     
     try:
-        query = supabase.table('tasks').select('*').eq('user_id', user_id)
+        columns = select_columns(request.args, 'tasks', required=KEYSET_COLUMNS)
+        query = supabase.table('tasks').select(columns).eq('user_id', user_id)
         
         if status:
             query = query.eq('status', status)
         
-        response = query.execute()
-        return jsonify({'data': response.data}), 200
+        return jsonify(keyset_page(query)), 200
+    except (CursorError, FieldsError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -328,8 +588,8 @@ def create_task():
             'priority': data.get('priority', 'medium'),
             'category': data.get('category'),
             'reminder': data.get('reminder'),
-            'created_at': datetime.datetime.now().isoformat(),
-            'updated_at': datetime.datetime.now().isoformat()
+            'created_at': datetime.datetime.now(),
+            'updated_at': datetime.datetime.now()
         }
         
         response = supabase.table('tasks').insert(task_data).execute()
@@ -347,7 +607,7 @@ def update_task(task_id):
     
     try:
         # 添加更新时间
-        data['updated_at'] = datetime.datetime.now().isoformat()
+        data['updated_at'] = datetime.datetime.now()
         
         response = supabase.table('tasks').update(data).eq('id', task_id).execute()
         return jsonify({'data': response.data[0]}), 200
@@ -365,6 +625,7 @@ def delete_task(task_id):
 
 # 获取任务统计信息
 @api_bp.route('/tasks/stats', methods=['GET'])
+@conditional('user_task_stats', 'tasks')
 def get_task_stats():
     user_id = request.args.get('user_id')
     if not user_id:
@@ -372,8 +633,12 @@ def get_task_stats():
     
     try:
         # 这里可以使用我们之前创建的视图或存储过程
-        response = supabase.table('user_task_stats').select('*').eq('user_id', user_id).execute()
+        columns = select_columns(request.args, 'user_task_stats')
+        response = supabase.table('user_task_stats').select(columns).eq('user_id', user_id).execute()
+        raise_for_fields(response.error)
         return jsonify({'data': response.data[0] if response.data else {}}), 200
+    except FieldsError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -389,8 +654,13 @@ def get_journals():
         return jsonify({'error': 'user_id is required'}), 400
     
     try:
-        response = supabase.table('journals').select('*').eq('user_id', user_id).execute()
-        return jsonify({'data': response.data}), 200
+        columns = select_columns(request.args, 'journals', required=KEYSET_COLUMNS)
+        query = supabase.table('journals').select(columns).eq('user_id', user_id)
+        if wants_stream(request.args):
+            return stream_rows(query)
+        return jsonify(keyset_page(query)), 200
+    except (CursorError, FieldsError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -414,8 +684,8 @@ def create_journal():
             'tags': data.get('tags', []),
             'images': data.get('images', []),
             'is_public': data.get('is_public', False),
-            'created_at': datetime.datetime.now().isoformat(),
-            'updated_at': datetime.datetime.now().isoformat()
+            'created_at': datetime.datetime.now(),
+            'updated_at': datetime.datetime.now()
         }
         
         response = supabase.table('journals').insert(journal_data).execute()
@@ -433,7 +703,7 @@ def update_journal(journal_id):
     
     try:
         # 添加更新时间
-        data['updated_at'] = datetime.datetime.now().isoformat()
+        data['updated_at'] = datetime.datetime.now()
         
         response = supabase.table('journals').update(data).eq('id', journal_id).execute()
         return jsonify({'data': response.data[0]}), 200
@@ -462,28 +732,39 @@ def get_secrets():
     
     if not user_id:
         return jsonify({'error': 'user_id is required'}), 400
+    try:
+        count = count_mode(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     try:
         offset = (page - 1) * page_size
+        # 数据和总数在同一次请求中返回（Prefer: count=... + Content-Range）；
+        # 总数缓存命中时不再让 PostgREST 计数
+        total_key = ('secrets', user_id)
+        total = cached_total(total_key)
+        columns = select_columns(request.args, 'secrets')
         response = supabase.table('secrets') \
-            .select('*') \
+            .select(columns, count=None if total is not None else count) \
             .eq('user_id', user_id) \
             .order('created_at', desc=True) \
             .range(offset, offset + page_size - 1) \
             .execute()
-        
-        # 获取总记录数
-        total_response = supabase.table('secrets') \
-            .select('id', count='exact') \
-            .eq('user_id', user_id) \
-            .execute()
+        if getattr(response, 'error', None):
+            raise_for_fields(response.error)
+            return jsonify({'error': str(response.error)}), 500
+        if total is None:
+            total = response.count
+            remember_total(total_key, total)
         
         return jsonify({
             'data': response.data,
-            'total': total_response.count,
+            'total': total,
             'page': page,
             'page_size': page_size
         }), 200
+    except FieldsError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -500,8 +781,8 @@ def create_secret():
         secret_data = {
             'user_id': data['user_id'],
             'content': data['content'],
-            'created_at': datetime.datetime.now().isoformat(),
-            'updated_at': datetime.datetime.now().isoformat()
+            'created_at': datetime.datetime.now(),
+            'updated_at': datetime.datetime.now()
         }
         
         # 如果有图片URL，添加到数据中
@@ -511,6 +792,7 @@ def create_secret():
         response = supabase.table('secrets').insert(secret_data).execute()
         if getattr(response, 'error', None):
             return jsonify({'error': str(response.error)}), 500
+        forget_total(('secrets', data['user_id']))
         inserted = None
         if isinstance(response.data, list) and len(response.data) > 0:
             inserted = response.data[0]
@@ -532,7 +814,7 @@ def update_secret(secret_id):
     
     try:
         # 更新时间
-        data['updated_at'] = datetime.datetime.now().isoformat()
+        data['updated_at'] = datetime.datetime.now()
         
         response = supabase.table('secrets').update(data).eq('id', secret_id).execute()
         if not response.data:
@@ -548,6 +830,7 @@ def delete_secret(secret_id):
         response = supabase.table('secrets').delete().eq('id', secret_id).execute()
         if not response.data:
             return jsonify({'error': 'Secret not found'}), 404
+        forget_total(('secrets', response.data[0].get('user_id')))
         return jsonify({'message': 'Secret deleted successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -557,91 +840,166 @@ def delete_secret(secret_id):
 # =====================
 
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 import os
-import uuid
+import shutil
+import tempfile
+from image_variants import pipeline as image_pipeline, remove_quietly
+from upload_dedup import upload_index, file_digest
+
+# 上传请求体（含表单字段）的最大字节数，由 app.py 设置为 MAX_CONTENT_LENGTH，读取请求体时即检查
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+
+def spool_copy(stream):
+    """把上传流分块复制到临时文件（供渲染子进程按路径读取），返回文件路径"""
+    fd, path = tempfile.mkstemp()
+    with os.fdopen(fd, 'wb') as f:
+        shutil.copyfileobj(stream, f)
+    stream.seek(0)
+    return path
+
+def public_url_for(bucket_name, path):
+    public_url = supabase.storage.from_(bucket_name).get_public_url(path)
+    if isinstance(public_url, dict) and 'data' in public_url and 'publicUrl' in public_url['data']:
+        public_url = public_url['data']['publicUrl']
+    return public_url
+
+def upload_variants(bucket_name, base_path, outputs):
+    """上传渲染好的各尺寸 WebP，返回 {名称: 公开URL}；单个失败不影响其他尺寸"""
+    bucket = supabase.storage.bucket(bucket_name)
+    urls = {}
+    for name, local_path in outputs.items():
+        variant_path = f"{base_path}_{name}.webp"
+        try:
+            with open(local_path, 'rb') as f:
+                result = bucket.upload(variant_path, f, 'image/webp', upsert=False)
+            if getattr(result, 'error', None):
+                raise RuntimeError(result.error)
+            urls[name] = bucket.get_public_url(variant_path)
+        except Exception as e:
+            print(f"❌ 派生图上传失败 {variant_path}: {e}")
+        finally:
+            remove_quietly(local_path)
+    return urls
+
+def start_render(stream):
+    """复制原图到临时文件并提交派生图渲染，返回 Future"""
+    source_path = spool_copy(stream)
+    render = image_pipeline.submit(source_path)
+    render.add_done_callback(lambda _: remove_quietly(source_path))
+    return render
+
+class StorageUploadError(Exception):
+    """原图上传到 Storage 失败"""
+
+def store_image(bucket_name, stream, content_type, ext, digest, size):
+    """按内容寻址上传原图并生成派生图，返回响应内容；已上传过的内容直接返回已有 URL
+
+    stream 为可 seek 的文件对象，digest / size 为其 SHA-256 和字节数。
+    """
+    base_path = f"image/sha256/{digest}"
+    wants_variants = image_pipeline.enabled and (content_type or '').startswith('image/')
+    existing = upload_index.lookup(digest)
+    if existing is not None:
+        upload_index.record_hit(size)
+        payload = {
+            'url': public_url_for(bucket_name, existing['path']),
+            'path': existing['path'],
+            'bucket': bucket_name,
+            'deduplicated': True
+        }
+        variants = existing['variants']
+        missing = {name for name, _ in image_pipeline.variants} - set(variants) if wants_variants else set()
+        if missing:
+            # 上次渲染超时或部分尺寸上传失败：只补齐派生图，原图不再上传
+            variants = dict(variants)
+            variants.update(upload_variants(bucket_name, base_path, image_pipeline.result(start_render(stream))))
+            upload_index.remember(digest, existing['path'], variants)
+        if variants:
+            payload['variants'] = variants
+        return payload
+    unique_filename = f"{base_path}{ext}"
+
+    # 派生图在进程池中渲染，与原图上传同时进行
+    render = start_render(stream) if wants_variants else None
+
+    # 直接把文件对象交给上传请求，按固定大小分块（chunked 编码）发送到 Supabase；
+    # 不覆盖已有对象，其他实例上传过的同一内容由 Storage 返回 409
+    try:
+        stream.seek(0)
+        response = supabase.storage.from_(bucket_name).upload(
+            path=unique_filename,
+            file=stream,
+            file_options={'content-type': content_type, 'upsert': 'false'}
+        )
+        if getattr(response, 'error', None):
+            raise RuntimeError(response.error)
+    except Exception as upload_err:
+        image_pipeline.discard(render)
+        print(f"❌ 上传内部错误: {upload_err}")
+        import traceback
+        traceback.print_exc()
+        raise StorageUploadError(str(upload_err)) from upload_err
+    upload_index.record_upload(size, existing=bool((response.data or {}).get('existing')))
+
+    payload = {
+        'url': public_url_for(bucket_name, unique_filename),
+        'path': unique_filename,
+        'bucket': bucket_name,
+        'deduplicated': False
+    }
+    if render is not None:
+        payload['variants'] = upload_variants(bucket_name, base_path, image_pipeline.result(render))
+    upload_index.remember(digest, unique_filename, payload.get('variants'))
+    return payload
+
+def storage_error_response(bucket_name, upload_err):
+    # 提供更友好的错误提示
+    if 'row-level security policy' in str(upload_err):
+        return jsonify({
+            'error': '存储桶安全策略配置错误，请检查RLS设置',
+            'detail': '请确保使用正确的Service Role Key或调整存储桶的RLS策略'
+        }), 403
+    elif 'Bucket not found' in str(upload_err):
+        return jsonify({
+            'error': '存储桶不存在',
+            'detail': f'存储桶 "{bucket_name}" 不存在，请先创建该存储桶'
+        }), 404
+    else:
+        return jsonify({
+            'error': '文件上传失败',
+            'detail': str(upload_err)
+        }), 500
 
 # 上传图片到 Supabase 存储
 @api_bp.route('/upload/image', methods=['POST'])
 def upload_image():
+    bucket_name = 'image'
     try:
-        print("📤 收到图片上传请求")
-        print(f"   请求文件: {request.files}")
-        print(f"   请求表单: {request.form}")
-        
+        # 表单解析时 werkzeug 把大文件写入临时文件，内存中只保留固定大小的缓冲；
+        # 请求体超过 MAX_CONTENT_LENGTH 时在读取过程中抛出 RequestEntityTooLarge
         if 'file' not in request.files:
-            print("❌ 没有文件部分")
             return jsonify({'error': 'No file part'}), 400
         
         file = request.files['file']
         if file.filename == '':
-            print("❌ 没有选择文件")
             return jsonify({'error': 'No selected file'}), 400
         
         user_id = request.form.get('user_id')
         if not user_id:
-            print("❌ 缺少 user_id")
             return jsonify({'error': 'user_id is required'}), 400
         
-        # 生成唯一的文件名
+        # 按内容寻址：摘要在表单解析写入临时文件时已算好，相同内容只存一份
         filename = secure_filename(file.filename)
-        ext = os.path.splitext(filename)[1]
-        unique_filename = f"image/{user_id}/{uuid.uuid4()}{ext}"
-        
-        # 上传到 Supabase 存储
-        bucket_name = 'image'
-        
-        print(f"📁 开始上传到存储桶: {bucket_name}")
-        print(f"   文件名: {unique_filename}")
-        print(f"   文件类型: {file.content_type}")
-        
-        # 读取文件内容并上传
-        file_content = file.read()
-        print(f"✅ 读取文件内容成功")
-        print(f"   文件内容类型: {type(file_content)}")
-        print(f"   文件内容长度: {len(file_content)} 字节")
-        
-        # 上传文件
+        ext = os.path.splitext(filename)[1].lower()
+        digest, size = file_digest(file.stream)
         try:
-            print("📤 正在发送上传请求到Supabase...")
-            response = supabase.storage.from_(bucket_name).upload(
-                path=unique_filename,
-                file=file_content,
-                file_options={'content-type': file.content_type}
-            )
-            print(f"✅ 上传响应: {response}")
-        except Exception as upload_err:
-            print(f"❌ 上传内部错误: {upload_err}")
-            import traceback
-            traceback.print_exc()
-            
-            # 提供更友好的错误提示
-            if 'row-level security policy' in str(upload_err):
-                return jsonify({
-                    'error': '存储桶安全策略配置错误，请检查RLS设置',
-                    'detail': '请确保使用正确的Service Role Key或调整存储桶的RLS策略'
-                }), 403
-            elif 'Bucket not found' in str(upload_err):
-                return jsonify({
-                    'error': '存储桶不存在',
-                    'detail': f'存储桶 "{bucket_name}" 不存在，请先创建该存储桶'
-                }), 404
-            else:
-                return jsonify({
-                    'error': '文件上传失败',
-                    'detail': str(upload_err)
-                }), 500
-
-        # 获取文件的公共URL
-        public_url = supabase.storage.from_(bucket_name).get_public_url(unique_filename)
-        if isinstance(public_url, dict) and 'data' in public_url and 'publicUrl' in public_url['data']:
-            public_url = public_url['data']['publicUrl']
-        print(f"🌐 文件URL: {public_url}")
-        
-        return jsonify({
-            'url': public_url,
-            'path': unique_filename,
-            'bucket': bucket_name
-        }), 200
+            payload = store_image(bucket_name, file.stream, file.content_type, ext, digest, size)
+        except StorageUploadError as upload_err:
+            return storage_error_response(bucket_name, upload_err)
+        return jsonify(payload), 200
+    except RequestEntityTooLarge:
+        return jsonify({'error': f'文件过大，最大 {MAX_UPLOAD_BYTES // (1024 * 1024)} MB'}), 413
     except Exception as e:
         error_msg = str(e)
         print(f"❌ 图片上传错误: {error_msg}")
@@ -657,3 +1015,95 @@ def upload_image():
             return jsonify({'error': '文件路径错误'}), 400
         else:
             return jsonify({'error': f'图片上传失败: {error_msg}'}), 500
+
+# =====================
+# 可续传的分块上传
+# =====================
+
+from resumable_uploads import upload_sessions, UploadSessionError
+
+# 创建上传会话
+@api_bp.route('/upload/sessions', methods=['POST'])
+def create_upload_session():
+    data = request.get_json(silent=True) or {}
+    try:
+        if not data.get('user_id'):
+            return jsonify({'error': 'user_id is required'}), 400
+        if not data.get('filename'):
+            return jsonify({'error': 'filename is required'}), 400
+        session = upload_sessions.create(
+            filename=secure_filename(data['filename']),
+            content_type=data.get('content_type') or 'application/octet-stream',
+            size=data.get('size'),
+            user_id=data['user_id'],
+            chunk_size=data.get('chunk_size'),
+            sha256=data.get('sha256')
+        )
+        return jsonify(session), 201
+    except UploadSessionError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 上传第 index 块（请求体为原始字节，可选 Upload-Offset 头校验偏移）
+@api_bp.route('/upload/sessions/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def put_upload_chunk(upload_id, index):
+    try:
+        offset = request.headers.get('Upload-Offset')
+        if offset is not None and not offset.isdigit():
+            return jsonify({'error': 'Upload-Offset must be a non-negative integer'}), 400
+        progress = upload_sessions.write_chunk(
+            upload_id, index, request.stream, int(offset) if offset is not None else None)
+        return jsonify(progress), 200
+    except UploadSessionError as e:
+        return jsonify({'error': str(e)}), e.status
+    except RequestEntityTooLarge:
+        return jsonify({'error': f'块过大，最大 {MAX_UPLOAD_BYTES // (1024 * 1024)} MB'}), 413
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 查询上传进度
+@api_bp.route('/upload/sessions/<upload_id>', methods=['GET'])
+def get_upload_session(upload_id):
+    try:
+        return jsonify(upload_sessions.progress(upload_id)), 200
+    except UploadSessionError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 放弃上传
+@api_bp.route('/upload/sessions/<upload_id>', methods=['DELETE'])
+def delete_upload_session(upload_id):
+    try:
+        upload_sessions.abort(upload_id)
+        return jsonify({'message': 'Upload session deleted successfully'}), 200
+    except UploadSessionError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 完成上传：各块按顺序流式上传到 Storage，响应与 /upload/image 相同
+@api_bp.route('/upload/sessions/<upload_id>/complete', methods=['POST'])
+def complete_upload_session(upload_id):
+    bucket_name = 'image'
+    try:
+        meta, directory = upload_sessions.claim(upload_id)
+    except UploadSessionError as e:
+        return jsonify({'error': str(e)}), e.status
+    try:
+        digest = upload_sessions.digest(meta, directory)
+        if meta['sha256'] and digest != meta['sha256']:
+            upload_sessions.finish(directory, 'aborted')
+            return jsonify({'error': 'sha256 mismatch, upload session discarded', 'sha256': digest}), 400
+        ext = os.path.splitext(meta['filename'])[1].lower()
+        with upload_sessions.reader(meta, directory) as reader:
+            payload = store_image(bucket_name, reader, meta['content_type'], ext, digest, meta['size'])
+    except StorageUploadError as upload_err:
+        upload_sessions.release(upload_id)
+        return storage_error_response(bucket_name, upload_err)
+    except Exception as e:
+        upload_sessions.release(upload_id)
+        return jsonify({'error': f'图片上传失败: {e}'}), 500
+    upload_sessions.finish(directory)
+    return jsonify(payload), 200
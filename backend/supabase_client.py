@@ -1,97 +1,227 @@
 import os
-import json
-import urllib.request
+import time
+import threading
 import urllib.parse
-import urllib.error
-from dotenv import load_dotenv
+import json_codec
+from http_pool import default_pool
+from metrics import metrics
+import upstream_calls
+from response_cache import response_cache
+from etags import validators
 
-# 加载环境变量
-load_dotenv()
+# http：访问 SUPABASE_URL；memory：进程内内存表（memory_supabase_client），用于单元测试和剖析
+SUPABASE_BACKEND = os.getenv('SUPABASE_BACKEND', 'http').lower()
 
-# 获取Supabase配置
-SUPABASE_URL = os.getenv('SUPABASE_URL')
-SUPABASE_KEY = os.getenv('SUPABASE_SERVICE_ROLE') or os.getenv('SUPABASE_KEY')
+def supabase_config():
+    """返回 (SUPABASE_URL, key)；.env 由入口（app.py / asgi.py）在导入其他模块前加载"""
+    url = os.getenv('SUPABASE_URL')
+    key = os.getenv('SUPABASE_SERVICE_ROLE') or os.getenv('SUPABASE_KEY')
+    # 验证配置是否存在
+    if not url or not key:
+        raise ValueError("Supabase configuration is missing. Please check your .env file.")
+    return url, key
 
-# 验证配置是否存在
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Supabase configuration is missing. Please check your .env file.")
+class LazyClient:
+    """首次访问属性时才读取配置并创建客户端，导入模块时不做任何初始化（缩短 FC 冷启动）"""
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def resolved(self):
+        return self._client is not None
+
+    def resolve(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
 
 # 使用requests实现简单的Supabase客户端功能
 class SupabaseClient:
-    def __init__(self, url, key):
+    def __init__(self, url, key, pool=None):
         self.url = url.rstrip('/')
         self.key = key
+        # 所有 PostgREST / Storage 请求共用长连接池，避免每次调用都重新 TCP + TLS 握手
+        self.pool = pool or default_pool
         self.headers = {
             'apikey': self.key,
             'Authorization': f'Bearer {self.key}',
             'Content-Type': 'application/json'
         }
+    table_class = None  # 在 Table 定义后赋值
+    # 读穿缓存与写入监听在同步/异步客户端之间共享：任一客户端写表都会让该表的缓存和 ETag 校验值失效
+    response_cache = response_cache
+    write_listeners = [response_cache.invalidate, validators.invalidate]
+
     def from_(self, table_name):
-        return Table(self, table_name)
+        return self.table_class(self, table_name)
+
+    def notify_write(self, table_name):
+        """insert/update/delete 成功后通知监听者（如缓存失效）"""
+        for listener in self.write_listeners:
+            listener(table_name)
 
     def _http(self, method, url, headers=None, data=None):
-        req = urllib.request.Request(url, data=data, method=method)
-        for k, v in (headers or {}).items():
-            req.add_header(k, v)
+        start = time.perf_counter()
+        status = 'error'
         try:
-            with urllib.request.urlopen(req) as resp:
-                body = resp.read()
-                status = resp.getcode()
-                hdrs = dict(resp.headers)
-                return status, hdrs, body
-        except urllib.error.HTTPError as e:
-            try:
-                return e.code, dict(e.headers), e.read()
-            except Exception:
-                return e.code, {}, b''
-        except urllib.error.URLError as e:
-            raise RuntimeError(str(e))
+            result = self.pool.request(method, url, headers=headers, data=data)
+            status = result[0]
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe_upstream(url, method, status, elapsed)
+            upstream_calls.record('supabase', elapsed)
+
+    def _stream(self, method, url, headers=None, data=None):
+        # 只计到响应头，响应体由调用方按块转发
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            result = self.pool.stream(method, url, headers=headers, data=data)
+            status = result[0]
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe_upstream(url, method, status, elapsed)
+            upstream_calls.record('supabase', elapsed)
 
 class Result:
-    def __init__(self, data=None, error=None, count=None):
+    def __init__(self, data=None, error=None, count=None, status=None):
         self.data = data
         self.error = error
         self.count = count
+        self.status = status   # 出错时为上游 HTTP 状态码
+
+def _write_result(status, body):
+    """解析 insert/update/delete 的响应"""
+    if 200 <= status < 300:
+        try:
+            return Result(data=json_codec.loads(body), error=None)
+        except Exception:
+            return Result(data=[], error=None)
+    else:
+        return Result(data=None, error=body.decode('utf-8') if body else f'status {status}', status=status)
+
+def quote_value(value):
+    """PostgREST 列表和逻辑表达式中的值：加双引号，避免逗号、括号、点号被当作分隔符"""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+class BaseQuery:
+    """请求构造与响应解析分离，同步/异步客户端共用同一套查询构造器"""
+    def build_request(self):
+        raise NotImplementedError
+
+    def parse_response(self, status, hdrs, body):
+        raise NotImplementedError
+
+    def cached_result(self, request):
+        """命中缓存时返回结果，跳过上游请求"""
+        return None
+
+    def finish(self, result):
+        """上游请求完成后的处理（写入缓存、写入通知）"""
+        return result
+
+    def execute(self):
+        request = self.build_request()
+        cached = self.cached_result(request)
+        if cached is not None:
+            return cached
+        method, url, headers, data = request
+        status, hdrs, body = self.table.client._http(method, url, headers=headers, data=data)
+        return self.finish(self.parse_response(status, hdrs, body))
+
+class WriteQuery(BaseQuery):
+    def finish(self, result):
+        if not result.error:
+            self.table.client.notify_write(self.table.table_name)
+        return result
 
 class Table:
+    # 异步客户端通过替换这些类复用同一套查询构造器
+    query_class = None
+    insert_class = None
+    update_class = None
+    delete_class = None
+
     def __init__(self, client, table_name):
         self.client = client
         self.table_name = table_name
     
     def select(self, columns, **kwargs):
-        return Query(self, columns, **kwargs)
+        return self.query_class(self, columns, **kwargs)
     
     def insert(self, data):
-        return InsertQuery(self, data)
+        return self.insert_class(self, data)
     
     def update(self, data):
-        return UpdateQuery(self, data)
+        return self.update_class(self, data)
     
     def delete(self):
-        return DeleteQuery(self)
+        return self.delete_class(self)
 
-class Query:
+class Query(BaseQuery):
     def __init__(self, table, columns, **kwargs):
         self.table = table
         self.columns = columns
         self.filters = []
-        self.order_by = None
-        self.order_desc = False
+        self.orders = []
         self.range_start = None
         self.range_end = None
         self.count_pref = kwargs.get('count')
+        self.use_cache = False
+        self._cache_slot = None
+    
+    def cache(self, enabled=True):
+        """使用读穿缓存，只对 RESPONSE_CACHE_TTLS 中配置的表生效；命中的结果是共享对象，调用方不要修改"""
+        self.use_cache = enabled
+        return self
     
     def eq(self, column, value):
         self.filters.append(f'{column}=eq.{value}')
         return self
     
+    def lt(self, column, value):
+        self.filters.append(f'{column}=lt.{value}')
+        return self
+    
+    def lte(self, column, value):
+        self.filters.append(f'{column}=lte.{value}')
+        return self
+    
+    def gt(self, column, value):
+        self.filters.append(f'{column}=gt.{value}')
+        return self
+    
+    def gte(self, column, value):
+        self.filters.append(f'{column}=gte.{value}')
+        return self
+    
+    def in_(self, column, values):
+        # 值中可能包含逗号或括号，统一加双引号
+        quoted = ','.join(quote_value(v) for v in values)
+        self.filters.append(f'{column}=in.({quoted})')
+        return self
+    
+    def or_(self, expression):
+        """PostgREST 逻辑表达式，例如 'a.lt.1,and(a.eq.1,b.lt.2)'"""
+        self.filters.append(f'or=({expression})')
+        return self
+    
     def limit(self, count):
         self.limit_count = count
         return self
     
     def order(self, column, desc=False):
-        self.order_by = column
-        self.order_desc = desc
+        # 多次调用按顺序追加排序列
+        self.orders.append(f"{column}.{('desc' if desc else 'asc')}")
         return self
     
     def range(self, start, end):
@@ -99,71 +229,105 @@ class Query:
         self.range_end = end
         return self
     
-    def execute(self):
+    def build_request(self):
         base_url = f'{self.table.client.url}/rest/v1/{self.table.table_name}'
         headers = dict(self.table.client.headers)
-        params = {'select': self.columns}
-        if self.filters:
-            for f in self.filters:
-                params[f.split('=')[0]] = f.split('=')[1]
+        # 同一列可以有多个条件（如范围查询），因此用列表而不是字典
+        params = [('select', self.columns)]
+        for f in self.filters:
+            key, _, value = f.partition('=')
+            params.append((key, value))
         if hasattr(self, 'limit_count'):
-            params['limit'] = self.limit_count
-        if self.order_by:
-            params['order'] = f"{self.order_by}.{('desc' if self.order_desc else 'asc')}"
+            params.append(('limit', self.limit_count))
+        if self.orders:
+            params.append(('order', ','.join(self.orders)))
         if self.range_start is not None and self.range_end is not None:
             headers['Range'] = f'items={self.range_start}-{self.range_end}'
         if self.count_pref:
             headers['Prefer'] = f'count={self.count_pref}'
         # build query string
-        qs = '&'.join(f"{k}={urllib.parse.quote(str(v))}" for k, v in params.items())
+        qs = '&'.join(f"{k}={urllib.parse.quote(str(v))}" for k, v in params)
         url = f"{base_url}?{qs}" if qs else base_url
-        status, hdrs, body = self.table.client._http('GET', url, headers=headers)
+        return 'GET', url, headers, None
+
+    def parse_response(self, status, hdrs, body):
+        count = None
+        if self.count_pref:
+            # Content-Range: 0-9/42，总数与数据在同一个响应里返回
+            count_hdr = hdrs.get('Content-Range')
+            if count_hdr and '/' in count_hdr:
+                try:
+                    count = int(count_hdr.split('/')[-1])
+                except Exception:
+                    count = None
+        if status == 416:
+            # 请求的范围超出总数（翻过最后一页），PostgREST 仍会给出总数
+            return Result(data=[], count=count, error=None)
         if status >= 200 and status < 300:
             try:
-                data = json.loads(body.decode('utf-8')) if body else []
+                data = json_codec.loads(body) if body else []
             except Exception:
                 data = []
-            count = None
-            if self.count_pref:
-                count_hdr = hdrs.get('Content-Range')
-                if count_hdr and '/' in count_hdr:
-                    try:
-                        count = int(count_hdr.split('/')[-1])
-                    except Exception:
-                        count = None
             return Result(data=data, count=count, error=None)
         else:
             return Result(data=None, error=body.decode('utf-8') if body else f'status {status}')
 
-class InsertQuery:
+    def stream(self):
+        """不解析响应体，返回 (status, headers, body)；body 按块迭代原始 JSON，用完或放弃时需 close()"""
+        method, url, headers, data = self.build_request()
+        return self.table.client._stream(method, url, headers=headers, data=data)
+
+    def cached_result(self, request):
+        cache = self.table.client.response_cache
+        table_name = self.table.table_name
+        if not self.use_cache or not cache.enabled_for(table_name):
+            return None
+        _, url, headers, _ = request
+        key = (url, headers.get('Range'), headers.get('Prefer'))
+        # 先记下代数，查询期间如有写入，结果只会存到旧代数下
+        self._cache_slot = (key, cache.generation(table_name))
+        return cache.get(table_name, *self._cache_slot)
+
+    def finish(self, result):
+        if self._cache_slot is not None and not result.error:
+            self.table.client.response_cache.set(self.table.table_name, *self._cache_slot, result)
+        return result
+
+class InsertQuery(WriteQuery):
     def __init__(self, table, data):
         self.table = table
         self.data = data
         self.returning = '*'  # 默认返回所有列
+        self.on_conflict = None
     
     def returning(self, columns):
         self.returning = columns
         return self
+
+    def ignore_duplicates(self, on_conflict='id'):
+        """on_conflict 列已存在的行跳过（不报 23505），其余行照常插入；返回的只有新插入的行"""
+        self.on_conflict = on_conflict
+        return self
     
-    def execute(self):
+    def build_request(self):
         base_url = f'{self.table.client.url}/rest/v1/{self.table.table_name}'
         params = {}
+        if self.on_conflict:
+            params['on_conflict'] = self.on_conflict
         
         qs = '&'.join(f"{k}={urllib.parse.quote(str(v))}" for k, v in params.items())
         url = f"{base_url}?{qs}" if qs else base_url
         headers = dict(self.table.client.headers)
         headers['Prefer'] = 'return=representation'
-        body = json.dumps(self.data).encode('utf-8')
-        status, hdrs, resp_body = self.table.client._http('POST', url, headers=headers, data=body)
-        if 200 <= status < 300:
-            try:
-                return Result(data=json.loads(resp_body.decode('utf-8')), error=None)
-            except Exception:
-                return Result(data=[], error=None)
-        else:
-            return Result(data=None, error=resp_body.decode('utf-8') if resp_body else f'status {status}')
+        if self.on_conflict:
+            headers['Prefer'] += ',resolution=ignore-duplicates'
+        body = json_codec.dumps(self.data)
+        return 'POST', url, headers, body
+
+    def parse_response(self, status, hdrs, body):
+        return _write_result(status, body)
 
-class UpdateQuery:
+class UpdateQuery(WriteQuery):
     def __init__(self, table, data):
         self.table = table
         self.data = data
@@ -178,9 +342,10 @@ class UpdateQuery:
         self.returning = columns
         return self
     
-    def execute(self):
+    def build_request(self):
         base_url = f'{self.table.client.url}/rest/v1/{self.table.table_name}'
-        params = {'returning': self.returning}
+        # 返回列通过 select 参数指定；returning 不是 PostgREST 参数，会被当成列过滤条件
+        params = {'select': self.returning}
         
         if self.filters:
             for filter in self.filters:
@@ -189,17 +354,14 @@ class UpdateQuery:
         qs = '&'.join(f"{k}={urllib.parse.quote(str(v))}" for k, v in params.items())
         url = f"{base_url}?{qs}" if qs else base_url
         headers = dict(self.table.client.headers)
-        body = json.dumps(self.data).encode('utf-8')
-        status, hdrs, resp_body = self.table.client._http('PATCH', url, headers=headers, data=body)
-        if 200 <= status < 300:
-            try:
-                return Result(data=json.loads(resp_body.decode('utf-8')), error=None)
-            except Exception:
-                return Result(data=[], error=None)
-        else:
-            return Result(data=None, error=resp_body.decode('utf-8') if resp_body else f'status {status}')
+        headers['Prefer'] = 'return=representation'
+        body = json_codec.dumps(self.data)
+        return 'PATCH', url, headers, body
+
+    def parse_response(self, status, hdrs, body):
+        return _write_result(status, body)
 
-class DeleteQuery:
+class DeleteQuery(WriteQuery):
     def __init__(self, table):
         self.table = table
         self.filters = []
@@ -213,9 +375,10 @@ class DeleteQuery:
         self.returning = columns
         return self
     
-    def execute(self):
+    def build_request(self):
         base_url = f'{self.table.client.url}/rest/v1/{self.table.table_name}'
-        params = {'returning': self.returning}
+        # 返回列通过 select 参数指定；returning 不是 PostgREST 参数，会被当成列过滤条件
+        params = {'select': self.returning}
         
         if self.filters:
             for filter in self.filters:
@@ -224,34 +387,52 @@ class DeleteQuery:
         qs = '&'.join(f"{k}={urllib.parse.quote(str(v))}" for k, v in params.items())
         url = f"{base_url}?{qs}" if qs else base_url
         headers = dict(self.table.client.headers)
-        status, hdrs, resp_body = self.table.client._http('DELETE', url, headers=headers)
-        if 200 <= status < 300:
-            try:
-                return Result(data=json.loads(resp_body.decode('utf-8')), error=None)
-            except Exception:
-                return Result(data=[], error=None)
-        else:
-            return Result(data=None, error=resp_body.decode('utf-8') if resp_body else f'status {status}')
+        headers['Prefer'] = 'return=representation'
+        return 'DELETE', url, headers, None
+
+    def parse_response(self, status, hdrs, body):
+        return _write_result(status, body)
+
+Table.query_class = Query
+Table.insert_class = InsertQuery
+Table.update_class = UpdateQuery
+Table.delete_class = DeleteQuery
+SupabaseClient.table_class = Table
 
 class StorageBucket:
     def __init__(self, client, bucket_name):
         self.client = client
         self.bucket_name = bucket_name
     
-    def upload(self, file_path, file_content, content_type='application/octet-stream'):
-        """上传文件到存储桶"""
+    def build_upload(self, file_path, file_content, content_type='application/octet-stream', upsert=True):
         base_url = f'{self.client.url}/storage/v1/object/{self.bucket_name}/{file_path}'
         headers = {
             'apikey': self.client.key,
             'Authorization': f'Bearer {self.client.key}',
             'Content-Type': content_type
         }
-        
-        status, hdrs, body = self.client._http('PUT', base_url, headers=headers, data=file_content)
+        if not upsert:
+            # 只创建不覆盖：对象已存在时 Storage 返回 409
+            headers['x-upsert'] = 'false'
+            return 'POST', base_url, headers, file_content
+        return 'PUT', base_url, headers, file_content
+
+    def parse_upload(self, file_path, status, body):
         if 200 <= status < 300:
             return Result(data={'path': file_path}, error=None)
-        else:
-            return Result(data=None, error=body.decode('utf-8') if body else f'status {status}')
+        # 部分 Storage 版本以 400 + {"statusCode": "409"} 表示对象已存在
+        if status == 409 or (status == 400 and body and b'"409"' in body):
+            return Result(data={'path': file_path, 'existing': True}, error=None)
+        return Result(data=None, error=body.decode('utf-8') if body else f'status {status}')
+
+    def upload(self, file_path, file_content, content_type='application/octet-stream', upsert=True):
+        """上传文件到存储桶；file_content 为文件对象时分块流式发送，不整体读入内存
+
+        upsert=False 时不覆盖已有对象，已存在时返回成功且 data['existing'] 为 True。
+        """
+        method, url, headers, data = self.build_upload(file_path, file_content, content_type, upsert)
+        status, hdrs, body = self.client._http(method, url, headers=headers, data=data)
+        return self.parse_upload(file_path, status, body)
     
     def get_public_url(self, file_path):
         """获取文件的公开URL"""
@@ -269,9 +450,11 @@ class StorageClient:
         class BucketCompat:
             def upload(self_inner, path, file, file_options=None):
                 ct = None
+                upsert = True
                 if file_options and isinstance(file_options, dict):
                     ct = file_options.get('content-type') or file_options.get('Content-Type')
-                return bucket.upload(path, file, ct or 'application/octet-stream')
+                    upsert = str(file_options.get('upsert', 'true')).lower() != 'false'
+                return bucket.upload(path, file, ct or 'application/octet-stream', upsert)
             def get_public_url(self_inner, path):
                 return {'data': {'publicUrl': bucket.get_public_url(path)}}
         return BucketCompat()
@@ -287,7 +470,7 @@ class StorageClient:
         status, hdrs, body = self.client._http('GET', base_url, headers=headers)
         if 200 <= status < 300:
             try:
-                return json.loads(body.decode('utf-8'))
+                return json_codec.loads(body)
             except Exception:
                 return []
         else:
@@ -295,11 +478,11 @@ class StorageClient:
 
 # 扩展 SupabaseClient 添加 storage 属性
 class EnhancedSupabaseClient(SupabaseClient):
-    def __init__(self, url, key):
-        super().__init__(url, key)
+    def __init__(self, url, key, pool=None):
+        super().__init__(url, key, pool=pool)
         self.storage = StorageClient(self)
     def table(self, table_name):
         return self.from_(table_name)
 
-# 初始化增强的 Supabase 客户端
-supabase = EnhancedSupabaseClient(SUPABASE_URL, SUPABASE_KEY)
+# 增强的 Supabase 客户端，首次使用时创建
+supabase = LazyClient(lambda: EnhancedSupabaseClient(*supabase_config()))
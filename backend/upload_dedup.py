@@ -0,0 +1,159 @@
+"""
+上传去重：图片按内容（SHA-256）寻址存储，本地索引记录已上传的内容。
+
+- 表单解析时边写临时文件边计算摘要（HashingRequest），不需要再读一遍
+- 索引命中时跳过 Storage 上传，直接返回已有的公开 URL 和派生图
+- 索引只在本地（内存 + 可选 SQLite），其他实例上传过的内容由 Storage 返回 409 识别
+"""
+
+import os
+import hashlib
+import threading
+
+from flask import Request
+from werkzeug.formparser import default_stream_factory
+
+import json_codec
+from ttl_cache import TTLCache
+from disk_store import DiskStore
+
+# 上传去重索引配置
+UPLOAD_DEDUP_TTL = float(os.getenv('UPLOAD_DEDUP_TTL', str(7 * 24 * 3600)))
+UPLOAD_DEDUP_INDEX_SIZE = int(os.getenv('UPLOAD_DEDUP_INDEX_SIZE', '10000'))
+UPLOAD_DEDUP_INDEX_PATH = os.getenv('UPLOAD_DEDUP_INDEX_PATH', '')  # 为空时不落盘
+
+
+class HashingFile:
+    """包装上传文件的临时存储，写入时同步计算 SHA-256 和字节数"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._stream.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def __iter__(self):
+        return iter(self._stream)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class HashingRequest(Request):
+    """表单中的每个上传文件都写入 HashingFile"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingFile(default_stream_factory(
+            total_content_length=total_content_length,
+            content_type=content_type,
+            filename=filename,
+            content_length=content_length,
+        ))
+
+
+def file_digest(stream, chunk_size=64 * 1024):
+    """返回 (sha256, 字节数)；不是 HashingFile 时分块读一遍再回到开头"""
+    if isinstance(stream, HashingFile):
+        return stream.hexdigest(), stream.size
+    h = hashlib.sha256()
+    size = 0
+    stream.seek(0)
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        h.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+    return h.hexdigest(), size
+
+
+class UploadIndex:
+    """内容摘要 -> {'path': 存储路径, 'variants': {名称: URL}}
+
+    - hits / bytes_saved：索引命中，跳过上传的次数和字节数
+    - uploads / bytes_uploaded：实际上传原图的次数和字节数
+    - existing：索引未命中但 Storage 中已有同一内容（409），只省下存储空间
+    条目只保留 UPLOAD_DEDUP_TTL 秒，Storage 中手动删除的对象最多在这段时间内仍被引用。
+    """
+
+    def __init__(self, ttl=UPLOAD_DEDUP_TTL, maxsize=UPLOAD_DEDUP_INDEX_SIZE, path=UPLOAD_DEDUP_INDEX_PATH):
+        self.ttl = ttl
+        self.enabled = ttl > 0
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.store = DiskStore(path, 'upload_index', key_column='digest', value_column='entry',
+                               dumps=lambda entry: json_codec.dumps(entry).decode('utf-8'),
+                               loads=json_codec.loads) if path else None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.bytes_saved = 0
+        self.uploads = 0
+        self.bytes_uploaded = 0
+        self.existing = 0
+        self.disk_errors = 0
+
+    def lookup(self, digest):
+        if not self.enabled:
+            return None
+        entry = self.memory.get(digest)
+        if entry is not None or not self.store:
+            return entry
+        import sqlite3
+        try:
+            found = self.store.get(digest)
+        except sqlite3.Error:
+            self.disk_errors += 1
+            return None
+        if not found:
+            return None
+        entry, remaining = found
+        self.memory.set(digest, entry, ttl=min(remaining, self.ttl))
+        return entry
+
+    def remember(self, digest, path, variants=None):
+        if not self.enabled:
+            return
+        entry = {'path': path, 'variants': variants or {}}
+        self.memory.set(digest, entry)
+        if self.store:
+            import sqlite3
+            try:
+                self.store.set(digest, entry, self.ttl)
+            except sqlite3.Error:
+                self.disk_errors += 1
+
+    def record_hit(self, size):
+        with self._lock:
+            self.hits += 1
+            self.bytes_saved += size
+
+    def record_upload(self, size, existing=False):
+        with self._lock:
+            self.uploads += 1
+            self.bytes_uploaded += size
+            if existing:
+                self.existing += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'size': len(self.memory),
+                'persistent': bool(self.store),
+                'hits': self.hits,
+                'bytes_saved': self.bytes_saved,
+                'uploads': self.uploads,
+                'bytes_uploaded': self.bytes_uploaded,
+                'existing': self.existing,
+                'disk_errors': self.disk_errors,
+            }
+
+
+upload_index = UploadIndex()
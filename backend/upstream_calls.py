@@ -0,0 +1,169 @@
+"""
+按请求统计上游调用（Supabase、远程地理编码）的次数和耗时，用于发现一个请求里串行发出多次调用（N+1）。
+
+- 通过 contextvars 绑定到当前请求：Flask 每个请求一个线程，ASGI 每个请求一个任务，互不干扰；
+  后台线程（地址回填）不在任何请求中，不计入
+- 响应带 X-Upstream-Calls 和 Server-Timing 头，浏览器开发者工具的 Timing 面板可以直接看到
+- 超过调用预算的路由打印警告，并在 GET /stats 中汇总
+"""
+
+import os
+import threading
+import contextvars
+
+UPSTREAM_TIMING_HEADERS = os.getenv('UPSTREAM_TIMING_HEADERS', '1') != '0'
+# 每个请求默认允许的上游调用次数，超过时打印警告；0 表示不检查
+UPSTREAM_CALL_BUDGET = int(os.getenv('UPSTREAM_CALL_BUDGET', '3'))
+# 单独设置的预算：逗号分隔的 "方法 路由模板=次数"，方法可省略，如 "POST /api/checkins=4,/api/secrets=1"
+UPSTREAM_CALL_BUDGETS = os.getenv('UPSTREAM_CALL_BUDGETS', '')
+
+# 已知需要多次调用的路由的默认预算，UPSTREAM_CALL_BUDGETS 中的同一路由覆盖这里（=0 表示不检查）：
+# - 上传：原图 + 每个派生尺寸一次（默认 IMAGE_VARIANTS 有 3 个尺寸，增加尺寸时同步调整）
+# - 创建打卡：用户不存在时插入、创建占位用户、重试插入，再加上同步地理编码（主服务 + 备用服务）
+# - 批量打卡：调用次数随条数增长（每块 3 次，出错时拆分重试），不检查
+DEFAULT_CALL_BUDGETS = (
+    'POST /api/upload/image=4,'
+    'POST /api/upload/sessions/<upload_id>/complete=4,'
+    'POST /api/checkins=5,'
+    'POST /api/checkins/batch=0'
+)
+
+
+def _parse_budgets(spec):
+    budgets = {}
+    for item in spec.split(','):
+        key, _, value = item.rpartition('=')
+        if not key.strip() or not value.strip().isdigit():
+            continue
+        method, _, rule = key.strip().rpartition(' ')
+        budgets[(method.strip().upper() or None, rule)] = int(value)
+    return budgets
+
+
+class CallLog:
+    """一个请求内的上游调用：{类型: [次数, 秒数]}"""
+
+    __slots__ = ('kinds',)
+
+    def __init__(self):
+        self.kinds = {}
+
+    def record(self, kind, seconds):
+        entry = self.kinds.get(kind)
+        if entry is None:
+            self.kinds[kind] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    @property
+    def calls(self):
+        return sum(count for count, _ in self.kinds.values())
+
+    def server_timing(self):
+        return ', '.join(f'{kind};dur={seconds * 1000:.1f};desc="{count} calls"'
+                         for kind, (count, seconds) in self.kinds.items())
+
+
+_current = contextvars.ContextVar('upstream_call_log', default=None)
+
+
+def current():
+    """当前请求的 CallLog，不在请求中时为 None"""
+    return _current.get()
+
+
+def record(kind, seconds):
+    """记录一次上游调用；不在请求中时忽略"""
+    log = _current.get()
+    if log is not None:
+        log.record(kind, seconds)
+
+
+class UpstreamCallTracker:
+    """请求级调用统计的开始/结束，以及超出预算的路由汇总"""
+
+    def __init__(self, budget=UPSTREAM_CALL_BUDGET, budgets=UPSTREAM_CALL_BUDGETS, headers=UPSTREAM_TIMING_HEADERS):
+        self.budget = budget
+        self.budgets = _parse_budgets(DEFAULT_CALL_BUDGETS)
+        self.budgets.update(_parse_budgets(budgets))
+        self.headers = headers
+        self._lock = threading.Lock()
+        self._routes = {}   # "方法 路由" -> {'requests', 'calls', 'max_calls', 'over_budget'}
+
+    def begin(self):
+        """开始统计当前请求，返回用于 end() 的 token"""
+        return _current.set(CallLog())
+
+    def end(self, token):
+        log = _current.get()
+        _current.reset(token)
+        return log
+
+    def budget_for(self, method, rule):
+        return self.budgets.get((method, rule), self.budgets.get((None, rule), self.budget))
+
+    def check(self, method, rule, log):
+        """汇总一个请求的调用次数，超过预算时打印警告"""
+        calls = log.calls
+        budget = self.budget_for(method, rule)
+        over = bool(budget) and calls > budget
+        key = f'{method} {rule}'
+        with self._lock:
+            stats = self._routes.get(key)
+            if stats is None:
+                stats = self._routes[key] = {'requests': 0, 'calls': 0, 'max_calls': 0, 'over_budget': 0}
+            stats['requests'] += 1
+            stats['calls'] += calls
+            stats['max_calls'] = max(stats['max_calls'], calls)
+            stats['over_budget'] += over
+        if over:
+            detail = ', '.join(f'{kind} x{count}' for kind, (count, _) in log.kinds.items())
+            print(f"⚠️ {key} 发起了 {calls} 次上游调用（预算 {budget}）: {detail}")
+
+    def response_headers(self, log):
+        """返回要附加的 [(名称, 值)]"""
+        if not self.headers:
+            return []
+        headers = [('X-Upstream-Calls', str(log.calls))]
+        if log.kinds:
+            headers.append(('Server-Timing', log.server_timing()))
+        return headers
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        from flask import request
+        request.environ['upstream_calls.token'] = self.begin()
+
+    def _after_request(self, response):
+        from flask import request
+        log = _current.get()
+        if log is None or 'upstream_calls.token' not in request.environ:
+            return response
+        if request.url_rule is not None:
+            self.check(request.method, request.url_rule.rule, log)
+        for name, value in self.response_headers(log):
+            response.headers[name] = value
+        return response
+
+    def _teardown_request(self, exc):
+        from flask import request
+        token = request.environ.pop('upstream_calls.token', None)
+        if token is not None:
+            self.end(token)
+
+    def stats(self):
+        with self._lock:
+            routes = {key: dict(s) for key, s in self._routes.items()}
+        return {
+            'budget': self.budget,
+            'budgets': {f"{m + ' ' if m else ''}{r}": b for (m, r), b in self.budgets.items()},
+            'routes': routes,
+        }
+
+
+tracker = UpstreamCallTracker()
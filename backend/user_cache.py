@@ -0,0 +1,63 @@
+import os
+import threading
+
+from ttl_cache import TTLCache
+
+# 已知用户缓存配置
+KNOWN_USER_TTL = float(os.getenv('KNOWN_USER_TTL', '3600'))
+KNOWN_USER_CACHE_SIZE = int(os.getenv('KNOWN_USER_CACHE_SIZE', '50000'))
+
+# PostgreSQL 错误码：外键约束失败 / 唯一约束冲突
+FK_VIOLATION = '23503'
+UNIQUE_VIOLATION = '23505'
+
+
+def is_fk_violation(error):
+    return FK_VIOLATION in str(error or '')
+
+
+def is_unique_violation(error):
+    return UNIQUE_VIOLATION in str(error or '')
+
+
+class KnownUsers:
+    """进程内已知存在的用户 ID 集合（LRU + TTL），用于跳过 users 表查询
+
+    - lookups_saved：因乐观插入或缓存命中而省掉的 users 查询次数
+    - fk_fallbacks：乐观插入因外键失败、回退到创建占位用户的次数
+    """
+
+    def __init__(self, ttl=KNOWN_USER_TTL, maxsize=KNOWN_USER_CACHE_SIZE):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.lookups_saved = 0
+        self.fk_fallbacks = 0
+
+    def is_known(self, user_id):
+        return self._cache.get(str(user_id)) is not None
+
+    def add(self, user_id):
+        self._cache.set(str(user_id), True)
+
+    def discard(self, user_id):
+        self._cache.pop(str(user_id))
+
+    def record_saved(self, count=1):
+        with self._lock:
+            self.lookups_saved += count
+
+    def record_fk_fallback(self, user_id):
+        self.discard(user_id)
+        with self._lock:
+            self.fk_fallbacks += 1
+
+    def stats(self):
+        stats = self._cache.stats()
+        stats.update({
+            'lookups_saved': self.lookups_saved,
+            'fk_fallbacks': self.fk_fallbacks,
+        })
+        return stats
+
+
+known_users = KnownUsers()